@@ -0,0 +1,111 @@
+"""
+Conciliação fiscal (SPED x XMLs) sem interface, para rodar em servidor ou em lotes.
+
+Uso (na pasta att/):
+    python -m app.conciliacao_cli SPED.txt PASTA_XMLS REGRAS.xlsx --saida relatorios/ --cnpj 12345678000199
+
+Usa as mesmas regras fiscais (FISCAL_RULES) e opções de desempenho (PERFORMANCE) do config.json
+da interface. As regras do cliente vêm do cadastro de clientes (--cnpj) e/ou de --regras-cliente.
+Sai com código 0 se a análise terminou (imprime o relatório e o total de problemas) e 1 se falhou.
+Não importa Qt nem FreeSimpleGUI; em Python, use app.fiscal_logic.executar_conciliacao.
+"""
+import argparse
+import getpass
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+from app.config import ConfigLoader
+from app.empresa_logic import obter_regras_empresa
+from app.fiscal_logic import executar_conciliacao
+
+APP_NAME = "MeuAppFiscal"  # Mesma pasta de dados do main.py (cadastro de clientes e cache)
+PASTA_DADOS_PADRAO = Path(os.environ.get('APPDATA', Path.home())) / APP_NAME
+CONFIG_PADRAO = Path(__file__).resolve().parent.parent / 'config.json'
+SETORES = ['Comercio', 'Moveleiro', 'E-commerce']
+
+
+def carregar_config(config_path: Path = CONFIG_PADRAO, pasta_dados: Path = PASTA_DADOS_PADRAO) -> ConfigLoader:
+    """ConfigLoader com os caminhos da pasta de dados, como o main.py monta para a interface."""
+    return ConfigLoader(
+        config_path=Path(config_path),
+        db_usuarios_path=Path(pasta_dados) / 'database_usuarios.json',
+        icons_path=None,
+        base_path=Path(pasta_dados),
+        db_empresas_path=Path(pasta_dados) / 'database.db'
+    )
+
+
+def ler_regras_cliente(config: ConfigLoader, cnpj: Optional[str] = None, regras_json: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Regras do cadastro de clientes para o CNPJ (se informado), atualizadas pelas de regras_json
+    (texto JSON ou caminho de um arquivo .json).
+    """
+    regras: Dict[str, Any] = {}
+    if cnpj:
+        if not Path(config.db_empresas_path).exists():
+            raise Exception(f"Cadastro de clientes não encontrado em: {config.db_empresas_path}")
+        cadastradas = obter_regras_empresa(config.db_empresas_path, cnpj)
+        if cadastradas is None:
+            logging.warning(f"CNPJ {cnpj} sem cadastro de regras. Seguindo sem regras do cliente.")
+        else:
+            regras.update(cadastradas)
+    if regras_json:
+        try:
+            texto = Path(regras_json).read_text(encoding='utf-8') if regras_json.lower().endswith('.json') else regras_json
+            extras = json.loads(texto)
+        except (OSError, json.JSONDecodeError) as e:
+            raise Exception(f"Regras do cliente inválidas ({regras_json}): {e}")
+        if not isinstance(extras, dict):
+            raise Exception("As regras do cliente devem ser um objeto JSON (ex.: {\"exigir_acumulador\": true}).")
+        regras.update(extras)
+    return regras
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sped', type=Path, help='Arquivo SPED (.txt, .zip ou .gz)')
+    parser.add_argument('xmls', type=Path, help='Pasta dos XMLs (NF-e/CT-e, subpastas e .zip)')
+    parser.add_argument('regras', type=Path, help='Planilha/CSV de regras de acumuladores')
+    parser.add_argument('--saida', type=Path, help='Arquivo .xlsx ou pasta do relatório (padrão: pasta do SPED)')
+    parser.add_argument('--regras-detalhadas', type=Path, help='Planilha de regras por NCM (análise detalhada)')
+    parser.add_argument('--template-apuracao', type=Path, help='Template de apuração a preencher')
+    parser.add_argument('--setor', choices=SETORES, default='Comercio', help='Modelo do template de apuração')
+    parser.add_argument('--cnpj', help='Aplica as regras do cadastro de clientes deste CNPJ')
+    parser.add_argument('--regras-cliente', help='Regras do cliente em JSON (texto ou arquivo .json), somadas às do cadastro')
+    parser.add_argument('--config', type=Path, default=CONFIG_PADRAO, help='config.json (padrão: o da aplicação)')
+    parser.add_argument('--pasta-dados', type=Path, default=PASTA_DADOS_PADRAO,
+                        help='Pasta de dados da aplicação (cadastro de clientes e cache)')
+    parser.add_argument('--reprocessar', action='store_true', help='Ignora o que está no cache do SPED e dos XMLs')
+    parser.add_argument('--usuario', default=getpass.getuser(), help='Nome registrado no log')
+    parser.add_argument('--nivel-log', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.nivel_log, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        config = carregar_config(args.config, args.pasta_dados)
+        regras_cliente = ler_regras_cliente(config, args.cnpj, args.regras_cliente)
+        opcoes_desempenho = dict(config.desempenho)
+        opcoes_desempenho['ATUALIZAR_CACHE'] = args.reprocessar
+
+        resultado = executar_conciliacao(
+            args.sped, args.xmls, args.regras,
+            config.cfop_sem_credito_icms, config.cfop_sem_credito_ipi, config.tolerancia_valor,
+            caminho_regras_detalhadas=args.regras_detalhadas, template_apuracao_path=args.template_apuracao,
+            tipo_setor=args.setor, regras_cliente=regras_cliente, opcoes_desempenho=opcoes_desempenho,
+            caminho_saida=args.saida, username=args.usuario
+        )
+    except Exception as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Relatório: {resultado.caminho_relatorio}")
+    print(f"Notas com problema: {resultado.total_problemas}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""
+Conciliação fiscal em lote: várias empresas, uma pasta por CNPJ, em processos paralelos.
+
+Uso (na pasta att/):
+    python -m app.conciliacao_lote PASTA_LOTE --regras REGRAS.xlsx --saida relatorios/ --processos 4
+
+Estrutura de PASTA_LOTE (uma subpasta por empresa, com o CNPJ no nome; pontuação é ignorada):
+    PASTA_LOTE/
+        12345678000199/
+            EFD_012026.txt     o arquivo SPED (.txt, .zip ou .gz), único na raiz da pasta
+            XML/               os XMLs (subpastas e .zip aceitos); sem pasta XML/XMLs, a única subpasta
+            regras.csv         opcional: regras de acumuladores da empresa (senão, as de --regras)
+
+As regras do cliente de cada empresa vêm do cadastro de clientes (empresa_logic.obter_regras_empresa).
+Cada empresa gera seu relatório e o log da análise em SAIDA/<CNPJ>/. As empresas usam a mesma pasta de
+cache (PERFORMANCE.PASTA_CACHE), como a interface: as entradas do SPED são gravadas em pasta temporária
+e renomeadas, os XMLs e a quarentena ficam em SQLite, e uma entrada removida por outra empresa (limite
+de tamanho) só faz o arquivo ser lido de novo. No fim, SAIDA/Resumo_Lote_<data>.xlsx
+traz uma linha por empresa (situação, notas, problemas, tempo, relatório ou erro) e a contagem de
+notas por STATUS_GERAL. A falha de uma empresa não interrompe as demais. Sai com código 1 se alguma falhou.
+"""
+import argparse
+import getpass
+import logging
+import multiprocessing
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+import pandas as pd
+
+from app.conciliacao_cli import CONFIG_PADRAO, PASTA_DADOS_PADRAO, SETORES, carregar_config
+from app.empresa_logic import listar_todas_empresas, obter_regras_empresa
+from app.fiscal_logic import executar_conciliacao
+
+EXTENSOES_SPED = ('.txt', '.zip', '.gz')
+EXTENSOES_REGRAS = ('.xlsx', '.xls', '.csv')
+NOMES_PASTA_XML = ('xml', 'xmls')
+
+SITUACAO_CONCLUIDA = 'CONCLUIDA'
+SITUACAO_FALHOU = 'FALHOU'
+SITUACAO_IGNORADA = 'IGNORADA'  # Pasta fora da estrutura esperada (sem SPED, sem XMLs, sem regras...)
+
+COLUNAS_RESUMO = ['CNPJ', 'RAZAO_SOCIAL', 'SITUACAO', 'REGRAS_CLIENTE', 'NOTAS', 'NOTAS_COM_PROBLEMA',
+                  'ITENS', 'DURACAO_S', 'RELATORIO', 'ERRO', 'PASTA']
+
+
+class EmpresaLote(NamedTuple):
+    """Uma empresa do lote e os arquivos encontrados na pasta dela."""
+    cnpj: str
+    pasta: Path
+    caminho_sped: Optional[Path] = None
+    pasta_xmls: Optional[Path] = None
+    caminho_regras: Optional[Path] = None
+    erro: str = ''  # Motivo de a pasta ser ignorada
+
+
+def _so_digitos(texto: str) -> str:
+    return re.sub(r'\D', '', texto)
+
+
+def _localizar_empresa(pasta: Path, regras_padrao: Optional[Path]) -> EmpresaLote:
+    cnpj = _so_digitos(pasta.name)
+    arquivos = [a for a in pasta.iterdir() if a.is_file()]
+    subpastas = [p for p in pasta.iterdir() if p.is_dir()]
+
+    speds = [a for a in arquivos if a.suffix.lower() in EXTENSOES_SPED]
+    if len(speds) != 1:
+        motivo = 'nenhum arquivo SPED' if not speds else f'{len(speds)} arquivos SPED ({", ".join(a.name for a in speds)})'
+        return EmpresaLote(cnpj, pasta, erro=f'Esperado um arquivo SPED (.txt, .zip ou .gz) na pasta: {motivo}.')
+
+    pastas_xml = [p for p in subpastas if p.name.lower() in NOMES_PASTA_XML] or (subpastas if len(subpastas) == 1 else [])
+    if len(pastas_xml) != 1:
+        return EmpresaLote(cnpj, pasta, speds[0], erro='Pasta dos XMLs não encontrada (use uma subpasta XML).')
+
+    regras = [a for a in arquivos if a.suffix.lower() in EXTENSOES_REGRAS and a.stem.lower().startswith('regras')]
+    caminho_regras = regras[0] if regras else regras_padrao
+    if caminho_regras is None:
+        return EmpresaLote(cnpj, pasta, speds[0], pastas_xml[0],
+                           erro='Sem regras de acumuladores (regras.xlsx/.csv na pasta ou --regras).')
+    return EmpresaLote(cnpj, pasta, speds[0], pastas_xml[0], caminho_regras)
+
+
+def localizar_empresas(pasta_lote: Path, regras_padrao: Optional[Path] = None,
+                       cnpjs: Optional[Sequence[str]] = None) -> List[EmpresaLote]:
+    """
+    Empresas do lote: subpastas de pasta_lote com um CNPJ (14 dígitos) ou CPF (11) no nome,
+    em ordem de CNPJ. cnpjs: só essas empresas (pontuação ignorada).
+    """
+    pasta_lote = Path(pasta_lote)
+    if not pasta_lote.is_dir():
+        raise Exception(f"Pasta do lote não encontrada: {pasta_lote}")
+    filtro = {_so_digitos(c) for c in cnpjs} if cnpjs else None
+    empresas = []
+    for pasta in sorted(p for p in pasta_lote.iterdir() if p.is_dir()):
+        cnpj = _so_digitos(pasta.name)
+        if len(cnpj) not in (11, 14):
+            logging.info(f"Pasta '{pasta.name}' ignorada: o nome não é um CNPJ/CPF.")
+            continue
+        if filtro is None or cnpj in filtro:
+            empresas.append(_localizar_empresa(pasta, regras_padrao))
+    return sorted(empresas, key=lambda e: e.cnpj)
+
+
+def _conciliar_empresa(tarefa: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Roda em um processo do lote: conciliação de uma empresa, com o log em SAIDA/<CNPJ>/.
+    Devolve só a linha do resumo (os DataFrames ficam no relatório, não voltam ao processo principal).
+    """
+    empresa: EmpresaLote = tarefa['empresa']
+    pasta_saida = Path(tarefa['pasta_saida'])
+    pasta_saida.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(filename=str(pasta_saida / 'conciliacao.log'), encoding='utf-8', level=tarefa['nivel_log'],
+                        format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+    linha: Dict[str, Any] = {'SITUACAO': SITUACAO_CONCLUIDA}
+    inicio = time.perf_counter()
+    try:
+        resultado = executar_conciliacao(
+            empresa.caminho_sped, empresa.pasta_xmls, empresa.caminho_regras,
+            tarefa['cfop_sem_credito_icms'], tarefa['cfop_sem_credito_ipi'], tarefa['tolerancia_valor'],
+            tipo_setor=tarefa['tipo_setor'], regras_cliente=tarefa['regras_cliente'],
+            opcoes_desempenho=tarefa['opcoes_desempenho'], caminho_saida=pasta_saida, username=tarefa['username']
+        )
+        status = resultado.conciliacao.get('STATUS_GERAL')
+        linha.update({
+            'NOTAS': len(resultado.conciliacao),
+            'NOTAS_COM_PROBLEMA': resultado.total_problemas,
+            'ITENS': len(resultado.itens),
+            'RELATORIO': str(resultado.caminho_relatorio),
+            'STATUS_GERAL': {} if status is None else
+            {str(valor): int(qtd) for valor, qtd in status.value_counts().items() if qtd},
+        })
+    except Exception as e:
+        linha.update({'SITUACAO': SITUACAO_FALHOU, 'ERRO': str(e)})
+    linha['DURACAO_S'] = round(time.perf_counter() - inicio, 1)
+    logging.shutdown()
+    return linha
+
+
+def executar_lote(
+    pasta_lote: Path, pasta_saida: Path, config: Any, regras_padrao: Optional[Path] = None,
+    processos: int = 2, processos_por_empresa: int = 1, tipo_setor: str = 'Comercio',
+    cnpjs: Optional[Sequence[str]] = None, username: str = '', nivel_log: str = 'INFO'
+) -> pd.DataFrame:
+    """
+    Concilia as empresas de pasta_lote (ver localizar_empresas) em até 'processos' empresas ao mesmo
+    tempo e grava o resumo em pasta_saida. config: ConfigLoader (regras fiscais, desempenho e cadastro
+    de clientes). processos_por_empresa: SPED_WORKERS/XML_WORKERS de cada análise; o padrão 1 evita
+    disputar a CPU com as outras empresas do lote. O cache (PASTA_CACHE) é compartilhado pelas empresas
+    e os limites de tamanho valem para o lote todo. Devolve o DataFrame do resumo.
+    """
+    pasta_saida = Path(pasta_saida)
+    pasta_saida.mkdir(parents=True, exist_ok=True)
+    empresas = localizar_empresas(pasta_lote, regras_padrao, cnpjs)
+    if not empresas:
+        raise Exception(f"Nenhuma pasta de empresa (CNPJ) encontrada em: {pasta_lote}")
+
+    db_empresas = Path(config.db_empresas_path)
+    cadastro = db_empresas.exists()
+    if not cadastro:
+        logging.warning(f"Cadastro de clientes não encontrado em {db_empresas}. Empresas sem regras do cliente.")
+    razoes = dict(listar_todas_empresas(db_empresas)) if cadastro else {}
+
+    opcoes_desempenho = dict(config.desempenho)
+    opcoes_desempenho['SPED_WORKERS'] = opcoes_desempenho['XML_WORKERS'] = processos_por_empresa
+
+    linhas: Dict[str, Dict[str, Any]] = {}
+    tarefas = []
+    for empresa in empresas:
+        regras_cliente = obter_regras_empresa(db_empresas, empresa.cnpj) if cadastro else None
+        linha = {'CNPJ': empresa.cnpj, 'RAZAO_SOCIAL': razoes.get(empresa.cnpj, ''), 'PASTA': str(empresa.pasta),
+                 'REGRAS_CLIENTE': 'CADASTRO' if regras_cliente is not None else 'SEM CADASTRO'}
+        linhas[empresa.cnpj] = linha
+        if empresa.erro:
+            linha.update({'SITUACAO': SITUACAO_IGNORADA, 'ERRO': empresa.erro})
+            logging.warning(f"{empresa.cnpj}: {empresa.erro}")
+            continue
+        tarefas.append({
+            'empresa': empresa, 'pasta_saida': str(pasta_saida / empresa.cnpj), 'tipo_setor': tipo_setor,
+            'regras_cliente': regras_cliente or {}, 'opcoes_desempenho': opcoes_desempenho,
+            'cfop_sem_credito_icms': config.cfop_sem_credito_icms, 'cfop_sem_credito_ipi': config.cfop_sem_credito_ipi,
+            'tolerancia_valor': config.tolerancia_valor, 'username': username, 'nivel_log': nivel_log,
+        })
+
+    logging.info(f"Lote: {len(tarefas)} empresas a conciliar ({len(empresas) - len(tarefas)} ignoradas), "
+                 f"{processos} por vez.")
+    with ProcessPoolExecutor(max_workers=max(1, processos)) as executor:
+        futuros = {executor.submit(_conciliar_empresa, tarefa): tarefa['empresa'].cnpj for tarefa in tarefas}
+        for feitas, futuro in enumerate(as_completed(futuros), start=1):
+            cnpj = futuros[futuro]
+            try:
+                linhas[cnpj].update(futuro.result())
+            except Exception as e:  # Processo encerrado no meio da análise (ex.: falta de memória)
+                linhas[cnpj].update({'SITUACAO': SITUACAO_FALHOU, 'ERRO': f"Processo da análise interrompido: {e}"})
+            linha = linhas[cnpj]
+            detalhe = f"{linha.get('NOTAS_COM_PROBLEMA')} notas com problema" \
+                if linha['SITUACAO'] == SITUACAO_CONCLUIDA else linha.get('ERRO')
+            logging.info(f"[{feitas}/{len(tarefas)}] {cnpj}: {linha['SITUACAO']} em {linha.get('DURACAO_S', '-')}s ({detalhe})")
+
+    caminho_resumo = pasta_saida / f'Resumo_Lote_{time.strftime("%Y%m%d_%H%M%S")}.xlsx'
+    df_resumo = gerar_resumo_lote(list(linhas.values()), caminho_resumo)
+    logging.info(f"Resumo do lote gravado em: {caminho_resumo}")
+    return df_resumo
+
+
+def gerar_resumo_lote(linhas: List[Dict[str, Any]], caminho: Path) -> pd.DataFrame:
+    """
+    Planilha do lote: aba 'Resumo' (uma linha por empresa) e aba 'Status por Empresa'
+    (notas por STATUS_GERAL, uma coluna por status). Devolve o DataFrame do resumo.
+    """
+    df_resumo = pd.DataFrame(linhas).reindex(columns=COLUNAS_RESUMO)
+    for coluna in ('NOTAS', 'NOTAS_COM_PROBLEMA', 'ITENS'):
+        df_resumo[coluna] = df_resumo[coluna].astype('Int64')
+    df_status = pd.DataFrame(
+        [{'CNPJ': linha['CNPJ'], **linha['STATUS_GERAL']} for linha in linhas if linha.get('STATUS_GERAL')]
+    )
+    if not df_status.empty:
+        df_status = df_status.fillna(0).set_index('CNPJ').astype(int).sort_index(axis=1).reset_index()
+
+    with pd.ExcelWriter(str(caminho), engine='openpyxl') as writer:
+        df_resumo.to_excel(writer, sheet_name='Resumo', index=False)
+        if not df_status.empty:
+            df_status.to_excel(writer, sheet_name='Status por Empresa', index=False)
+        for aba in writer.sheets.values():
+            aba.freeze_panes = 'B2'
+            for coluna in aba.columns:
+                largura = max(len(str(celula.value or '')) for celula in coluna)
+                aba.column_dimensions[coluna[0].column_letter].width = min(largura + 2, 80)
+    return df_resumo
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pasta_lote', type=Path, help='Pasta com uma subpasta por empresa (CNPJ)')
+    parser.add_argument('--saida', type=Path, required=True, help='Pasta dos relatórios e do resumo do lote')
+    parser.add_argument('--regras', type=Path, help='Regras de acumuladores das empresas sem regras.xlsx/.csv própria')
+    parser.add_argument('--processos', type=int, default=max(1, (multiprocessing.cpu_count() or 2) // 2),
+                        help='Empresas conciliadas ao mesmo tempo (padrão: metade das CPUs)')
+    parser.add_argument('--processos-por-empresa', type=int, default=1,
+                        help='Processos de leitura do SPED/XMLs em cada empresa (0 = automático)')
+    parser.add_argument('--cnpj', action='append', help='Concilia só este CNPJ (pode repetir)')
+    parser.add_argument('--setor', choices=SETORES, default='Comercio')
+    parser.add_argument('--config', type=Path, default=CONFIG_PADRAO, help='config.json (padrão: o da aplicação)')
+    parser.add_argument('--pasta-dados', type=Path, default=PASTA_DADOS_PADRAO,
+                        help='Pasta de dados da aplicação (cadastro de clientes e cache)')
+    parser.add_argument('--usuario', default=getpass.getuser(), help='Nome registrado no log')
+    parser.add_argument('--nivel-log', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.nivel_log, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        config = carregar_config(args.config, args.pasta_dados)
+        df_resumo = executar_lote(
+            args.pasta_lote, args.saida, config, regras_padrao=args.regras, processos=args.processos,
+            processos_por_empresa=args.processos_por_empresa, tipo_setor=args.setor, cnpjs=args.cnpj,
+            username=args.usuario, nivel_log=args.nivel_log
+        )
+    except Exception as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+
+    print(df_resumo['SITUACAO'].value_counts().to_string())
+    return 1 if (df_resumo['SITUACAO'] == SITUACAO_FALHOU).any() else 0
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
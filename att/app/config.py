@@ -96,4 +96,12 @@ class ConfigLoader:
     @property
     def log_level(self) -> str:
         """Retorna o nível de log (ex: "INFO", "DEBUG"). Padrão é "INFO"."""
-        return self._config_data.get("LOGGING", {}).get("LOG_LEVEL", "INFO")
\ No newline at end of file
+        return self._config_data.get("LOGGING", {}).get("LOG_LEVEL", "INFO")
+
+    @property
+    def desempenho(self) -> Dict[str, Any]:
+        """Opções de desempenho da análise (ex: "SPED_WORKERS"). Vazio usa os padrões."""
+        opcoes = dict(self._config_data.get("PERFORMANCE", {}))
+        # Cache fica na pasta de dados do usuário (APPDATA), que é gravável
+        opcoes.setdefault("PASTA_CACHE", str(self.base_path / "cache_sped"))
+        return opcoes
\ No newline at end of file
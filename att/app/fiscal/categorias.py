@@ -0,0 +1,76 @@
+from typing import Any, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Colunas de texto com poucos valores distintos (status, situação, CFOP, CST, tipo de nota,
+# acumulador...) guardadas como 'category' desde a saída dos parsers: cada linha vira um código
+# inteiro e o texto fica uma vez por valor distinto. Com milhões de itens é a maior parte da
+# memória dos DataFrames, e merges/groupbys comparam códigos em vez de strings.
+# Cuidados com 'category': valor novo (fillna, atribuição) precisa estar nas categorias
+# (preencher_nulos) e groupby/pivot_table usam observed=True (só combinações existentes).
+
+COLUNAS_CATEGORICAS = frozenset({
+    'ACUMULADOR', 'TIPO_NOTA', 'TIPO_NOTA_SPED', 'TIPO_DESTINATARIO', 'MODELO_XML', 'UNID',
+    'CFOP', 'CFOP_XML', 'CFOP_SPED', 'CFOP_SPED_ITEM', 'CFOP_SPED_D190',
+    'CST_XML', 'CST_ICMS_XML', 'CST_ICMS_SPED_ITEM', 'CST_ICMS_SPED_D190', 'CST_PIS', 'CST_COFINS',
+    'UF_DESTINATARIO', 'UF_EMITENTE_CTE',
+})
+PREFIXOS_CATEGORICOS = ('STATUS_', 'SITUACAO_')
+
+
+def coluna_categorica(nome: str) -> bool:
+    """Colunas guardadas como 'category' (lista acima e todas as STATUS_*/SITUACAO_*)."""
+    return nome in COLUNAS_CATEGORICAS or nome.startswith(PREFIXOS_CATEGORICOS)
+
+
+def para_categorias(df: pd.DataFrame, colunas: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Converte (no próprio DataFrame) as colunas de texto para 'category'. As categorias ficam
+    em ordem alfabética: groupby/sort_values dão a mesma ordem que davam com texto.
+    """
+    for col in _colunas_presentes(df, colunas):
+        df[col] = df[col].astype('category')
+    return df
+
+
+def preencher_nulos(df: pd.DataFrame, colunas: Iterable[str], valor: Any) -> pd.DataFrame:
+    """fillna(valor) nas colunas (no próprio DataFrame), incluindo o valor nas categorias quando preciso."""
+    for col in colunas:
+        if col not in df.columns:
+            continue
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            if not serie.hasnans:
+                continue
+            if valor not in serie.cat.categories:
+                categorias = serie.cat.categories.append(pd.Index([valor], dtype=object))
+                try:
+                    categorias = categorias.sort_values()
+                except TypeError:
+                    pass  # Ex.: 0.0 entre textos; a ordem só importa para ordenar pela coluna
+                serie = serie.cat.set_categories(categorias)
+        df[col] = serie.fillna(valor)
+    return df
+
+
+def texto_sem_espacos(valores: pd.Series) -> pd.Series:
+    """
+    astype(str).str.strip(). Em 'category' o texto é tratado uma vez por categoria e o
+    resultado continua 'category' (NaN vira 'nan', como em astype(str)).
+    """
+    if not isinstance(valores.dtype, pd.CategoricalDtype):
+        return valores.astype(str).str.strip()
+    tabela = np.append(valores.cat.categories.astype(str).str.strip().to_numpy(dtype=object), 'nan')
+    distintos, novos_codigos = np.unique(tabela, return_inverse=True)
+    # Código -1 (NaN) pega a última posição da tabela, o 'nan'
+    codigos = novos_codigos[valores.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codigos, categories=distintos), index=valores.index, name=valores.name)
+
+
+def _colunas_presentes(df: pd.DataFrame, colunas: Optional[Iterable[str]]) -> List[str]:
+    if df is None or df.empty:
+        return []
+    candidatas = [c for c in df.columns if coluna_categorica(c)] if colunas is None else \
+        [c for c in colunas if c in df.columns]
+    return [c for c in candidatas if df[c].dtype == object]
@@ -0,0 +1,58 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Modo de valores em centavos (opcional, PERFORMANCE.VALORES_EM_CENTAVOS):
+# os campos monetários saem dos parsers como int64 em centavos, para que somas e
+# comparações da conciliação sejam exatas. Alíquotas, quantidades e valores unitários
+# continuam float. Antes dos relatórios os valores voltam para reais (centavos_para_reais).
+
+PREFIXOS_MONETARIOS = ('VL_', 'VLR_', 'ICMS', 'IPI', 'PIS', 'COFINS', 'FCP', 'BC_', 'DESPESA')
+TRECHOS_NAO_MONETARIOS = ('ALIQ', 'VLR_UNIT')
+
+
+def coluna_monetaria(nome: str) -> bool:
+    """Regra de nome usada pelos parsers (VL_DOC_SPED, ICMS_XML, VLR_PROD...); alíquotas ficam de fora."""
+    return nome.startswith(PREFIXOS_MONETARIOS) and not any(t in nome for t in TRECHOS_NAO_MONETARIOS)
+
+
+def centavos_sped(texto: str) -> int:
+    """
+    Converte um decimal SPED/XML ('1234,56', '1234.5', '-0,50') direto para centavos.
+    O caso comum (duas casas) é só concatenar os dígitos; os demais arredondam meio para cima.
+    Vazio ou inválido vira 0.
+    """
+    inteiro, separador, fracao = texto.replace('.', ',').rpartition(',')
+    if separador and len(fracao) == 2:
+        try:
+            return int(inteiro + fracao)
+        except ValueError:
+            pass
+    try:
+        return int(Decimal(texto.replace(',', '.')).scaleb(2).quantize(Decimal(1), ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):
+        return 0
+
+
+def reais_para_centavos(df: pd.DataFrame, colunas: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """Converte (no próprio DataFrame) colunas em reais para int64 em centavos."""
+    for col in _colunas_presentes(df, colunas):
+        df[col] = np.rint(pd.to_numeric(df[col], errors='coerce').fillna(0) * 100).astype('int64')
+    return df
+
+
+def centavos_para_reais(df: pd.DataFrame, colunas: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """Converte (no próprio DataFrame) colunas em centavos de volta para reais (float, 2 casas)."""
+    for col in _colunas_presentes(df, colunas):
+        df[col] = (pd.to_numeric(df[col], errors='coerce') / 100).round(2)
+    return df
+
+
+def _colunas_presentes(df: pd.DataFrame, colunas: Optional[Iterable[str]]) -> List[str]:
+    if df is None or df.empty:
+        return []
+    if colunas is None:
+        return [c for c in df.columns if coluna_monetaria(c) and pd.api.types.is_numeric_dtype(df[c])]
+    return [c for c in colunas if c in df.columns]
@@ -2,10 +2,12 @@ import logging
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from typing import Dict, Tuple, Optional, Any
+from typing import Dict, Iterable, List, Tuple, Optional, Any
 
 # Importa as constantes da pasta local
 from .constants import MAPA_CST_UNIFICADO
+from .categorias import texto_sem_espacos
+from .centavos import centavos_para_reais
 
 def get_acumulador(row: pd.Series, regras_map: Dict[Tuple[str, str], str]) -> str:
     
@@ -79,7 +81,7 @@ def check_cfop_status(row: pd.Series) -> str:
 
 def calcular_status_geral(row: pd.Series) -> str:
     
-    if row['SITUACAO_NOTA'] in ['FALTA XML', 'FALTA NO SPED']: return row['SITUACAO_NOTA']
+    if row['SITUACAO_NOTA'] in ['FALTA XML', 'FALTA NO SPED', 'CANCELADA']: return row['SITUACAO_NOTA']
     status_cols = [col for col in row.index if col.startswith('STATUS_')]
     all_status_values = row[status_cols].values
     if 'DIVERGENTE' in all_status_values: return 'DIVERGENTE'
@@ -87,6 +89,211 @@ def calcular_status_geral(row: pd.Series) -> str:
     return 'OK'
 
 
+def check_item_cfop(row: pd.Series) -> str:
+    
+    xml_cfop = str(row.get('CFOP', ''))
+    sped_item_cfop = str(row.get('CFOP_SPED_ITEM', ''))
+    if sped_item_cfop == 'N/A no SPED' or not sped_item_cfop: return 'REVISAR (Sem SPED)'
+    if not xml_cfop: return 'REVISAR (Sem XML)'
+    if xml_cfop == sped_item_cfop: return 'OK'
+    expected_sped_cfop = xml_cfop
+    if xml_cfop.startswith('5'): expected_sped_cfop = '1' + xml_cfop[1:]
+    elif xml_cfop.startswith('6'): expected_sped_cfop = '2' + xml_cfop[1:]
+    elif xml_cfop.startswith('7'): expected_sped_cfop = '3' + xml_cfop[1:]
+    return 'OK' if sped_item_cfop == expected_sped_cfop else 'DIVERGENTE'
+
+
+# --- VERSÕES VETORIZADAS ---
+# Mesmo resultado das funções linha a linha acima (usadas com DataFrame.apply(axis=1)), mas
+# calculado sobre as colunas inteiras. O resultado depende só dos valores de poucas colunas
+# (CNPJ e CFOPs), que se repetem muito entre as notas: as regras são aplicadas uma vez por
+# combinação distinta e o resultado é distribuído para as linhas. As listas de CFOP
+# ('5102/6102') viram uma tabela (combinação, CFOP) sem repetições; dois conjuntos são iguais
+# quando têm o mesmo tamanho e a interseção (um merge) tem esse tamanho.
+
+MAPA_CFOP_SAIDA_ENTRADA = {'5': '1', '6': '2', '7': '3'}
+STATUS_REVISAR = ['REVISAR', 'REVISAR (Múltiplos)']
+SITUACOES_SEM_CONFERENCIA = ['FALTA XML', 'FALTA NO SPED', 'CANCELADA']
+
+
+def _combinacoes(df: pd.DataFrame, colunas: List[str]) -> Tuple[np.ndarray, pd.DataFrame]:
+    """(código da combinação de cada linha, combinações distintas dos valores). Coluna ausente vale ''."""
+    valores = pd.DataFrame({col: df[col].to_numpy() if col in df.columns else '' for col in colunas},
+                           index=range(len(df)))
+    chaves = list(colunas)
+    for col in colunas:
+        nulos = valores[col].isna().to_numpy()
+        if nulos.any():
+            # None e NaN caem no mesmo grupo, mas str() os diferencia ('None' x 'nan')
+            marca = np.full(len(valores), '', dtype=object)
+            marca[nulos] = [str(valor) for valor in valores[col].to_numpy()[nulos]]
+            valores[f'{col}#NULO'] = marca
+            chaves.append(f'{col}#NULO')
+    grupos = valores.groupby(chaves, sort=False, dropna=False)
+    # ngroup(sort=False) numera os grupos na ordem da primeira ocorrência, a mesma de head(1)
+    return grupos.ngroup().to_numpy(), grupos.head(1).reset_index(drop=True)
+
+
+def _texto(valores: pd.Series) -> pd.Series:
+    """str() de cada valor, como str(row.get(coluna, '')) nas funções linha a linha."""
+    return pd.Series(valores.astype(str).to_numpy(dtype=object), index=valores.index)
+
+
+def _preenchido(valores: pd.Series) -> np.ndarray:
+    """Valor presente e verdadeiro (pd.notna(x) and x)."""
+    return (valores.notna() & valores.fillna('').astype(bool)).to_numpy()
+
+
+def _cfop_equivalente_entrada(cfops: pd.Series) -> pd.Series:
+    """5xxx -> 1xxx, 6xxx -> 2xxx, 7xxx -> 3xxx (CFOP de saída do emitente visto na entrada)."""
+    primeiro = cfops.str[:1]
+    entrada = primeiro.map(MAPA_CFOP_SAIDA_ENTRADA)
+    return cfops.where(entrada.isna(), entrada + cfops.str[1:])
+
+
+def _explodir_cfops(cfops: pd.Series) -> pd.Series:
+    """Um CFOP por linha (índice = posição de origem), sem vazios."""
+    partes = cfops.str.split('/').explode()
+    return partes[partes.notna() & (partes != '')]
+
+
+def _pares_distintos(partes: pd.Series) -> pd.DataFrame:
+    """Tabela (LINHA, CFOP) sem repetições."""
+    return pd.DataFrame({'LINHA': partes.index.to_numpy(), 'CFOP': partes.to_numpy()}).drop_duplicates()
+
+
+def _conjuntos_iguais(pares_a: pd.DataFrame, pares_b: pd.DataFrame, total: int) -> np.ndarray:
+    """Por linha: os conjuntos de CFOPs de A e B são iguais (inclusive os dois vazios)."""
+    qtd_a = np.bincount(pares_a['LINHA'], minlength=total)
+    qtd_b = np.bincount(pares_b['LINHA'], minlength=total)
+    comuns = np.bincount(pares_a.merge(pares_b, on=['LINHA', 'CFOP'])['LINHA'], minlength=total)
+    return (qtd_a == qtd_b) & (comuns == qtd_a)
+
+
+def get_acumulador_vetorizado(df: pd.DataFrame, regras_map: Dict[Tuple[str, str], str]) -> pd.Series:
+    """get_acumulador para todas as linhas: CFOPs explodidos e cruzados com a tabela de regras."""
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=object)
+    codigos, distintos = _combinacoes(df, ['CNPJ_EMITENTE', 'CFOP_SPED', 'CFOP_XML'])
+    resultado = np.full(len(distintos), '', dtype=object)
+
+    # Poucos CNPJs distintos: a limpeza é a mesma da versão linha a linha
+    cnpj = pd.Series([''.join(filter(str.isdigit, str(valor))) if preenchido else ''
+                      for valor, preenchido in zip(distintos['CNPJ_EMITENTE'], _preenchido(distintos['CNPJ_EMITENTE']))],
+                     dtype=object)
+    cfops = _texto(distintos['CFOP_SPED']).where(_preenchido(distintos['CFOP_SPED']), _texto(distintos['CFOP_XML']))
+
+    partes = _explodir_cfops(cfops[cnpj != ''])
+    regras = pd.DataFrame(
+        [(c, f, a) for (c, f), a in regras_map.items() if isinstance(c, str) and isinstance(f, str) and a],
+        columns=['CNPJ', 'CFOP', 'ACUMULADOR'])
+    if partes.empty or regras.empty:
+        return pd.Series(resultado[codigos], index=df.index)
+
+    pares = pd.DataFrame({'LINHA': partes.index, 'CNPJ': cnpj[partes.index].to_numpy(), 'CFOP': partes.to_numpy()})
+    achados = pares.merge(regras, on=['CNPJ', 'CFOP'], how='inner')[['LINHA', 'ACUMULADOR']].drop_duplicates()
+    if achados.empty:
+        return pd.Series(resultado[codigos], index=df.index)
+
+    por_linha = achados.groupby('LINHA')['ACUMULADOR']
+    quantidade = por_linha.size()
+    tem_revisar = (achados['ACUMULADOR'] == 'REVISAR').groupby(achados['LINHA']).any()
+    primeiro = por_linha.first()
+    resultado[primeiro.index.to_numpy()] = np.where(
+        tem_revisar.to_numpy() | (quantidade.to_numpy() > 1), 'REVISAR', primeiro.to_numpy())
+
+    # Mesmo aviso da versão linha a linha, uma vez por nota com mais de um acumulador
+    multiplos = quantidade.index[(quantidade > 1).to_numpy() & ~tem_revisar.to_numpy()]
+    if len(multiplos):
+        acumuladores = achados[achados['LINHA'].isin(multiplos)].groupby('LINHA')['ACUMULADOR'].agg(set)
+        cfops_linha = partes[partes.index.isin(multiplos)].groupby(level=0).agg(set)
+        chaves = df['CHV_NFE'].to_numpy() if 'CHV_NFE' in df.columns else np.full(len(df), '', dtype=object)
+        for posicao in np.flatnonzero(np.isin(codigos, multiplos)):
+            linha = codigos[posicao]
+            logging.warning(f"Múltiplos acumuladores ({acumuladores[linha]}) para CNPJ {cnpj[linha]}, "
+                            f"CFOPs {cfops_linha[linha]} na nota {chaves[posicao]}. Marcado REVISAR.")
+    return pd.Series(resultado[codigos], index=df.index)
+
+
+def check_cfop_status_vetorizado(df: pd.DataFrame) -> pd.Series:
+    """check_cfop_status para todas as linhas (CFOP_XML x CFOP_SPED da nota)."""
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=object)
+    codigos, distintos = _combinacoes(df, ['CFOP_XML', 'CFOP_SPED'])
+    total = len(distintos)
+    xml_texto, sped_texto = _texto(distintos['CFOP_XML']), _texto(distintos['CFOP_SPED'])
+
+    partes_xml = _explodir_cfops(xml_texto)
+    xml = _pares_distintos(partes_xml)
+    sped = _pares_distintos(_explodir_cfops(sped_texto))
+    xml_entrada = _pares_distintos(_cfop_equivalente_entrada(partes_xml))
+    qtd_xml = np.bincount(xml['LINHA'], minlength=total)
+    qtd_sped = np.bincount(sped['LINHA'], minlength=total)
+
+    unico = (qtd_xml == 1) & (qtd_sped == 1)
+    iguais = _conjuntos_iguais(xml, sped, total) | _conjuntos_iguais(xml_entrada, sped, total)
+    status = np.select(
+        [((xml_texto == '') & (sped_texto != '')).to_numpy(),
+         (qtd_xml == 0) & (qtd_sped == 0),
+         (qtd_xml == 0) | (qtd_sped == 0),
+         unico & iguais,
+         unico,
+         iguais],
+        ['N/A', 'N/A', 'DIVERGENTE', 'OK', 'DIVERGENTE', 'OK (Múltiplos)'],
+        default='REVISAR (Múltiplos)')
+    return pd.Series(status.astype(object)[codigos], index=df.index)
+
+
+def calcular_status_geral_vetorizado(df: pd.DataFrame) -> pd.Series:
+    """calcular_status_geral para todas as linhas, reduzindo as colunas STATUS_ com numpy."""
+    situacao = df['SITUACAO_NOTA'].to_numpy(dtype=object)
+    status_cols = [col for col in df.columns if col.startswith('STATUS_')]
+    valores = df[status_cols].to_numpy(dtype=object) if status_cols else np.empty((len(df), 0), dtype=object)
+    divergente = (valores == 'DIVERGENTE').any(axis=1)
+    revisar = np.isin(valores, STATUS_REVISAR).any(axis=1) | (situacao == 'SEM CNPJ NO XML')
+    status = np.select(
+        [np.isin(situacao, SITUACOES_SEM_CONFERENCIA), divergente, revisar],
+        [situacao, 'DIVERGENTE', 'REVISAR'],
+        default='OK')
+    return pd.Series(status.astype(object), index=df.index)
+
+
+def check_item_cfop_vetorizado(df: pd.DataFrame) -> pd.Series:
+    """check_item_cfop para todos os itens (CFOP do XML x CFOP_SPED_ITEM do C170)."""
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=object)
+    codigos, distintos = _combinacoes(df, ['CFOP', 'CFOP_SPED_ITEM'])
+    xml, sped = _texto(distintos['CFOP']), _texto(distintos['CFOP_SPED_ITEM'])
+    status = np.select(
+        [((sped == 'N/A no SPED') | (sped == '')).to_numpy(),
+         (xml == '').to_numpy(),
+         ((xml == sped) | (_cfop_equivalente_entrada(xml) == sped)).to_numpy()],
+        ['REVISAR (Sem SPED)', 'REVISAR (Sem XML)', 'OK'],
+        default='DIVERGENTE')
+    return pd.Series(status.astype(object)[codigos], index=df.index)
+
+
+# --- ÍNDICE DE CFOPs POR NOTA ---
+# A lista de CFOPs da nota ('1556/1102') é separada uma única vez; cada conferência contra um
+# conjunto de CFOPs (ex.: CFOP_SEM_CREDITO_ICMS/IPI) vira um isin no índice e um 'any' por nota.
+
+def indexar_cfops(cfops: pd.Series) -> pd.Series:
+    """
+    Um CFOP por entrada, com a posição da nota (0..n-1) como índice. Só valores texto têm
+    CFOPs (mesma regra de isinstance(x, str) and x.split('/')).
+    """
+    valores = cfops.to_numpy(dtype=object)
+    eh_texto = np.fromiter((isinstance(valor, str) for valor in valores), dtype=bool, count=len(valores))
+    return pd.Series(valores[eh_texto], index=np.flatnonzero(eh_texto), dtype=object).str.split('/').explode()
+
+
+def notas_com_cfop(indice: pd.Series, cfops: Iterable[str], total: int) -> np.ndarray:
+    """Por nota (posição): algum CFOP da nota está em 'cfops'."""
+    marcadas = np.zeros(total, dtype=bool)
+    marcadas[indice.index[indice.isin(list(cfops)).to_numpy()]] = True
+    return marcadas
+
+
 def _executar_analise_detalhada_interna(df_itens_xml: pd.DataFrame, arquivo_excel_regras: Path) -> pd.DataFrame:
     
     logging.info(f"Iniciando cruzamento detalhado com: {arquivo_excel_regras.name}")
@@ -130,11 +337,12 @@ def _executar_analise_detalhada_interna(df_itens_xml: pd.DataFrame, arquivo_exce
         return df_itens_xml
 
 
-def _calcular_totalizadores_cfop_cst(df_analitico_combinado: pd.DataFrame) -> pd.DataFrame:
+def _calcular_totalizadores_cfop_cst(df_analitico_combinado: pd.DataFrame, centavos: bool = False) -> pd.DataFrame:
     """
     Calcula o totalizador CONSOLIDADO por CFOP (SPED), CST (SPED) e Alíquota (SPED),
     e traduz o CST para sua descrição legal.
     FONTE: SPED C190, D190, C590, D590 combinados.
+    centavos: valores de entrada em centavos (soma exata em inteiros); o resultado sai em reais.
     """
     
     if df_analitico_combinado is None or df_analitico_combinado.empty:
@@ -155,12 +363,12 @@ def _calcular_totalizadores_cfop_cst(df_analitico_combinado: pd.DataFrame) -> pd
     if 'ALIQ_ICMS_SPED_ITEM' not in df_calc.columns: df_calc['ALIQ_ICMS_SPED_ITEM'] = 0.0
     else: df_calc['ALIQ_ICMS_SPED_ITEM'] = pd.to_numeric(df_calc['ALIQ_ICMS_SPED_ITEM'], errors='coerce').fillna(0.0)
 
-    df_calc['CFOP_SPED_ITEM'] = df_calc['CFOP_SPED_ITEM'].astype(str).str.strip()
-    df_calc['CST_ICMS_SPED_ITEM'] = df_calc['CST_ICMS_SPED_ITEM'].astype(str).str.strip()
+    df_calc['CFOP_SPED_ITEM'] = texto_sem_espacos(df_calc['CFOP_SPED_ITEM'])
+    df_calc['CST_ICMS_SPED_ITEM'] = texto_sem_espacos(df_calc['CST_ICMS_SPED_ITEM'])
 
     group_cols = ['CFOP_SPED_ITEM', 'CST_ICMS_SPED_ITEM', 'ALIQ_ICMS_SPED_ITEM'] 
     
-    df_totalizadores = df_calc.groupby(group_cols).agg(
+    df_totalizadores = df_calc.groupby(group_cols, observed=True).agg(
         QTD_DOCUMENTOS=('CHV_NFE', pd.Series.nunique), 
         Total_Operacao=('VL_OPR_SPED_ITEM', 'sum'),
         Base_de_Calculo_ICMS=('VL_BC_ICMS_SPED_ITEM', 'sum'),
@@ -211,6 +419,8 @@ def _calcular_totalizadores_cfop_cst(df_analitico_combinado: pd.DataFrame) -> pd
     df_final = df_final[[col for col in colunas_ordenadas if col in df_final.columns]]
     
     cols_to_round = ['Total Operação', 'Base de Cálculo ICMS', 'Total ICMS', 'Base de Cálculo ICMS ST', 'Total ICMS ST', 'Total IPI']
+    if centavos:
+        centavos_para_reais(df_final, cols_to_round)
     for col in cols_to_round:
         if col in df_final.columns: df_final[col] = df_final[col].round(2)
     
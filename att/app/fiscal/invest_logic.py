@@ -2,7 +2,6 @@ import sys
 import os
 import logging
 import pandas as pd
-import xml.etree.ElementTree as ET
 from pathlib import Path
 import FreeSimpleGUI as sg
 from datetime import datetime
@@ -22,170 +21,45 @@ try:
 except Exception as e:
     logging.error(f"Erro ao configurar caminho: {e}")
 
+from app.fiscal.xml_parser import processar_pasta_xml_com_opcoes
+
 # -----------------------------
-# 1. PARSER XML PADRÃO (ATUALIZADO COM PIS/COFINS)
+# 1. LEITURA DOS XMLs (MESMO NÚCLEO DA CONCILIAÇÃO)
 # -----------------------------
-def ler_xmls_diretamente(pasta_xml: Path, window: sg.Window) -> pd.DataFrame:
-    dados = []
-    arquivos = list(pasta_xml.glob('*.xml'))
-    total_arquivos = len(arquivos)
-    
-    if total_arquivos == 0:
+# Colunas dos itens de xml_parser -> nomes usados pela apuração e pela planilha do Invest
+COLUNAS_INVEST = {
+    'NUM_NF': 'n da nf', 'CNPJ_DESTINATARIO': 'cnpj', 'UF_DESTINATARIO': 'uf', 'DATA_EMISSAO': 'data',
+    'CST_ICMS_XML': 'cst', 'QTD': 'qnt', 'VLR_UNIT': 'vl unit', 'VLR_PROD_XML': 'vl total',
+    'VLR_BC_ICMS_XML': 'icms bc', 'ALIQ_ICMS_XML': 'alq icms', 'VLR_ICMS': 'icms',
+    'VLR_ICMS_ST': 'icms st', 'VLR_FCP_ST': 'fcp st', 'ALIQ_ICMS_SN_XML': 'aql sn', 'VLR_ICMS_SN': 'icms sn',
+    'DESC_PROD': 'descrição', 'COD_PROD': 'COD. PROD.', 'VLR_IPI_DEVOL': 'ipi dev', 'VLR_DIFAL': 'difal',
+    'NCM': 'NCM', 'CFOP': 'CFOP', 'PROTOCOLO': 'protocolo',
+    'CST_PIS': 'cst_pis', 'VLR_PIS': 'vlr_pis', 'CST_COFINS': 'cst_cofins', 'VLR_COFINS': 'vlr_cofins',
+}
+ORDEM_COLUNAS_INVEST = [
+    'n da nf', 'cnpj', 'uf', 'data', 'cst', 'qnt', 'vl unit', 'vl total', 'vlr', 'icms bc', 'alq icms', 'icms', 'ipi',
+    'icms st', 'fcp st', 'aql sn', 'icms sn', 'descrição', 'COD. PROD.', 'ipi dev', 'difal', 'COD_PROD_INTERNO',
+    'NCM', 'CFOP', 'protocolo', 'cst_pis', 'vlr_pis', 'cst_cofins', 'vlr_cofins', 'pc', 'st'
+]
+
+
+def ler_xmls_diretamente(pasta_xml: Path, window: sg.Window, opcoes_desempenho: dict = None) -> pd.DataFrame:
+    """
+    Itens das NF-e da pasta, lidos por xml_parser (mesma leitura e mesmo cache da conciliação).
+    'vlr' é o valor contábil do item sem o IPI devolvido; 'ipi' também não inclui a devolução.
+    """
+    _, df_itens, _, _ = processar_pasta_xml_com_opcoes(pasta_xml, window, opcoes_desempenho,
+                                                       relatorio_erros=Path(pasta_xml) / "Erros_XML_Invest.csv")
+    if df_itens.empty:
         return pd.DataFrame()
 
-    ns = {'nfe': 'http://www.portalfiscal.inf.br/nfe'}
-
-    for i, arquivo in enumerate(arquivos):
-        if window:
-            try: window.write_event_value('-PROGRESS_UPDATE-', (i + 1, total_arquivos))
-            except: pass
-            
-        try:
-            tree = ET.parse(arquivo)
-            root = tree.getroot()
-            infNFe = root.find('.//nfe:infNFe', ns)
-            if infNFe is None: 
-                infNFe = root.find('.//infNFe')
-                if infNFe is None: continue
-
-            def get_text(node, tag):
-                if node is None: return ''
-                el = node.find(f'nfe:{tag}', ns)
-                if el is None: el = node.find(tag)
-                return el.text if el is not None else ''
-            
-            def get_float(node, tag):
-                val = get_text(node, tag)
-                if val:
-                    return float(val.replace(',', '.'))
-                return 0.0
-
-            # --- CABEÇALHO ---
-            ide = infNFe.find('.//nfe:ide', ns) or infNFe.find('ide')
-            dest = infNFe.find('.//nfe:dest', ns) or infNFe.find('dest')
-            prot = root.find('.//nfe:protNFe', ns) or root.find('.//protNFe') 
-
-            nNF = get_text(ide, 'nNF')
-            dhEmi = get_text(ide, 'dhEmi')[:10] 
-            cnpj_dest = get_text(dest, 'CNPJ')
-            
-            uf_dest = ''
-            if dest is not None:
-                ender = dest.find('.//nfe:enderDest', ns) or dest.find('enderDest')
-                if ender is not None:
-                    uf_dest = get_text(ender, 'UF')
-            
-            protocolo = ''
-            if prot:
-                infProt = prot.find('.//nfe:infProt', ns) or prot.find('infProt')
-                if infProt is not None:
-                    protocolo = get_text(infProt, 'nProt')
-
-            # --- ITENS ---
-            dets = infNFe.findall('.//nfe:det', ns) or infNFe.findall('det')
-            
-            for det in dets:
-                prod = det.find('.//nfe:prod', ns) or det.find('prod')
-                imposto = det.find('.//nfe:imposto', ns) or det.find('imposto')
-                
-                if prod is None: continue
-
-                cProd = get_text(prod, 'cProd')
-                xProd = get_text(prod, 'xProd')
-                NCM = get_text(prod, 'NCM')
-                CFOP = get_text(prod, 'CFOP')
-                
-                vProd = get_float(prod, 'vProd')
-                qCom = get_float(prod, 'qCom')
-                vUnCom = get_float(prod, 'vUnCom')
-                vFrete = get_float(prod, 'vFrete')
-                vSeg = get_float(prod, 'vSeg')
-                vDesc = get_float(prod, 'vDesc')
-                vOutro = get_float(prod, 'vOutro')
-
-                cst = ''; vBC = 0.0; pICMS = 0.0; vICMS = 0.0
-                vIPI = 0.0; vIPIDevol = 0.0; vICMSST = 0.0; vFCPST = 0.0
-                pCredSN = 0.0; vCredICMSSN = 0.0; vICMSUFDest = 0.0
-                
-                # Variáveis PIS/COFINS
-                cst_pis = ''; vBC_pis = 0.0; pPIS = 0.0; vPIS = 0.0
-                cst_cofins = ''; vBC_cofins = 0.0; pCOFINS = 0.0; vCOFINS = 0.0
-
-                if imposto is not None:
-                    # ICMS
-                    icms_node = imposto.find('.//nfe:ICMS', ns) or imposto.find('ICMS')
-                    if icms_node is not None:
-                        for child in icms_node:
-                            cst_val = get_text(child, 'CST') or get_text(child, 'CSOSN')
-                            if cst_val: cst = cst_val
-                            vBC = get_float(child, 'vBC')
-                            pICMS = get_float(child, 'pICMS')
-                            vICMS = get_float(child, 'vICMS')
-                            vICMSST = get_float(child, 'vICMSST')
-                            vFCPST = get_float(child, 'vFCPST')
-                            pCredSN = get_float(child, 'pCredSN')
-                            vCredICMSSN = get_float(child, 'vCredICMSSN')
-                            if cst: break 
-
-                    # IPI
-                    ipi_node = imposto.find('.//nfe:IPI', ns) or imposto.find('IPI')
-                    if ipi_node is not None:
-                        ipi_trib = ipi_node.find('.//nfe:IPITrib', ns) or ipi_node.find('IPITrib')
-                        if ipi_trib is not None:
-                            vIPI = get_float(ipi_trib, 'vIPI')
-                        else:
-                            vIPI = get_float(ipi_node, 'vIPI')
-
-                    # IPI Devol
-                    impostoDevol = det.find('.//nfe:impostoDevol', ns) or det.find('impostoDevol')
-                    if impostoDevol is not None:
-                        vIPIDevol = get_float(impostoDevol, 'vIPIDevol')
-
-                    # DIFAL
-                    icms_uf = imposto.find('.//nfe:ICMSUFDest', ns) or imposto.find('ICMSUFDest')
-                    if icms_uf is not None:
-                        vICMSUFDest = get_float(icms_uf, 'vICMSUFDest')
-                    
-                    # PIS
-                    pis_node = imposto.find('.//nfe:PIS', ns) or imposto.find('PIS')
-                    if pis_node is not None:
-                        for child in pis_node:
-                            cst_pis_val = get_text(child, 'CST')
-                            if cst_pis_val: cst_pis = cst_pis_val
-                            vBC_pis = get_float(child, 'vBC')
-                            pPIS = get_float(child, 'pPIS')
-                            vPIS = get_float(child, 'vPIS')
-
-                    # COFINS
-                    cofins_node = imposto.find('.//nfe:COFINS', ns) or imposto.find('COFINS')
-                    if cofins_node is not None:
-                        for child in cofins_node:
-                            cst_cofins_val = get_text(child, 'CST')
-                            if cst_cofins_val: cst_cofins = cst_cofins_val
-                            vBC_cofins = get_float(child, 'vBC')
-                            pCOFINS = get_float(child, 'pCOFINS')
-                            vCOFINS = get_float(child, 'vCOFINS')
-
-                vItemContabil = (vProd + vIPI + vICMSST + vFrete + vSeg + vOutro + vFCPST) - vDesc
-
-                dados.append({
-                    'n da nf': nNF, 'cnpj': cnpj_dest, 'uf': uf_dest, 'data': dhEmi, 'cst': cst,
-                    'qnt': qCom, 'vl unit': vUnCom, 'vl total': vProd, 'vlr': vItemContabil,
-                    'icms bc': vBC, 'alq icms': pICMS, 'icms': vICMS, 'ipi': vIPI,
-                    'icms st': vICMSST, 'fcp st': vFCPST, 'aql sn': pCredSN, 'icms sn': vCredICMSSN,
-                    'descrição': xProd, 
-                    'COD. PROD.': cProd, 
-                    'ipi dev': vIPIDevol, 'difal': vICMSUFDest,
-                    'COD_PROD_INTERNO': cProd, 'NCM': NCM, 'CFOP': CFOP, 'protocolo': protocolo,
-                    'cst_pis': cst_pis, 'vlr_pis': vPIS, 'cst_cofins': cst_cofins, 'vlr_cofins': vCOFINS,
-                    'pc': '', 'st': ''
-                })
-
-        except Exception as e:
-            logging.error(f"Erro ao processar arquivo {arquivo.name}: {e}")
-            continue
-
-    return pd.DataFrame(dados)
+    df = df_itens[list(COLUNAS_INVEST)].rename(columns=COLUNAS_INVEST)
+    df['ipi'] = (df_itens['VLR_IPI'] - df_itens['VLR_IPI_DEVOL']).round(2)
+    df['vlr'] = (df_itens['VLR_PROD'] - df_itens['VLR_IPI_DEVOL']).round(2)
+    df['COD_PROD_INTERNO'] = df['COD. PROD.']
+    df['pc'] = ''
+    df['st'] = ''
+    return df[ORDEM_COLUNAS_INVEST]
 
 
 # -----------------------------
@@ -447,14 +321,15 @@ def verificar_status_pis_cofins(cfop):
 # -----------------------------
 # 4. EXECUTOR PRINCIPAL
 # -----------------------------
-def executar_apuracao_invest(pasta_xml: Path, window: sg.Window, caminho_sete: str = None, caminho_ncm_csv: str = None):
+def executar_apuracao_invest(pasta_xml: Path, window: sg.Window, caminho_sete: str = None, caminho_ncm_csv: str = None,
+                             opcoes_desempenho: dict = None):
     logging.info(">>> Iniciando Apuração Invest...")
 
     ncms_perfumaria_validos = carregar_ncms_externos(caminho_ncm_csv)
     if not ncms_perfumaria_validos:
         logging.warning("Nenhum arquivo de regras carregado ou nenhuma linha com 'perfumaria' encontrada na coluna E.")
 
-    try: df = ler_xmls_diretamente(pasta_xml, window)
+    try: df = ler_xmls_diretamente(pasta_xml, window, opcoes_desempenho)
     except Exception as e: logging.error(f"Erro XML: {e}"); raise e
 
     if df.empty: raise ValueError("Nenhum dado encontrado nos XMLs.")
@@ -507,10 +382,11 @@ def executar_apuracao_invest(pasta_xml: Path, window: sg.Window, caminho_sete: s
     resumo_sete = resumo_sete[cols_order]
 
     # 4.1.A. TOTALIZADOR DETALHADO (PC -> CFOP)
+    # observed=True: CFOP e CST vêm do xml_parser como 'category' (só as combinações existentes)
     totalizador_pc = df.pivot_table(
         index=['CFOP', 'PC'], 
         values=['vlr', 'icms bc', 'icms', 'ipi', 'icms st', 'difal'],
-        aggfunc='sum'
+        aggfunc='sum', observed=True
     ).reset_index().sort_values(by=['CFOP', 'PC'])
     totalizador_pc = totalizador_pc[['CFOP', 'PC', 'vlr', 'icms bc', 'icms', 'ipi', 'icms st', 'difal']]
     totalizador_pc.columns = ['CFOP', 'PC', 'VL CONT', 'BC ICMS', 'ICMS', 'IPI', 'ICMS ST', 'DIFAL']
@@ -519,14 +395,14 @@ def executar_apuracao_invest(pasta_xml: Path, window: sg.Window, caminho_sete: s
     resumo_fechado_cfop = df.pivot_table(
         index=['CFOP', 'PC'], 
         values=['vlr', 'icms bc', 'icms', 'ipi', 'icms st', 'difal'],
-        aggfunc='sum'
+        aggfunc='sum', observed=True
     ).reset_index().sort_values(by=['CFOP', 'PC'])
     
     resumo_fechado_cfop = resumo_fechado_cfop[['CFOP', 'PC', 'vlr', 'icms bc', 'icms', 'ipi', 'icms st', 'difal']]
     resumo_fechado_cfop.columns = ['CFOP', 'PC', 'VL CONT', 'BC ICMS', 'ICMS', 'IPI', 'ICMS ST', 'DIFAL']
 
     # 4.2. Resumo por CST
-    resumo_cst = df.pivot_table(index=['cst'], values=['vlr', 'icms bc', 'icms', 'ipi', 'icms st'], aggfunc='sum').reset_index()
+    resumo_cst = df.pivot_table(index=['cst'], values=['vlr', 'icms bc', 'icms', 'ipi', 'icms st'], aggfunc='sum', observed=True).reset_index()
     resumo_cst = resumo_cst[['cst', 'vlr', 'icms bc', 'icms', 'ipi', 'icms st']]
     resumo_cst.columns = ['CST/CSOSN', 'Vlr Contábil', 'Base ICMS', 'Vlr ICMS', 'Vlr IPI', 'Vlr ICMS ST']
 
@@ -534,7 +410,7 @@ def executar_apuracao_invest(pasta_xml: Path, window: sg.Window, caminho_sete: s
     # Filtra CFOPs que deram "SEM REGRA" e cria um resumo
     df_alerta_pis = df[df['Status_PisCofins'] == 'SEM REGRA'].copy()
     if not df_alerta_pis.empty:
-        resumo_alerta_pis = df_alerta_pis.groupby(['CFOP', 'descrição']).agg(
+        resumo_alerta_pis = df_alerta_pis.groupby(['CFOP', 'descrição'], observed=True).agg(
             qnt=('qnt', 'sum'),
             vlr_total=('vlr', 'sum'),
             cst_pis=('cst_pis', 'first'), # Pega o primeiro exemplo
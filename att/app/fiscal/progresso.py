@@ -0,0 +1,77 @@
+import logging
+import time
+from typing import Any, Optional
+
+# Progresso de leituras longas (SPED): bytes lidos, linhas/s e MB/s.
+# Quem lê chama registrar() com os totais acumulados (a cada muitas linhas); o envio
+# para a janela e para o log é limitado por tempo, então o custo no laço é desprezível.
+
+EVENTO_PROGRESSO_SPED = '-SPED_PROGRESS-'
+INTERVALO_JANELA_S = 0.5
+INTERVALO_LOG_S = 10.0
+LINHAS_ENTRE_REGISTROS = 8192  # Leitores chamam registrar() a cada N linhas
+MB = 1024 * 1024
+
+
+class ProgressoLeitura:
+    """
+    Acompanha uma leitura de bytes_total bytes (0 = desconhecido, ex.: SPED compactado).
+    window: objeto com write_event_value (WindowAdapter); recebe
+    (bytes_lidos, bytes_total, linhas_por_s, mb_por_s) no evento EVENTO_PROGRESSO_SPED.
+    intervalo_log None desativa o log (uso em processos filhos, só para contar).
+    """
+
+    def __init__(self, bytes_total: int, window: Any = None, descricao: str = 'SPED',
+                 intervalo_log: Optional[float] = INTERVALO_LOG_S):
+        self.bytes_total = bytes_total
+        self.window = window if hasattr(window, 'write_event_value') else None
+        self.descricao = descricao
+        self.intervalo_log = intervalo_log
+        self.bytes_lidos = 0
+        self.linhas = 0
+        self.inicio = time.monotonic()
+        self._ultima_janela = self.inicio
+        self._ultimo_log = self.inicio
+
+    def registrar(self, bytes_lidos: int, linhas: int) -> None:
+        """Atualiza os totais acumulados; emite só se o intervalo de tempo já passou."""
+        self.bytes_lidos = bytes_lidos
+        self.linhas = linhas
+        agora = time.monotonic()
+        if self.window is not None and agora - self._ultima_janela >= INTERVALO_JANELA_S:
+            self._ultima_janela = agora
+            self._emitir(agora)
+        if self.intervalo_log is not None and agora - self._ultimo_log >= self.intervalo_log:
+            self._ultimo_log = agora
+            logging.info(f"{self.descricao}: {self._resumo(agora)}")
+
+    def somar(self, bytes_lidos: int, linhas: int) -> None:
+        """Para leituras em pedaços (modo paralelo): soma o que um pedaço leu."""
+        self.registrar(self.bytes_lidos + bytes_lidos, self.linhas + linhas)
+
+    def concluir(self) -> None:
+        """Emite o estado final e registra a vazão da leitura inteira no log."""
+        agora = time.monotonic()
+        if self.window is not None:
+            self._emitir(agora, final=True)
+        if self.intervalo_log is not None:
+            logging.info(f"{self.descricao} lido: {self._resumo(agora)} em {agora - self.inicio:.1f} s.")
+
+    def _vazao(self, agora: float):
+        decorrido = max(agora - self.inicio, 1e-6)
+        return self.linhas / decorrido, self.bytes_lidos / MB / decorrido
+
+    def _emitir(self, agora: float, final: bool = False) -> None:
+        linhas_s, mb_s = self._vazao(agora)
+        total = self.bytes_lidos if final and not self.bytes_total else self.bytes_total
+        try:
+            self.window.write_event_value(EVENTO_PROGRESSO_SPED, (self.bytes_lidos, total, linhas_s, mb_s))
+        except Exception:
+            pass  # Janela fechada: a leitura continua
+
+    def _resumo(self, agora: float) -> str:
+        linhas_s, mb_s = self._vazao(agora)
+        lido = f"{self.bytes_lidos / MB:.1f} MB"
+        if self.bytes_total:
+            lido += f" de {self.bytes_total / MB:.1f} MB ({100 * self.bytes_lidos / self.bytes_total:.0f}%)"
+        return f"{lido}, {self.linhas} linhas ({linhas_s:,.0f} linhas/s, {mb_s:.1f} MB/s)"
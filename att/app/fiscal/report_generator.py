@@ -1,8 +1,8 @@
 import logging
 import pandas as pd
-import FreeSimpleGUI as sg
+# import FreeSimpleGUI as sg # REMOVIDO (roda também sem interface, ver conciliacao_cli)
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
 
 # --- IMPORTAÇÕES DO OPENPYXL ---
 from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
@@ -17,15 +17,16 @@ def gerar_relatorio_excel(
     df_aliquota_aba: pd.DataFrame,
     df_totalizadores_entrada: pd.DataFrame, 
     df_totalizadores_saida: pd.DataFrame,
-    df_cte_bruto_aba: pd.DataFrame
+    df_cte_bruto_aba: pd.DataFrame,
+    df_alteracoes_sped: Optional[pd.DataFrame] = None
 ) -> None:
     """Gera o arquivo Excel final com todas as abas e formatações."""
     
     writer = None
     try:
         writer = pd.ExcelWriter(str(caminho_saida), engine='openpyxl')
-    except ImportError:
-        sg.popup_error("'openpyxl' é necessário. Instale com: pip install openpyxl"); raise
+    except ImportError as e:
+        raise Exception(f"'openpyxl' é necessário. Instale com: pip install openpyxl ({e})")
 
     # --- Definição dos Estilos (Sintaxe OpenPyXL) ---
     header_fill = PatternFill(start_color='2D3E50', end_color='2D3E50', fill_type='solid')
@@ -74,6 +75,7 @@ def gerar_relatorio_excel(
                 ws.conditional_formatting.add(cell_range, CellIsRule(operator='equal', formula=['"Ajuste"'], stopIfTrue=True, fill=revisar_fill, font=revisar_font))
                 ws.conditional_formatting.add(cell_range, FormulaRule(formula=[f'ISNUMBER(SEARCH("Energia Elétrica",{first_cell}))'], stopIfTrue=True, fill=revisar_fill, font=revisar_font))
                 ws.conditional_formatting.add(cell_range, FormulaRule(formula=[f'ISNUMBER(SEARCH("Comunicação",{first_cell}))'], stopIfTrue=True, fill=revisar_fill, font=revisar_font))
+                ws.conditional_formatting.add(cell_range, FormulaRule(formula=[f'ISNUMBER(SEARCH("CF-e SAT",{first_cell}))'], stopIfTrue=True, fill=revisar_fill, font=revisar_font))
 
             ws.conditional_formatting.add(cell_range, CellIsRule(operator='equal', formula=['"DIVERGENTE"'], stopIfTrue=True, fill=divergent_fill, font=divergent_font))
             ws.conditional_formatting.add(cell_range, CellIsRule(operator='equal', formula=['"FALTA XML"'], stopIfTrue=True, fill=divergent_fill, font=divergent_font))
@@ -85,6 +87,7 @@ def gerar_relatorio_excel(
             ws.conditional_formatting.add(cell_range, CellIsRule(operator='equal', formula=['"OK"'], stopIfTrue=True, fill=ok_fill, font=ok_font))
             
             ws.conditional_formatting.add(cell_range, CellIsRule(operator='equal', formula=['"N/A"'], stopIfTrue=True, font=na_font))
+            ws.conditional_formatting.add(cell_range, CellIsRule(operator='equal', formula=['"CANCELADA"'], stopIfTrue=True, font=na_font))
 
         for col_name, col_idx in cfop_cols_map.items():
             col_letter = get_column_letter(col_idx + 1)
@@ -349,6 +352,17 @@ def gerar_relatorio_excel(
         else:
             logging.warning("DataFrame de CT-e (D190) vazio. Aba 'Dados_CTe_SPED' não será gerada.")
 
+        # --- GERAÇÃO DA ABA 'Alteracoes_SPED' (modo incremental: diferenças para a versão anterior) ---
+        if df_alteracoes_sped is not None and not df_alteracoes_sped.empty:
+            logging.info("Gerando aba 'Alteracoes_SPED' (motor openpyxl)...")
+            df_alteracoes_sped.to_excel(writer, sheet_name='Alteracoes_SPED', index=False)
+            ws_alteracoes = writer.sheets['Alteracoes_SPED']
+            col_formats_alt = {
+                col_idx: (col_name, 48 if col_name == 'CHAVE' else 14, None)
+                for col_idx, col_name in enumerate(df_alteracoes_sped.columns)
+            }
+            apply_styles_and_rules_v2(ws_alteracoes, df_alteracoes_sped, {}, {}, col_formats_alt)
+
         writer.close()
 
     except Exception as e:
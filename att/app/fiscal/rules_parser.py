@@ -1,6 +1,6 @@
 import logging
 import pandas as pd
-import FreeSimpleGUI as sg
+# import FreeSimpleGUI as sg # REMOVIDO (roda também sem interface, ver conciliacao_cli)
 from pathlib import Path
 
 def ler_regras_acumuladores(caminho_regras: Path) -> pd.DataFrame:
@@ -55,5 +55,5 @@ def ler_regras_acumuladores(caminho_regras: Path) -> pd.DataFrame:
         logging.info(f"Encontradas {len(df)} regras de acumuladores únicas.")
         return df
     except FileNotFoundError: raise Exception(f"Arquivo de regras não encontrado em: {caminho_regras}")
-    except ImportError: sg.popup_error("A biblioteca 'openpyxl' (para .xlsx) ou 'xlrd' (para .xls) é necessária.\n\nInstale com:\npip install openpyxl xlrd", title="Dependência Faltando"); raise
+    except ImportError as e: raise Exception(f"A biblioteca 'openpyxl' (para .xlsx) ou 'xlrd' (para .xls) é necessária. Instale com: pip install openpyxl xlrd ({e})")
     except Exception as e: logging.error(f"Erro ao processar o arquivo de regras: {e}"); raise
\ No newline at end of file
@@ -0,0 +1,151 @@
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+# Cache em disco dos 5 DataFrames de extrair_dados_sped, em Parquet (pyarrow).
+# Cada entrada é uma pasta '<hash do conteúdo>_v<versão>' dentro da pasta de cache;
+# a data de modificação da pasta marca o último acesso (política LRU por tamanho total).
+
+VERSAO_CACHE = 2  # Incrementar sempre que o layout dos DataFrames do parser mudar
+NOMES_TABELAS: Tuple[str, ...] = ('sped', 'itens', 'analitico', 'cte', 'chaves_difal')
+TAMANHO_MAXIMO_PADRAO_MB = 2048
+
+_aviso_pyarrow_emitido = False
+
+
+def cache_disponivel() -> bool:
+    """O cache depende do pyarrow; sem ele a análise segue normalmente, só sem cache."""
+    global _aviso_pyarrow_emitido
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        if not _aviso_pyarrow_emitido:
+            logging.warning("pyarrow não instalado: cache do SPED desativado.")
+            _aviso_pyarrow_emitido = True
+        return False
+
+
+def chave_cache_sped(hash_conteudo: str, variante: str = '') -> str:
+    """Nome da entrada no cache. 'variante' separa resultados de opções que mudam a saída."""
+    return f"{hash_conteudo}_v{VERSAO_CACHE}{('_' + variante) if variante else ''}"
+
+
+def _tamanho_pasta(pasta: Path) -> int:
+    """Bytes da entrada. Outro processo pode removê-la durante a contagem: o que sumiu vale 0."""
+    total = 0
+    try:
+        for arq in pasta.iterdir():
+            try:
+                if arq.is_file():
+                    total += arq.stat().st_size
+            except OSError:
+                continue
+    except OSError:
+        pass
+    return total
+
+
+def carregar_tabelas_cache(pasta_cache: Path, chave: str, nomes: Iterable[str]) -> Optional[Dict[str, pd.DataFrame]]:
+    """Lê as tabelas de uma entrada do cache, ou None se não houver entrada válida."""
+    entrada = Path(pasta_cache) / chave
+    if not entrada.is_dir() or not cache_disponivel():
+        return None
+    try:
+        tabelas = {nome: pd.read_parquet(entrada / f"{nome}.parquet") for nome in nomes}
+    except Exception as e:
+        logging.warning(f"Entrada do cache do SPED ilegível ({e}). Descartando...")
+        shutil.rmtree(entrada, ignore_errors=True)
+        return None
+
+    try:
+        os.utime(entrada)  # Marca o acesso para a política LRU
+    except OSError:
+        pass  # Removida por outro processo depois da leitura: as tabelas já estão em memória
+    return tabelas
+
+
+def salvar_tabelas_cache(pasta_cache: Path, chave: str, tabelas: Dict[str, pd.DataFrame],
+                         tamanho_maximo_mb: float = TAMANHO_MAXIMO_PADRAO_MB) -> None:
+    """Grava as tabelas como uma entrada do cache e aplica o limite de tamanho. Falhas só geram aviso."""
+    if not cache_disponivel():
+        return
+    pasta_cache = Path(pasta_cache)
+    entrada = pasta_cache / chave
+    temporaria = pasta_cache / f".{chave}.{os.getpid()}.tmp"
+    try:
+        temporaria.mkdir(parents=True, exist_ok=True)
+        for nome, df in tabelas.items():
+            df.to_parquet(temporaria / f"{nome}.parquet")
+        # Grava em pasta temporária e renomeia: uma entrada nunca fica pela metade
+        shutil.rmtree(entrada, ignore_errors=True)
+        try:
+            temporaria.rename(entrada)
+        except OSError:
+            if not entrada.is_dir():
+                raise
+            # Outro processo (ex.: outra empresa do lote) gravou a mesma entrada entre o rmtree e o rename
+            shutil.rmtree(temporaria, ignore_errors=True)
+    except Exception as e:
+        logging.warning(f"Não foi possível salvar o SPED no cache: {e}")
+        shutil.rmtree(temporaria, ignore_errors=True)
+        return
+
+    _aplicar_limite_lru(pasta_cache, int(tamanho_maximo_mb * 1024 * 1024), preservar=chave)
+
+
+def carregar_cache_sped(pasta_cache: Path, chave: str) -> Optional[Tuple[pd.DataFrame, ...]]:
+    """Retorna os 5 DataFrames salvos para a chave, ou None se não houver entrada válida."""
+    tabelas = carregar_tabelas_cache(pasta_cache, chave, NOMES_TABELAS)
+    if tabelas is None:
+        return None
+    logging.info(f"SPED carregado do cache ({chave[:12]}...).")
+    return tuple(tabelas[nome] for nome in NOMES_TABELAS)
+
+
+def salvar_cache_sped(pasta_cache: Path, chave: str, dataframes: Sequence[pd.DataFrame],
+                      tamanho_maximo_mb: float = TAMANHO_MAXIMO_PADRAO_MB) -> None:
+    """Grava os 5 DataFrames de extrair_dados_sped no cache."""
+    salvar_tabelas_cache(pasta_cache, chave, dict(zip(NOMES_TABELAS, dataframes)), tamanho_maximo_mb)
+
+
+def _aplicar_limite_lru(pasta_cache: Path, tamanho_maximo: int, preservar: Optional[str] = None) -> None:
+    """Remove as entradas acessadas há mais tempo até o cache caber no limite."""
+    entradas: List[Tuple[float, int, Path]] = []
+    try:
+        for pasta in pasta_cache.iterdir():
+            if pasta.is_dir() and not pasta.name.startswith('.'):
+                try:
+                    entradas.append((pasta.stat().st_mtime, _tamanho_pasta(pasta), pasta))
+                except OSError:
+                    continue  # Removida por outro processo durante a varredura
+    except OSError as e:
+        logging.warning(f"Não foi possível aplicar o limite do cache do SPED: {e}")
+        return
+
+    total = sum(tamanho for _, tamanho, _ in entradas)
+    for _, tamanho, pasta in sorted(entradas, key=lambda e: e[0]):
+        if total <= tamanho_maximo:
+            break
+        if pasta.name == preservar:
+            continue
+        shutil.rmtree(pasta, ignore_errors=True)
+        total -= tamanho
+        logging.info(f"Cache do SPED: entrada {pasta.name[:12]}... removida (limite de {tamanho_maximo // (1024 * 1024)} MB).")
+
+
+def limpar_cache_sped(pasta_cache: Path) -> int:
+    """Apaga todas as entradas do cache. Retorna quantas foram removidas."""
+    pasta_cache = Path(pasta_cache)
+    if not pasta_cache.is_dir():
+        return 0
+    removidas = 0
+    for pasta in pasta_cache.iterdir():
+        if pasta.is_dir():
+            shutil.rmtree(pasta, ignore_errors=True)
+            removidas += 1
+    return removidas
@@ -0,0 +1,92 @@
+import gzip
+import hashlib
+import io
+import logging
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, TextIO
+
+# Leitura de SPED compactado (.zip / .gz) sem extrair para o disco: o arquivo é
+# descompactado em fluxo enquanto as linhas são lidas. Como não há acesso aleatório ao
+# conteúdo, SPED compactado é sempre lido do início ao fim (sem índice e sem modo paralelo).
+
+ASSINATURA_ZIP = b'PK\x03\x04'
+ASSINATURA_GZIP = b'\x1f\x8b'
+EXTENSOES_SPED_ZIP = ('.txt', '.sped', '.efd')
+TAMANHO_BLOCO_HASH = 1024 * 1024
+
+
+def formato_compactacao(caminho_sped: Path) -> Optional[str]:
+    """'zip', 'gz' ou None (texto puro), pela assinatura do arquivo e não pela extensão."""
+    try:
+        with open(caminho_sped, 'rb') as f:
+            cabecalho = f.read(4)
+    except OSError:
+        return None
+    if cabecalho.startswith(ASSINATURA_ZIP):
+        return 'zip'
+    if cabecalho.startswith(ASSINATURA_GZIP):
+        return 'gz'
+    return None
+
+
+def sped_compactado(caminho_sped: Path) -> bool:
+    return formato_compactacao(caminho_sped) is not None
+
+
+def _membro_sped(arquivo_zip: zipfile.ZipFile) -> zipfile.ZipInfo:
+    """Escolhe o SPED dentro do ZIP: o maior .txt (ou o maior arquivo, se não houver .txt)."""
+    membros = [m for m in arquivo_zip.infolist() if not m.is_dir()]
+    candidatos = [m for m in membros if m.filename.lower().endswith(EXTENSOES_SPED_ZIP)] or membros
+    if not candidatos:
+        raise Exception(f"Nenhum arquivo dentro do ZIP: {arquivo_zip.filename}")
+    membro = max(candidatos, key=lambda m: m.file_size)
+    if len(candidatos) > 1:
+        logging.warning(f"ZIP com {len(candidatos)} arquivos. Usando o maior: {membro.filename}")
+    return membro
+
+
+@contextmanager
+def abrir_sped_binario(caminho_sped: Path) -> Iterator[BinaryIO]:
+    """Abre o SPED para leitura em bytes, descompactando em fluxo se for .zip/.gz."""
+    formato = formato_compactacao(caminho_sped)
+    if formato == 'zip':
+        with zipfile.ZipFile(caminho_sped) as arquivo_zip:
+            membro = _membro_sped(arquivo_zip)
+            logging.info(f"Lendo SPED compactado: {Path(caminho_sped).name} -> {membro.filename}")
+            with arquivo_zip.open(membro) as f:
+                yield f
+    elif formato == 'gz':
+        logging.info(f"Lendo SPED compactado: {Path(caminho_sped).name} (gzip)")
+        with gzip.open(caminho_sped, 'rb') as f:
+            yield f
+    else:
+        with open(caminho_sped, 'rb') as f:
+            yield f
+
+
+@contextmanager
+def abrir_sped_texto(caminho_sped: Path, encoding: str = 'latin-1', errors: str = 'strict') -> Iterator[TextIO]:
+    """Como open(caminho, 'r'), mas aceitando também .zip/.gz."""
+    with abrir_sped_binario(caminho_sped) as f:
+        texto = io.TextIOWrapper(f, encoding=encoding, errors=errors)
+        try:
+            yield texto
+        finally:
+            texto.detach()  # Quem fecha o fluxo binário é abrir_sped_binario
+
+
+def iterar_linhas_compactado(caminho_sped: Path) -> Iterator[bytes]:
+    """Linhas cruas (bytes) do SPED inteiro, descompactadas em fluxo."""
+    with abrir_sped_binario(caminho_sped) as f:
+        yield from f
+
+
+def hash_arquivo_compactado(caminho_sped: Path) -> str:
+    """Hash dos bytes do arquivo compactado (chave do cache; dispensa descompactar)."""
+    hash_conteudo = hashlib.blake2b(digest_size=20)
+    with open(caminho_sped, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO_HASH), b''):
+            hash_conteudo.update(bloco)
+    return hash_conteudo.hexdigest()
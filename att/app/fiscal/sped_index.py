@@ -0,0 +1,296 @@
+import bisect
+import codecs
+import hashlib
+import json
+import logging
+import mmap
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from .progresso import LINHAS_ENTRE_REGISTROS
+from .sped_compactado import abrir_sped_binario, iterar_linhas_compactado, sped_compactado
+from .sped_layout import CONTEXTO_DOCUMENTOS, DOCUMENTOS_CONCILIACAO
+
+# Índice de um arquivo SPED: offsets (em bytes) das aberturas/fechamentos de bloco e dos
+# registros pai. Fica salvo ao lado do SPED ('<arquivo>.idx.json') e é reaproveitado
+# enquanto o tamanho e a data de modificação do arquivo não mudarem.
+# Também guarda o hash do conteúdo, usado como chave do cache de DataFrames (sped_cache).
+# SPED compactado (.zip/.gz) não tem índice: é sempre lido em fluxo (sped_compactado).
+
+VERSAO_INDICE = 3
+SUFIXO_INDICE = '.idx.json'
+
+ABERTURAS_BLOCO: Dict[bytes, str] = {
+    b'0001': '0', b'B001': 'B', b'C001': 'C', b'D001': 'D', b'E001': 'E',
+    b'G001': 'G', b'H001': 'H', b'K001': 'K', b'1001': '1', b'9001': '9',
+}
+FECHAMENTOS_BLOCO: Dict[bytes, str] = {
+    b'0990': '0', b'B990': 'B', b'C990': 'C', b'D990': 'D', b'E990': 'E',
+    b'G990': 'G', b'H990': 'H', b'K990': 'K', b'1990': '1', b'9990': '9',
+}
+# Registros pai, documentos de varejo e os registros lidos nas chaves deles (ex.: C400 do C405)
+REGISTROS_INDEXADOS: Tuple[str, ...] = ('0000', 'C100', 'C500', 'D100', 'D500') + tuple(DOCUMENTOS_CONCILIACAO) + \
+    tuple(sorted({reg for regs in CONTEXTO_DOCUMENTOS.values() for reg in regs}))
+TAMANHO_AMOSTRA_ENCODING = 1024 * 1024
+
+
+def caminho_indice(caminho_sped: Path) -> Path:
+    caminho_sped = Path(caminho_sped)
+    return caminho_sped.with_name(caminho_sped.name + SUFIXO_INDICE)
+
+
+def _assinatura_arquivo(caminho_sped: Path) -> Dict[str, int]:
+    stat = Path(caminho_sped).stat()
+    return {'tamanho': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def construir_indice_sped(caminho_sped: Path) -> Dict[str, Any]:
+    """Varre o arquivo uma vez (em bytes, sem decodificar) e monta o índice."""
+    logging.info(f"Indexando SPED: {Path(caminho_sped).name}")
+    blocos: Dict[str, List[int]] = {}
+    registros: Dict[str, List[int]] = {reg: [] for reg in REGISTROS_INDEXADOS}
+    indexados = {reg.encode('ascii'): registros[reg] for reg in REGISTROS_INDEXADOS}
+    total_linhas = 0
+    offset = 0
+    hash_conteudo = hashlib.blake2b(digest_size=20)
+    atualizar_hash = hash_conteudo.update
+
+    with open(caminho_sped, 'rb') as f:
+        for linha in f:
+            atualizar_hash(linha)
+            total_linhas += 1
+            reg = linha[1:5] if linha[:1] == b'|' else linha.strip()[1:5]
+            if reg in indexados:
+                indexados[reg].append(offset)
+            elif reg in ABERTURAS_BLOCO:
+                # [início, fim) em bytes; o fim é ajustado no registro de encerramento
+                blocos[ABERTURAS_BLOCO[reg]] = [offset, -1]
+            elif reg in FECHAMENTOS_BLOCO:
+                bloco = blocos.get(FECHAMENTOS_BLOCO[reg])
+                if bloco is not None:
+                    bloco[1] = offset + len(linha)
+            offset += len(linha)
+
+    for bloco in blocos.values():
+        if bloco[1] < 0:
+            bloco[1] = offset  # Bloco sem encerramento (arquivo truncado): vai até o fim
+
+    indice = {'versao': VERSAO_INDICE, 'total_linhas': total_linhas, 'blocos': blocos, 'registros': registros,
+              'hash': hash_conteudo.hexdigest()}
+    indice.update(_assinatura_arquivo(caminho_sped))
+    return indice
+
+
+def obter_indice_sped(caminho_sped: Path, reconstruir: bool = False) -> Dict[str, Any]:
+    """Carrega o índice salvo ao lado do SPED ou o reconstrói se o arquivo mudou."""
+    caminho_sped = Path(caminho_sped)
+    arquivo_indice = caminho_indice(caminho_sped)
+    assinatura = _assinatura_arquivo(caminho_sped)
+
+    if not reconstruir and arquivo_indice.exists():
+        try:
+            with open(arquivo_indice, 'r', encoding='utf-8') as f:
+                indice = json.load(f)
+            if (indice.get('versao') == VERSAO_INDICE and
+                    indice.get('tamanho') == assinatura['tamanho'] and
+                    indice.get('mtime_ns') == assinatura['mtime_ns']):
+                logging.info(f"Índice do SPED reaproveitado: {arquivo_indice.name}")
+                return indice
+            logging.info("Índice do SPED desatualizado. Reindexando...")
+        except (OSError, ValueError) as e:
+            logging.warning(f"Índice do SPED ilegível ({e}). Reindexando...")
+
+    indice = construir_indice_sped(caminho_sped)
+    try:
+        with open(arquivo_indice, 'w', encoding='utf-8') as f:
+            json.dump(indice, f, separators=(',', ':'))
+    except OSError as e:
+        logging.warning(f"Não foi possível salvar o índice do SPED em {arquivo_indice}: {e}")
+    return indice
+
+
+def intervalos_dos_blocos(indice: Dict[str, Any], blocos: Iterable[str]) -> Optional[List[Tuple[int, int]]]:
+    """
+    Intervalos [início, fim) dos blocos pedidos, em ordem de arquivo.
+    Retorna None se algum registro pai indexado cair fora deles (arquivo fora do leiaute),
+    para o chamador voltar a ler o arquivo inteiro.
+    """
+    intervalos = sorted(tuple(indice['blocos'][b]) for b in blocos if b in indice['blocos'])
+    inicios = [ini for ini, _ in intervalos]
+    for reg, offsets in indice['registros'].items():
+        if reg[0] not in blocos:
+            continue
+        for offset in offsets:
+            pos = bisect.bisect_right(inicios, offset) - 1
+            if pos < 0 or offset >= intervalos[pos][1]:
+                return None
+    return intervalos
+
+
+def iterar_linhas_intervalos(caminho_sped: Path, intervalos: Iterable[Tuple[int, int]],
+                             encoding: str = 'latin-1', errors: str = 'strict') -> Iterator[str]:
+    """Lê apenas as linhas dentro dos intervalos de bytes informados."""
+    with open(caminho_sped, 'rb') as f:
+        for inicio, fim in intervalos:
+            f.seek(inicio)
+            pos = inicio
+            while pos < fim:
+                linha = f.readline()
+                if not linha:
+                    break
+                pos += len(linha)
+                yield linha.decode(encoding, errors)
+
+
+def iterar_linhas_registros(caminho_sped: Path, indice: Dict[str, Any], registros: Iterable[str],
+                            encoding: str = 'latin-1', errors: str = 'strict') -> Iterator[str]:
+    """Lê apenas as linhas dos registros indexados pedidos (ex.: C100 e D100), em ordem de arquivo."""
+    offsets = sorted(o for reg in registros for o in indice['registros'].get(reg, []))
+    with open(caminho_sped, 'rb') as f:
+        for offset in offsets:
+            f.seek(offset)
+            yield f.readline().decode(encoding, errors)
+
+
+def detectar_encoding_sped(caminho_sped: Path) -> str:
+    """
+    Decide a codificação do arquivo uma única vez, pela amostra inicial.
+    O leiaute oficial é latin-1; só usa utf-8 se a amostra tiver bytes não-ASCII
+    e todos formarem UTF-8 válido (SPED gerado/editado por ferramenta em UTF-8).
+    """
+    with abrir_sped_binario(caminho_sped) as f:
+        amostra = f.read(TAMANHO_AMOSTRA_ENCODING)
+    if amostra.isascii():
+        return 'latin-1'
+    try:
+        # final=False: a amostra pode terminar no meio de um caractere multibyte
+        codecs.getincrementaldecoder('utf-8')().decode(amostra, final=False)
+    except UnicodeDecodeError:
+        return 'latin-1'
+    return 'utf-8'
+
+
+def iterar_linhas_brutas(caminho_sped: Path, intervalos: Optional[Iterable[Tuple[int, int]]] = None,
+                         progresso: Optional[Callable[[int, int], None]] = None) -> Iterator[bytes]:
+    """
+    Linhas cruas (bytes, sem decodificar) lidas via mmap. intervalos None = arquivo inteiro.
+    SPED compactado só pode ser lido inteiro, descompactando em fluxo.
+    progresso: chamado com (bytes lidos, linhas lidas) a cada LINHAS_ENTRE_REGISTROS linhas e no fim.
+    """
+    lidos = 0
+    linhas = 0
+    if sped_compactado(caminho_sped):
+        if intervalos is not None:
+            raise Exception("SPED compactado não permite leitura por intervalos (sem índice).")
+        for linha in iterar_linhas_compactado(caminho_sped):
+            lidos += len(linha)
+            linhas += 1
+            if progresso is not None and linhas % LINHAS_ENTRE_REGISTROS == 0:
+                progresso(lidos, linhas)
+            yield linha
+        if progresso is not None:
+            progresso(lidos, linhas)
+        return
+    with open(caminho_sped, 'rb') as f:
+        tamanho = os.fstat(f.fileno()).st_size
+        if tamanho == 0:
+            return  # mmap não aceita arquivo vazio
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            readline = mm.readline
+            for inicio, fim in (intervalos if intervalos is not None else [(0, tamanho)]):
+                mm.seek(inicio)
+                pos = inicio
+                while pos < fim:
+                    linha = readline()
+                    if not linha:
+                        break
+                    pos += len(linha)
+                    linhas += 1
+                    if progresso is not None and linhas % LINHAS_ENTRE_REGISTROS == 0:
+                        progresso(lidos + pos - inicio, linhas)
+                    yield linha
+                lidos += pos - inicio
+            if progresso is not None:
+                progresso(lidos, linhas)
+
+
+class SegmentoSped(NamedTuple):
+    """Trecho do arquivo que vai de um registro pai até o próximo (um documento e seus filhos)."""
+    intervalos: List[Tuple[int, int]]
+    hash: str
+    registro: str       # Registro pai que abre o trecho ('' no trecho antes do primeiro pai)
+    linha_pai: bytes    # Linha do registro pai (b'' no trecho inicial)
+    contexto: Tuple[bytes, ...] = ()  # Linhas de outros trechos usadas na chave (ex.: o C400 de um C405)
+
+
+def _encerramentos_bloco(mm: mmap.mmap, intervalos: List[Tuple[int, int]]) -> List[Tuple[int, str]]:
+    """Offset e registro da última linha de cada intervalo, quando é o encerramento do bloco (ex.: C990)."""
+    encerramentos = []
+    for inicio, fim in intervalos:
+        if fim <= inicio:
+            continue
+        ultima = max(mm.rfind(b'\n', inicio, fim - 1) + 1, inicio)
+        reg = mm[ultima:fim].strip()[1:5]
+        if reg in FECHAMENTOS_BLOCO:
+            encerramentos.append((ultima, reg.decode('ascii')))
+    return encerramentos
+
+
+def segmentar_por_documento(caminho_sped: Path, indice: Dict[str, Any], intervalos: List[Tuple[int, int]],
+                            registros_pai: Iterable[str],
+                            contexto: Optional[Dict[str, Tuple[str, ...]]] = None) -> List[SegmentoSped]:
+    """
+    Divide os intervalos em trechos que começam em cada registro pai e calcula o hash de
+    cada trecho. Dois trechos com o mesmo hash produzem exatamente as mesmas linhas no parser.
+    O encerramento de cada bloco (C990, D990...) fica em um trecho próprio, para o último
+    documento do bloco não mudar quando outro é incluído ou excluído depois dele.
+
+    contexto: registros (entre os pais) cuja última linha entra na chave de outro pai, ex.:
+    {'C405': ('C400',)}. Essa linha vai para SegmentoSped.contexto e para o hash do trecho,
+    que muda junto com a chave.
+    """
+    contexto = contexto or {}
+    segmentos: List[SegmentoSped] = []
+    with open(caminho_sped, 'rb') as f:
+        tamanho = os.fstat(f.fileno()).st_size
+        if tamanho == 0 or not intervalos:
+            return segmentos
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pais = sorted([(o, reg) for reg in registros_pai for o in indice['registros'].get(reg, [])] +
+                          _encerramentos_bloco(mm, intervalos))
+            atual: List[Tuple[int, int]] = []
+            registro, linha_pai, linhas_contexto = '', b'', ()
+            ultimas_linhas: Dict[str, bytes] = {}
+            hash_atual = hashlib.blake2b(digest_size=16)
+            idx_pai = 0
+
+            def fechar() -> None:
+                if atual:
+                    segmentos.append(SegmentoSped(list(atual), hash_atual.hexdigest(), registro, linha_pai,
+                                                  linhas_contexto))
+
+            for inicio, fim in intervalos:
+                pos = inicio
+                while idx_pai < len(pais) and pais[idx_pai][0] < fim:
+                    corte, reg = pais[idx_pai]
+                    idx_pai += 1
+                    if corte < pos:
+                        continue
+                    if corte > pos:
+                        atual.append((pos, corte))
+                        hash_atual.update(mm[pos:corte])
+                    fechar()
+                    atual, registro = [], reg
+                    linha_pai = mm[corte:mm.find(b'\n', corte, fim) + 1 or fim]
+                    ultimas_linhas[reg] = linha_pai
+                    hash_atual = hashlib.blake2b(digest_size=16)
+                    linhas_contexto = tuple(ultimas_linhas[r] for r in contexto.get(reg, ()) if r in ultimas_linhas)
+                    for linha in linhas_contexto:
+                        hash_atual.update(linha)
+                    pos = corte
+                if pos < fim:
+                    atual.append((pos, fim))
+                    hash_atual.update(mm[pos:fim])
+            fechar()
+    return segmentos
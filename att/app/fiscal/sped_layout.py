@@ -0,0 +1,216 @@
+from operator import itemgetter
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+# Leiaute declarativo dos registros da EFD ICMS/IPI (Guia Prático).
+# Os campos são listados na ordem oficial a partir do campo 02 (o campo 01 é o REG),
+# então a posição de cada campo no split('|') da linha é o seu número no Guia.
+# Para incluir um registro novo basta acrescentar uma entrada nesta tabela.
+
+PREFIXOS_NUMERICOS = ('VL_', 'ALIQ_', 'QTD', 'GT_')  # Campos convertidos para número
+
+
+class LeiauteRegistro(NamedTuple):
+    registro: str
+    campos: Tuple[str, ...]
+    pai: Optional[str] = None          # Registro imediatamente superior (hierarquia do Guia)
+    herda: Tuple[str, ...] = ()        # Campos do pai copiados para cada linha (identificam o grupo)
+
+    @property
+    def numericos(self) -> Tuple[str, ...]:
+        return tuple(c for c in self.campos if c.startswith(PREFIXOS_NUMERICOS))
+
+    def posicao(self, campo: str) -> int:
+        return self.campos.index(campo) + 2
+
+
+def _r(registro: str, campos: str, pai: Optional[str] = None, herda: str = '') -> LeiauteRegistro:
+    return LeiauteRegistro(registro, tuple(campos.split()), pai, tuple(herda.split()))
+
+
+LEIAUTE_REGISTROS: Dict[str, LeiauteRegistro] = {l.registro: l for l in (
+    # --- Bloco 0 ---
+    _r('0000', 'COD_VER COD_FIN DT_INI DT_FIN NOME CNPJ CPF UF IE COD_MUN IM SUFRAMA IND_PERFIL IND_ATIV'),
+    _r('0150', 'COD_PART NOME COD_PAIS CNPJ CPF IE COD_MUN SUFRAMA END NUM COMPL BAIRRO'),
+    _r('0200', 'COD_ITEM DESCR_ITEM COD_BARRA COD_ANT_ITEM UNID_INV TIPO_ITEM COD_NCM EX_IPI COD_GEN COD_LST ALIQ_ICMS CEST'),
+    # --- Bloco C: ECF (cupom fiscal) ---
+    _r('C400', 'COD_MOD ECF_MOD ECF_FAB ECF_CX'),
+    _r('C405', 'DT_DOC CRO CRZ NUM_COO_FIN GT_FIN VL_BRT', pai='C400', herda='ECF_FAB'),
+    _r('C490', 'CST_ICMS CFOP ALIQ_ICMS VL_OPR VL_BC_ICMS VL_ICMS COD_OBS', pai='C405', herda='ECF_FAB DT_DOC CRZ'),
+    # --- Bloco C: CF-e SAT ---
+    _r('C800', 'COD_MOD COD_SIT NUM_CFE DT_DOC VL_CFE VL_PIS VL_COFINS CNPJ_CPF NR_SAT CHV_CFE VL_DESC VL_MERC '
+               'VL_OUT_DA VL_ICMS VL_PIS_ST VL_COFINS_ST'),
+    _r('C850', 'CST_ICMS CFOP ALIQ_ICMS VL_OPR VL_BC_ICMS VL_ICMS COD_OBS', pai='C800', herda='CHV_CFE'),
+    _r('C860', 'COD_MOD NR_SAT DT_DOC DOC_INI DOC_FIM'),
+    _r('C890', 'CST_ICMS CFOP ALIQ_ICMS VL_OPR VL_BC_ICMS VL_ICMS COD_OBS', pai='C860', herda='NR_SAT DT_DOC'),
+    # --- Bloco D: bilhetes de passagem ---
+    _r('D300', 'COD_MOD SER SUB NUM_DOC_INI NUM_DOC_FIN CST_ICMS CFOP ALIQ_ICMS DT_DOC VL_OPR VL_DESC VL_SERV '
+               'VL_SEG VL_OUT_DESP VL_BC_ICMS VL_ICMS VL_RED_BC COD_OBS COD_CTA'),
+    _r('D350', 'COD_MOD ECF_MOD ECF_FAB ECF_CX'),
+    _r('D355', 'DT_DOC CRO CRZ NUM_COO_FIN GT_FIN VL_BRT', pai='D350', herda='ECF_FAB'),
+    _r('D390', 'CST_ICMS CFOP ALIQ_ICMS VL_OPR VL_BC_ISSQN ALIQ_ISSQN VL_ISSQN VL_BC_ICMS VL_ICMS VL_RED_BC COD_OBS',
+       pai='D355', herda='ECF_FAB DT_DOC CRZ'),
+    # --- Bloco E: apuração ---
+    _r('E100', 'DT_INI DT_FIN'),
+    _r('E110', 'VL_TOT_DEBITOS VL_AJ_DEBITOS VL_TOT_AJ_DEBITOS VL_ESTORNOS_CRED VL_TOT_CREDITOS VL_AJ_CREDITOS '
+               'VL_TOT_AJ_CREDITOS VL_ESTORNOS_DEB VL_SLD_CREDOR_ANT VL_SLD_APURADO VL_TOT_DED VL_ICMS_RECOLHER '
+               'VL_SLD_CREDOR_TRANSPORTAR DEB_ESP', pai='E100', herda='DT_INI DT_FIN'),
+    _r('E200', 'UF DT_INI DT_FIN'),
+    _r('E210', 'IND_MOV_ST VL_SLD_CRED_ANT_ST VL_DEVOL_ST VL_RESSARC_ST VL_OUT_CRED_ST VL_AJ_CREDITOS_ST '
+               'VL_RETENCAO_ST VL_OUT_DEB_ST VL_AJ_DEBITOS_ST VL_SLD_DEV_ANT_ST VL_DEDUCOES_ST VL_ICMS_RECOL_ST '
+               'VL_SLD_CRED_ST_TRANSPORTAR DEB_ESP_ST', pai='E200', herda='UF'),
+    _r('E500', 'IND_APUR DT_INI DT_FIN'),
+    _r('E510', 'CFOP CST_IPI VL_CONT_IPI VL_BC_IPI VL_IPI', pai='E500', herda='DT_INI DT_FIN'),
+    _r('E520', 'VL_SD_ANT_IPI VL_DEB_IPI VL_CRED_IPI VL_OD_IPI VL_OC_IPI VL_SC_IPI VL_SD_IPI', pai='E500', herda='DT_INI DT_FIN'),
+    # --- Bloco H: inventário ---
+    _r('H005', 'DT_INV VL_INV MOT_INV'),
+    _r('H010', 'COD_ITEM UNID QTD VL_UNIT VL_ITEM IND_PROP COD_PART TXT_COMPL COD_CTA VL_ITEM_IR', pai='H005', herda='DT_INV'),
+    # --- Bloco K: estoque ---
+    _r('K100', 'DT_INI DT_FIN'),
+    _r('K200', 'DT_EST COD_ITEM QTD IND_EST COD_PART', pai='K100'),
+)}
+
+
+# --- Entrada dos registros de varejo na conciliação ---
+# Registros que abrem um "documento" para a conciliação: formato da chave (campos no
+# formato 'REG.CAMPO') e, quando o documento vira linha de df_sped, o tipo da nota e os totais.
+# Os campos de chave de outro registro (ex.: C400.ECF_FAB) vêm da última linha lida dele.
+class DocumentoConciliacao(NamedTuple):
+    chave: Tuple[str, ...]
+    formato: str
+    tipo_nota: Optional[str] = None
+    totais: Optional[Dict[str, str]] = None  # Coluna de df_sped -> campo do registro
+
+
+DOCUMENTOS_CONCILIACAO: Dict[str, DocumentoConciliacao] = {
+    'C405': DocumentoConciliacao(('C400.ECF_FAB', 'C405.DT_DOC', 'C405.CRZ'), 'ECF_{}_{}_{}'),
+    'C800': DocumentoConciliacao(('C800.CHV_CFE',), '{}', 'CF-e SAT (C800)', {
+        'VL_DOC_SPED': 'VL_CFE', 'ICMS_SPED': 'VL_ICMS', 'PIS_SPED': 'VL_PIS', 'COFINS_SPED': 'VL_COFINS',
+    }),
+    'C860': DocumentoConciliacao(('C860.NR_SAT', 'C860.DT_DOC'), 'SAT_{}_{}'),
+    'D300': DocumentoConciliacao(('D300.COD_MOD', 'D300.SER', 'D300.NUM_DOC_INI', 'D300.NUM_DOC_FIN'), 'Bilhete_{}_{}_{}_{}'),
+    'D355': DocumentoConciliacao(('D350.ECF_FAB', 'D355.DT_DOC', 'D355.CRZ'), 'ECF_{}_{}_{}'),
+}
+# Registros de outras linhas lidos na chave de cada documento (ex.: C405 -> C400): a chave
+# depende da última linha deles antes do documento
+CONTEXTO_DOCUMENTOS: Dict[str, Tuple[str, ...]] = {
+    reg: tuple(dict.fromkeys(campo.split('.')[0] for campo in doc.chave if campo.split('.')[0] != reg))
+    for reg, doc in DOCUMENTOS_CONCILIACAO.items()
+}
+# Registros analíticos (CST/CFOP/alíquota) que entram em df_sped_analitico com a chave do documento aberto
+ANALITICOS_CONCILIACAO: Tuple[str, ...] = ('C490', 'C850', 'C890', 'D300', 'D390')
+CAMPOS_ANALITICOS: Tuple[str, ...] = ('CST_ICMS', 'CFOP', 'ALIQ_ICMS', 'VL_OPR', 'VL_BC_ICMS', 'VL_ICMS')
+
+
+# --- Compilação ---
+class RegraCompilada(NamedTuple):
+    registro: str
+    tamanho_minimo: int                                  # len(campos) mínimo para a linha ser válida
+    guardar: bool                                        # Outros registros leem campos desta linha
+    chave: Optional[Callable[[Dict[str, List[str]]], str]]
+    linha_sped: Optional[Callable[[List[str], str], List[str]]]   # Linha de df_sped (campos, chave)
+    analitico: Optional[Callable[[List[str]], Tuple[str, ...]]]
+
+
+def _getter_tupla(posicoes: Iterable[int]) -> Callable[[List[str]], Tuple[str, ...]]:
+    posicoes = tuple(posicoes)
+    getter = itemgetter(*posicoes)
+    if len(posicoes) == 1:
+        return lambda campos: (getter(campos),)
+    return getter
+
+
+def compilar_regras_conciliacao(colunas_sped: Sequence[str], numericas_sped: Sequence[str]) -> Dict[str, RegraCompilada]:
+    """
+    Converte as tabelas acima em regras prontas para o parser: posições resolvidas e
+    itemgetters montados uma única vez, sem consultar o leiaute linha a linha.
+    colunas_sped/numericas_sped: layout de df_sped no parser (ordem das colunas da linha gerada).
+    """
+    lidos_por_outros = {campo.split('.')[0] for doc in DOCUMENTOS_CONCILIACAO.values() for campo in doc.chave}
+    registros = set(DOCUMENTOS_CONCILIACAO) | set(ANALITICOS_CONCILIACAO) | lidos_por_outros
+    regras: Dict[str, RegraCompilada] = {}
+
+    for reg in sorted(registros):
+        leiaute = LEIAUTE_REGISTROS[reg]
+        posicoes_usadas: List[int] = []
+        chave = linha_sped = analitico = None
+
+        doc = DOCUMENTOS_CONCILIACAO.get(reg)
+        if doc:
+            pos_chave = []
+            for campo in doc.chave:
+                reg_origem, nome = campo.split('.')
+                pos = LEIAUTE_REGISTROS[reg_origem].posicao(nome)
+                pos_chave.append((reg_origem, pos))
+                if reg_origem == reg:
+                    posicoes_usadas.append(pos)
+            chave = _montar_chave(tuple(pos_chave), doc.formato)
+            if doc.totais:
+                pos_totais = [leiaute.posicao(campo) for campo in doc.totais.values()]
+                posicoes_usadas.extend(pos_totais)
+                linha_sped = _montar_linha_sped(colunas_sped, numericas_sped, doc, pos_totais)
+
+        if reg in ANALITICOS_CONCILIACAO:
+            pos_analitico = [leiaute.posicao(campo) for campo in CAMPOS_ANALITICOS]
+            posicoes_usadas.extend(pos_analitico)
+            analitico = _getter_tupla(pos_analitico)
+
+        regras[reg] = RegraCompilada(
+            registro=reg,
+            tamanho_minimo=max(posicoes_usadas, default=1) + 1,
+            guardar=reg in lidos_por_outros,
+            chave=chave,
+            linha_sped=linha_sped,
+            analitico=analitico,
+        )
+    return regras
+
+
+def _montar_chave(pos_chave: Tuple[Tuple[str, int], ...], formato: str) -> Callable[[Dict[str, List[str]]], str]:
+    def chave(ultimos: Dict[str, List[str]]) -> str:
+        valores = []
+        for reg, pos in pos_chave:
+            campos = ultimos.get(reg)
+            valores.append(campos[pos] if campos is not None and len(campos) > pos else '')
+        return formato.format(*valores)
+    return chave
+
+
+def _montar_linha_sped(colunas_sped: Sequence[str], numericas_sped: Sequence[str],
+                       doc: DocumentoConciliacao, pos_totais: List[int]) -> Callable[[List[str], str], List[str]]:
+    """Linha de df_sped: totais do registro nas colunas mapeadas, '0,00' nas demais numéricas."""
+    modelo = ['0,00' if c in numericas_sped else '' for c in colunas_sped]
+    modelo[colunas_sped.index('TIPO_NOTA_SPED')] = doc.tipo_nota or ''
+    idx_chave = colunas_sped.index('CHV_NFE')
+    destinos = list(zip([colunas_sped.index(c) for c in doc.totais], pos_totais))
+
+    def linha_sped(campos: List[str], chave: str) -> List[str]:
+        linha = modelo.copy()
+        linha[idx_chave] = chave
+        for idx, pos in destinos:
+            linha[idx] = campos[pos]
+        return linha
+    return linha_sped
+
+
+def registros_em_bytes(registros: Iterable[str]) -> FrozenSet[bytes]:
+    """Códigos dos registros em bytes, para o teste rápido de prefixo no parser."""
+    return frozenset(reg.encode('ascii') for reg in registros)
+
+
+def colunas_registro(registro: str) -> Tuple[List[str], List[str]]:
+    """Colunas (campos herdados do pai + campos próprios) e colunas numéricas do DataFrame de um registro."""
+    leiaute = LEIAUTE_REGISTROS[registro]
+    return list(leiaute.herda) + list(leiaute.campos), list(leiaute.numericos)
+
+
+def extrator_registro(registro: str) -> Callable[[List[str]], Tuple[Any, ...]]:
+    """Itemgetter dos campos próprios do registro (posições 2..n), preenchendo linhas curtas com ''."""
+    leiaute = LEIAUTE_REGISTROS[registro]
+    n = len(leiaute.campos)
+    getter = _getter_tupla(range(2, n + 2))
+
+    def extrair(campos: List[str]) -> Tuple[Any, ...]:
+        if len(campos) < n + 2:
+            campos = campos + [''] * (n + 2 - len(campos))
+        return getter(campos)
+    return extrair
@@ -1,7 +1,42 @@
 import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+import numpy as np
 import pandas as pd
+from array import array
 from pathlib import Path
-from typing import List, Tuple, Any, Dict, Optional, IO
+from typing import List, Tuple, Any, Dict, Optional, IO, Iterable, Sequence
+
+from .sped_index import (
+    obter_indice_sped, intervalos_dos_blocos, iterar_linhas_intervalos, iterar_linhas_brutas, detectar_encoding_sped,
+    iterar_linhas_registros, segmentar_por_documento, SegmentoSped
+)
+from .sped_layout import (
+    LEIAUTE_REGISTROS, CONTEXTO_DOCUMENTOS, DOCUMENTOS_CONCILIACAO, compilar_regras_conciliacao, registros_em_bytes,
+    colunas_registro, extrator_registro
+)
+from .categorias import para_categorias
+from .centavos import centavos_sped, coluna_monetaria, reais_para_centavos
+from .progresso import ProgressoLeitura
+from .sped_compactado import sped_compactado, abrir_sped_texto, hash_arquivo_compactado
+from .sped_cache import (
+    chave_cache_sped, carregar_cache_sped, salvar_cache_sped, carregar_tabelas_cache, salvar_tabelas_cache,
+    TAMANHO_MAXIMO_PADRAO_MB, VERSAO_CACHE
+)
+
+# Blocos do SPED que contêm os registros lidos por este parser
+BLOCOS_LIDOS = ('C', 'D')
+# Registros que zeram o estado do parser: o arquivo só pode ser dividido antes deles
+REGISTROS_PAI = ('C100', 'C500', 'D100', 'D500')
+# O modo incremental divide o arquivo também nos documentos de varejo (C405, C800, C860, D300, D355),
+# nos registros lidos nas chaves deles (C400, D350) e nos encerramentos dos blocos lidos (C990, D990)
+REGISTROS_SEGMENTO: Tuple[str, ...] = REGISTROS_PAI + tuple(DOCUMENTOS_CONCILIACAO) + \
+    tuple(sorted({reg for regs in CONTEXTO_DOCUMENTOS.values() for reg in regs}))
+ENCERRAMENTOS_LIDOS: Tuple[str, ...] = tuple(f'{bloco}990' for bloco in BLOCOS_LIDOS)
+# Abaixo deste tamanho o modo paralelo não compensa o custo de subir os processos
+TAMANHO_MINIMO_PARALELO = 64 * 1024 * 1024
 
 # --- Função Auxiliar de Leitura de Linhas ---
 def _processar_linhas_sped(
@@ -187,8 +222,507 @@ def _processar_linhas_sped(
         dados_completos.append(current_invoice_data)
 
 
+# --- Modo Colunar (sem dicionário por linha) ---
+COLUNAS_SPED = ['CHV_NFE', 'VL_DOC_SPED', 'ICMS_SPED', 'ICMS_ST_SPED', 'IPI_SPED', 'PIS_SPED', 'COFINS_SPED',
+                'FCP_ST_SPED', 'IPI_DEVOL_SPED', 'ICMS_SN_SPED', 'ICMS_MONO_SPED', 'TIPO_NOTA_SPED', 'CFOP_SPED']
+NUMERICAS_SPED = COLUNAS_SPED[1:11]
+
+COLUNAS_ITENS = ['CHV_NFE', 'N_ITEM_SPED', 'COD_PROD_SPED', 'CFOP_SPED_ITEM', 'CST_ICMS_SPED_ITEM',
+                 'VL_OPR_SPED_ITEM', 'VL_BC_ICMS_SPED_ITEM', 'VL_ICMS_SPED_ITEM', 'VL_BC_ICMS_ST_SPED_ITEM',
+                 'VL_ICMS_ST_SPED_ITEM', 'VLR_IPI_SPED_ITEM']
+NUMERICAS_ITENS = COLUNAS_ITENS[5:]
+
+COLUNAS_ANALITICO = ['CHV_NFE', 'CST_ICMS_SPED_ITEM', 'CFOP_SPED_ITEM', 'ALIQ_ICMS_SPED_ITEM', 'VL_OPR_SPED_ITEM',
+                     'VL_BC_ICMS_SPED_ITEM', 'VL_ICMS_SPED_ITEM', 'VL_BC_ICMS_ST_SPED_ITEM', 'VL_ICMS_ST_SPED_ITEM',
+                     'VLR_IPI_SPED_ITEM']
+NUMERICAS_ANALITICO = COLUNAS_ANALITICO[3:]
+
+COLUNAS_CTE = ['CHV_CTE', 'CST_ICMS_SPED_D190', 'CFOP_SPED_D190', 'ALIQ_ICMS_SPED_D190', 'VL_OPR_SPED_D190',
+               'VL_BC_ICMS_SPED_D190', 'VL_ICMS_SPED_D190']
+NUMERICAS_CTE = COLUNAS_CTE[3:]
+
+# Registros de varejo (ECF, SAT, bilhetes) tratados pela tabela declarativa de sped_layout
+REGRAS_VAREJO = compilar_regras_conciliacao(COLUNAS_SPED, NUMERICAS_SPED)
+# Registros usados pelo parser colunar; os demais são descartados sem decodificar a linha
+REGISTROS_CONSUMIDOS = frozenset((b'C100', b'C101', b'C170', b'C190', b'C500', b'C590',
+                                  b'D100', b'D190', b'D500', b'D590')) | registros_em_bytes(REGRAS_VAREJO) | \
+    registros_em_bytes(ENCERRAMENTOS_LIDOS)
+# Onde o modo incremental divide o arquivo além dos registros pai: o parser zera o estado neles também
+_DIVISOES_VAREJO_E_ENCERRAMENTOS = frozenset(REGISTROS_SEGMENTO[len(REGISTROS_PAI):] + ENCERRAMENTOS_LIDOS)
+
+
+def _valor_sped(texto: str) -> float:
+    """Converte um decimal SPED ('1234,56') para float. Inválido/vazio vira NaN (zerado na montagem)."""
+    try:
+        return float(texto.replace(',', '.'))
+    except ValueError:
+        return math.nan
+
+
+def _literal_inteiro(texto: str) -> bool:
+    return texto.lstrip('+-').isdigit()
+
+
+class _BufferColunar:
+    """
+    Buffers de um DataFrame de saída: uma lista por coluna de texto e um array('d')
+    por coluna numérica, preenchidos direto da linha do SPED.
+
+    Guarda também quais colunas numéricas só receberam literais inteiros, para
+    reproduzir o dtype que o pd.to_numeric do modo antigo daria (int64).
+
+    centavos: colunas monetárias gravadas como inteiros em centavos (array('q')),
+    convertidas direto dos dígitos, sem passar por float.
+    """
+
+    def __init__(self, colunas: Sequence[str], numericas: Sequence[str], sempre_float: Sequence[str] = (),
+                 casas_decimais: Optional[int] = 2, centavos: Sequence[str] = ()):
+        self.colunas: List[str] = list(colunas)
+        self.casas_decimais = casas_decimais
+        self.numericas: set[str] = set(numericas)
+        self.centavos: set[str] = set(centavos)
+        self.dados: Dict[str, Any] = {
+            c: (array('q') if c in self.centavos else array('d') if c in self.numericas else []) for c in self.colunas
+        }
+        self.linhas: int = 0
+        self._idx_texto = [i for i, c in enumerate(self.colunas) if c not in self.numericas]
+        self._idx_numerico = [i for i, c in enumerate(self.colunas) if c in self.numericas and c not in self.centavos]
+        self._idx_centavos = [i for i, c in enumerate(self.colunas) if c in self.centavos]
+        self._appends = [self.dados[c].append for c in self.colunas]
+        # Índices de colunas numéricas que até agora só receberam literais inteiros
+        self._inteiras: set[int] = {i for i in self._idx_numerico if self.colunas[i] not in sempre_float}
+
+    def adicionar(self, valores: Sequence[str]) -> None:
+        """Adiciona uma linha. 'valores' segue a ordem de self.colunas, números ainda como literal SPED."""
+        appends = self._appends
+        if self._inteiras:
+            self._inteiras = {i for i in self._inteiras if _literal_inteiro(valores[i])}
+        for i in self._idx_texto:
+            appends[i](valores[i])
+        for i in self._idx_numerico:
+            appends[i](_valor_sped(valores[i]))
+        for i in self._idx_centavos:
+            appends[i](centavos_sped(valores[i]))
+        self.linhas += 1
+
+    def estender(self, outro: '_BufferColunar') -> None:
+        """Anexa as linhas de outro buffer do mesmo leiaute (usado ao juntar os pedaços do modo paralelo)."""
+        for col in self.colunas:
+            self.dados[col].extend(outro.dados[col])
+        self._inteiras &= outro._inteiras
+        self.linhas += outro.linhas
+
+    def __getstate__(self) -> Dict[str, Any]:
+        estado = self.__dict__.copy()
+        del estado['_appends']  # Métodos ligados às listas são recriados no processo de destino
+        return estado
+
+    def __setstate__(self, estado: Dict[str, Any]) -> None:
+        self.__dict__.update(estado)
+        self._appends = [self.dados[c].append for c in self.colunas]
+
+    def para_dataframe(self, ordem: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Monta o DataFrame a partir das colunas (NaN -> 0, arredondado em 2 casas)."""
+        if self.linhas == 0:
+            return pd.DataFrame()
+        colunas_inteiras = {self.colunas[i] for i in self._inteiras}
+        dados: Dict[str, Any] = {}
+        for col in (ordem or self.colunas):
+            valores = self.dados[col]
+            if col in self.centavos:
+                dados[col] = np.frombuffer(valores, dtype=np.int64).copy()
+            elif col in self.numericas:
+                serie = pd.Series(np.frombuffer(valores, dtype=np.float64), copy=True).fillna(0)
+                if col in colunas_inteiras:
+                    serie = serie.astype('int64')
+                dados[col] = serie.round(self.casas_decimais) if self.casas_decimais is not None else serie
+            else:
+                dados[col] = valores
+        return pd.DataFrame(dados)
+
+
+def _processar_linhas_sped_colunar(
+    f: Iterable[bytes],
+    encoding: str,
+    buf_sped: _BufferColunar,
+    buf_itens: _BufferColunar,
+    buf_analitico: _BufferColunar,
+    buf_cte: _BufferColunar,
+    chaves_com_c101: set,
+    marcas: Optional[List[Tuple[int, int, int, int]]] = None
+) -> Optional[str]:
+    """
+    Mesma máquina de estados de _processar_linhas_sped, mas grava os campos direto nos
+    buffers colunares. Retorna o primeiro registro pai gravado em buf_sped ('C100', 'C500',
+    'C800' ou 'D500'), que define a ordem das colunas CFOP_SPED/TIPO_NOTA_SPED no modo antigo.
+
+    Os registros de varejo (C4xx, C8xx, D300, D35x) seguem as regras compiladas de
+    sped_layout (REGRAS_VAREJO): documentos com chave própria e linhas analíticas.
+
+    marcas: se informada, recebe o número de linhas de cada buffer ao chegar em cada ponto de
+    divisão do modo incremental (REGISTROS_SEGMENTO e encerramentos dos blocos), que as usa
+    para saber quais linhas pertencem a cada documento.
+
+    Recebe as linhas cruas (bytes): o código do registro é conferido nos bytes e só as
+    linhas de registros consumidos são decodificadas e quebradas em campos.
+    """
+    primeiro_pai: Optional[str] = None
+    cfops_sped = buf_sped.dados['CFOP_SPED']
+
+    # Estado: índice da linha C100 pendente (CFOP_SPED preenchido ao fechar a nota)
+    idx_nota_pendente: int = -1
+    current_cfops_nfe: set[str] = set()
+    current_chv_nfe: str = ''
+    current_chv_cte: str = ''
+    current_chv_energia: str = ''
+    current_chv_comunicacao: str = ''
+    current_chv_varejo: str = ''
+    ultimos_varejo: Dict[str, List[str]] = {}  # Última linha de cada registro usado em chaves
+    regras_varejo = REGRAS_VAREJO
+    divisoes_varejo = _DIVISOES_VAREJO_E_ENCERRAMENTOS
+
+    consumidos = REGISTROS_CONSUMIDOS
+    for linha in f:
+        # Linhas fora do padrão '|REG|' (espaços no início etc.) seguem pelo caminho completo
+        if linha[:1] == b'|' and linha[1:5] not in consumidos:
+            continue
+        campos = linha.decode(encoding, 'replace').strip().split('|')
+        reg_type = campos[1] if len(campos) > 1 else None
+        if reg_type in divisoes_varejo:
+            # Documento de varejo, equipamento (C400/D350) ou encerramento de bloco: fecha a nota
+            # anterior como um registro pai (linhas soltas depois dele não vão para o documento anterior)
+            if idx_nota_pendente >= 0:
+                cfops_sped[idx_nota_pendente] = '/'.join(sorted(current_cfops_nfe))
+            idx_nota_pendente = -1; current_cfops_nfe = set(); current_chv_nfe = ''
+            current_chv_cte = ''; current_chv_energia = ''; current_chv_comunicacao = ''
+            current_chv_varejo = ''
+            if marcas is not None:
+                marcas.append((buf_sped.linhas, buf_itens.linhas, buf_analitico.linhas, buf_cte.linhas))
+
+        if reg_type in ('C100', 'D100', 'C500', 'D500'):
+            if idx_nota_pendente >= 0:
+                cfops_sped[idx_nota_pendente] = '/'.join(sorted(current_cfops_nfe))
+            idx_nota_pendente = -1; current_cfops_nfe = set(); current_chv_nfe = ''
+            current_chv_cte = ''; current_chv_energia = ''; current_chv_comunicacao = ''
+            current_chv_varejo = ''
+            if marcas is not None:
+                marcas.append((buf_sped.linhas, buf_itens.linhas, buf_analitico.linhas, buf_cte.linhas))
+
+            if reg_type == 'C100':
+                if len(campos) > 27:
+                    current_chv_nfe = campos[9]
+                    idx_nota_pendente = buf_sped.linhas
+                    buf_sped.adicionar((
+                        current_chv_nfe, campos[12], campos[22], campos[23], campos[25], campos[26], campos[27],
+                        '0,00', '0,00', '0,00', '0,00', '', ''
+                    ))
+                    primeiro_pai = primeiro_pai or 'C100'
+
+            elif reg_type == 'D100':
+                if len(campos) > 9:
+                    current_chv_cte = campos[9]
+
+            elif reg_type == 'C500':
+                if len(campos) > 23:
+                    current_chv_energia = campos[10] if campos[10] else f"Energia_{campos[6]}_{campos[9]}"
+                    buf_sped.adicionar((
+                        current_chv_energia, campos[12], campos[18], '0,00', '0,00', campos[22], campos[23],
+                        '0,00', '0,00', '0,00', '0,00', 'Energia Elétrica (C500)', campos[8]
+                    ))
+                    primeiro_pai = primeiro_pai or 'C500'
+
+            elif len(campos) > 21:  # D500
+                current_chv_comunicacao = f"Comunicação_{campos[6]}_{campos[9]}"
+                buf_sped.adicionar((
+                    current_chv_comunicacao, campos[11], campos[17], '0,00', '0,00', campos[19], campos[21],
+                    '0,00', '0,00', '0,00', '0,00', 'Comunicação (D500)', campos[8]
+                ))
+                primeiro_pai = primeiro_pai or 'D500'
+
+        elif reg_type == 'C101' and current_chv_nfe:
+            chaves_com_c101.add(current_chv_nfe)
+
+        elif reg_type == 'C170' and current_chv_nfe:
+            n = len(campos)
+            if n > 11:
+                if campos[11]: current_cfops_nfe.add(campos[11])
+                buf_itens.adicionar((
+                    current_chv_nfe, campos[2], campos[3], campos[11], campos[10], campos[7],
+                    campos[13] if n > 13 else '0,00',
+                    campos[15] if n > 15 else '0,00',
+                    campos[16] if n > 16 else '0,00',
+                    campos[18] if n > 18 else '0,00',
+                    campos[24] if n > 24 else ''
+                ))
+
+        elif reg_type == 'C190' and current_chv_nfe:
+            if len(campos) > 11:
+                if campos[3]: current_cfops_nfe.add(campos[3])
+                buf_analitico.adicionar((
+                    current_chv_nfe, campos[2], campos[3], campos[4], campos[5], campos[6],
+                    campos[7], campos[8], campos[9], campos[11]
+                ))
+
+        elif reg_type == 'D190' and current_chv_cte:
+            if len(campos) > 9:
+                buf_cte.adicionar((current_chv_cte, campos[2], campos[3], campos[4], campos[5], campos[6], campos[7]))
+                buf_analitico.adicionar((
+                    current_chv_cte, campos[2], campos[3], campos[4], campos[5], campos[6],
+                    campos[7], '0,00', '0,00', '0,00'
+                ))
+
+        elif reg_type == 'C590' and current_chv_energia:
+            if len(campos) > 10:
+                buf_analitico.adicionar((
+                    current_chv_energia, campos[2], campos[3], campos[4], campos[5], campos[6],
+                    campos[7], campos[8], campos[9], '0,00'
+                ))
+
+        elif reg_type == 'D590' and current_chv_comunicacao:
+            if len(campos) > 10:
+                buf_analitico.adicionar((
+                    current_chv_comunicacao, campos[2], campos[3], campos[4], campos[5], campos[6],
+                    campos[7], campos[8], campos[9], '0,00'
+                ))
+
+        elif reg_type in regras_varejo:
+            regra = regras_varejo[reg_type]
+            if len(campos) < regra.tamanho_minimo:
+                continue
+            if regra.guardar:
+                ultimos_varejo[reg_type] = campos
+
+            if regra.chave is not None:
+                # Documento de varejo (a nota anterior já foi fechada acima)
+                current_chv_varejo = regra.chave(ultimos_varejo)
+
+                if regra.linha_sped is not None:
+                    idx_nota_pendente = buf_sped.linhas
+                    buf_sped.adicionar(regra.linha_sped(campos, current_chv_varejo))
+                    primeiro_pai = primeiro_pai or reg_type
+
+            if regra.analitico is not None and current_chv_varejo:
+                cst, cfop, aliq, vl_opr, vl_bc, vl_icms = regra.analitico(campos)
+                if cfop: current_cfops_nfe.add(cfop)
+                buf_analitico.adicionar((
+                    current_chv_varejo, cst, cfop, aliq, vl_opr, vl_bc, vl_icms, '0,00', '0,00', '0,00'
+                ))
+
+    if idx_nota_pendente >= 0:
+        cfops_sped[idx_nota_pendente] = '/'.join(sorted(current_cfops_nfe))
+    return primeiro_pai
+
+
+def _novos_buffers_sped(centavos: bool = False) -> Tuple[_BufferColunar, _BufferColunar, _BufferColunar, _BufferColunar]:
+    def monetarias(numericas: Sequence[str]) -> List[str]:
+        return [c for c in numericas if coluna_monetaria(c)] if centavos else []
+
+    return (
+        _BufferColunar(COLUNAS_SPED, NUMERICAS_SPED, centavos=monetarias(NUMERICAS_SPED)),
+        # IPI do C170 sempre passava por float() no modo antigo, então nunca vira int64
+        _BufferColunar(COLUNAS_ITENS, NUMERICAS_ITENS, sempre_float=['VLR_IPI_SPED_ITEM'],
+                       centavos=monetarias(NUMERICAS_ITENS)),
+        _BufferColunar(COLUNAS_ANALITICO, NUMERICAS_ANALITICO, centavos=monetarias(NUMERICAS_ANALITICO)),
+        _BufferColunar(COLUNAS_CTE, NUMERICAS_CTE, centavos=monetarias(NUMERICAS_CTE)),
+    )
+
+
+def _montar_dataframes_colunar(
+    buf_sped: _BufferColunar, buf_itens: _BufferColunar, buf_analitico: _BufferColunar,
+    buf_cte: _BufferColunar, chaves_com_c101: set, primeiro_pai: Optional[str]
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Constrói os 5 DataFrames a partir dos buffers, com o mesmo layout do modo por dicionário."""
+    ordem_sped = COLUNAS_SPED
+    if primeiro_pai in ('C500', 'D500'):
+        ordem_sped = COLUNAS_SPED[:11] + ['CFOP_SPED', 'TIPO_NOTA_SPED']
+
+    df_sped = buf_sped.para_dataframe(ordem_sped)
+    if not df_sped.empty:
+        df_sped.drop_duplicates(subset=['CHV_NFE'], keep='first', inplace=True)
+
+    df_sped_itens = buf_itens.para_dataframe()
+    if not df_sped_itens.empty:
+        df_sped_itens.drop_duplicates(subset=['CHV_NFE', 'N_ITEM_SPED'], keep='first', inplace=True)
+
+    df_sped_analitico = buf_analitico.para_dataframe()
+    df_sped_cte = buf_cte.para_dataframe()
+    df_chaves_difal = pd.DataFrame(list(chaves_com_c101), columns=['CHV_NFE'])
+
+    return _com_categorias((df_sped, df_sped_itens, df_sped_analitico, df_sped_cte, df_chaves_difal))
+
+
+def _com_categorias(dataframes: Tuple[pd.DataFrame, ...]) -> Tuple[pd.DataFrame, ...]:
+    """CFOP, CST e tipo de nota como 'category' (ver categorias.py) nos DataFrames de registros."""
+    for df in dataframes[:4]:
+        para_categorias(df)
+    return dataframes
+
+
+def _abrir_linhas_sped(caminho_arquivo_sped: Path, encoding: str, intervalos: Optional[List[Tuple[int, int]]]):
+    # 'replace' só tem efeito em utf-8 (latin-1 decodifica qualquer byte)
+    if intervalos is None:
+        return abrir_sped_texto(caminho_arquivo_sped, encoding, 'replace')
+    return closing(iterar_linhas_intervalos(caminho_arquivo_sped, intervalos, encoding, 'replace'))
+
+
+def _bytes_a_ler(caminho_arquivo_sped: Path, intervalos: Optional[List[Tuple[int, int]]]) -> int:
+    """Total de bytes da leitura, para o percentual do progresso (0 = desconhecido, compactado)."""
+    if intervalos is not None:
+        return sum(fim - ini for ini, fim in intervalos)
+    return 0 if sped_compactado(caminho_arquivo_sped) else Path(caminho_arquivo_sped).stat().st_size
+
+
+def _intervalos_via_indice(caminho_arquivo_sped: Path) -> Optional[List[Tuple[int, int]]]:
+    """Intervalos de bytes dos blocos C e D segundo o índice (None = ler o arquivo todo)."""
+    if sped_compactado(caminho_arquivo_sped):
+        return None  # Compactado: leitura em fluxo, do início ao fim
+    try:
+        indice = obter_indice_sped(caminho_arquivo_sped)
+    except OSError as e:
+        logging.warning(f"Não foi possível indexar o SPED ({e}). Lendo o arquivo inteiro.")
+        return None
+    intervalos = intervalos_dos_blocos(indice, BLOCOS_LIDOS)
+    if intervalos is None:
+        logging.warning("Registros C/D fora dos blocos C001-C990/D001-D990. Lendo o arquivo inteiro.")
+    return intervalos
+
+
+def _ler_arquivo_sped(caminho_arquivo_sped: Path, processador, *destinos,
+                      intervalos: Optional[List[Tuple[int, int]]] = None,
+                      encoding: Optional[str] = None, bruto: bool = False,
+                      progresso: Optional[ProgressoLeitura] = None) -> Any:
+    """
+    Abre o SPED uma única vez, com a codificação detectada antes da leitura, e repassa
+    as linhas ao processador. bruto=True entrega linhas em bytes via mmap (o processador
+    recebe a codificação como segundo argumento e decodifica só o que usar).
+    progresso: acompanha bytes/linhas lidos (só no modo bruto).
+    """
+    encoding = encoding or detectar_encoding_sped(caminho_arquivo_sped)
+
+    try:
+        if bruto:
+            registrar = progresso.registrar if progresso is not None else None
+            with closing(iterar_linhas_brutas(caminho_arquivo_sped, intervalos, registrar)) as linhas:
+                return processador(linhas, encoding, *destinos)
+        with _abrir_linhas_sped(caminho_arquivo_sped, encoding, intervalos) as f:
+            return processador(f, *destinos)
+    except Exception as e:
+        raise Exception(f"Erro inesperado ao ler SPED ({encoding}): {e}")
+
+
+# --- Modo Paralelo (pedaços alinhados em registros pai) ---
+def _dividir_em_pedacos(indice: Dict[str, Any], intervalos: List[Tuple[int, int]],
+                        num_pedacos: int) -> List[List[Tuple[int, int]]]:
+    """
+    Divide os intervalos dos blocos C/D em até num_pedacos partes de tamanho parecido.
+    Os cortes caem sempre no início de um registro pai (C100/C500/D100/D500), onde o
+    parser zera o estado, então cada pedaço pode ser processado de forma independente.
+    """
+    total = sum(fim - ini for ini, fim in intervalos)
+    offsets_pai = sorted(o for reg in REGISTROS_PAI for o in indice['registros'].get(reg, []))
+    if total == 0 or num_pedacos <= 1 or not offsets_pai:
+        return [intervalos]
+
+    # Posição de cada offset "linearizada" (desconsiderando os bytes fora dos blocos)
+    alvo = total / num_pedacos
+    cortes: List[int] = []
+    acumulado_antes = 0
+    proximo_alvo = alvo
+    idx_intervalo = 0
+    for offset in offsets_pai:
+        while idx_intervalo < len(intervalos) and offset >= intervalos[idx_intervalo][1]:
+            acumulado_antes += intervalos[idx_intervalo][1] - intervalos[idx_intervalo][0]
+            idx_intervalo += 1
+        if idx_intervalo >= len(intervalos):
+            break
+        posicao = acumulado_antes + offset - intervalos[idx_intervalo][0]
+        if posicao >= proximo_alvo:
+            cortes.append(offset)
+            proximo_alvo = (len(cortes) + 1) * alvo
+            if len(cortes) >= num_pedacos - 1:
+                break
+
+    pedacos: List[List[Tuple[int, int]]] = []
+    limites = [intervalos[0][0]] + cortes + [intervalos[-1][1]]
+    for inicio_pedaco, fim_pedaco in zip(limites, limites[1:]):
+        partes = [(max(ini, inicio_pedaco), min(fim, fim_pedaco)) for ini, fim in intervalos
+                  if ini < fim_pedaco and fim > inicio_pedaco]
+        if partes:
+            pedacos.append(partes)
+    return pedacos
+
+
+def _processar_pedaco_sped(caminho_arquivo_sped: Path, intervalos: List[Tuple[int, int]], encoding: str,
+                           centavos: bool = False) -> Tuple[Any, ...]:
+    """
+    Executado em um processo filho: processa um pedaço do SPED e devolve os buffers parciais
+    e as linhas lidas (para a vazão reportada pelo processo principal).
+    """
+    buffers = _novos_buffers_sped(centavos)
+    chaves_difal: set = set()
+    contador = ProgressoLeitura(0, intervalo_log=None)
+    primeiro_pai = _ler_arquivo_sped(caminho_arquivo_sped, _processar_linhas_sped_colunar, *buffers, chaves_difal,
+                                     intervalos=intervalos, encoding=encoding, bruto=True, progresso=contador)
+    return (*buffers, chaves_difal, primeiro_pai, contador.linhas)
+
+
+def _resolver_num_workers(num_workers: Optional[int]) -> int:
+    """0/None = automático (todos os núcleos); 1 = serial."""
+    if not num_workers or num_workers < 0:
+        return os.cpu_count() or 1
+    return num_workers
+
+
+def _extrair_paralelo(caminho_arquivo_sped: Path, num_workers: int, centavos: bool = False,
+                      window: Any = None) -> Optional[Tuple[Any, ...]]:
+    """
+    Processa o SPED em paralelo. Retorna None quando o modo paralelo não se aplica
+    (arquivo pequeno, sem índice ou com registros fora dos blocos) e o chamador segue no serial.
+    """
+    if Path(caminho_arquivo_sped).stat().st_size < TAMANHO_MINIMO_PARALELO:
+        return None
+    try:
+        indice = obter_indice_sped(caminho_arquivo_sped)
+    except OSError as e:
+        logging.warning(f"Modo paralelo indisponível (falha ao indexar: {e}). Usando leitura serial.")
+        return None
+    intervalos = intervalos_dos_blocos(indice, BLOCOS_LIDOS)
+    if not intervalos:
+        return None
+
+    # Mais pedaços que processos, para equilibrar blocos com densidades diferentes
+    pedacos = _dividir_em_pedacos(indice, intervalos, num_workers * 4)
+    if len(pedacos) <= 1:
+        return None
+
+    logging.info(f"Processando SPED em paralelo: {len(pedacos)} pedaços em {num_workers} processos.")
+    progresso = ProgressoLeitura(sum(fim - ini for ini, fim in intervalos), window)
+    buffers = _novos_buffers_sped(centavos)
+    chaves_difal: set = set()
+    primeiro_pai: Optional[str] = None
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        encoding = detectar_encoding_sped(caminho_arquivo_sped)
+        resultados = executor.map(_processar_pedaco_sped, [caminho_arquivo_sped] * len(pedacos), pedacos,
+                                  [encoding] * len(pedacos), [centavos] * len(pedacos))
+        # map() devolve na ordem dos pedaços, preservando a ordem do arquivo (e o keep='first')
+        for pedaco, (*parciais, chaves_parciais, pai_parcial, linhas_pedaco) in zip(pedacos, resultados):
+            for buf, parcial in zip(buffers, parciais):
+                buf.estender(parcial)
+            chaves_difal |= chaves_parciais
+            primeiro_pai = primeiro_pai or pai_parcial
+            progresso.somar(sum(fim - ini for ini, fim in pedaco), linhas_pedaco)
+    progresso.concluir()
+
+    return (*buffers, chaves_difal, primeiro_pai)
+
+
 # --- Função Principal de Extração ---
-def extrair_dados_sped(caminho_arquivo_sped: Path) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+def extrair_dados_sped(caminho_arquivo_sped: Path, modo_colunar: bool = True, usar_indice: bool = True,
+                       num_workers: Optional[int] = 1, pasta_cache: Optional[Path] = None,
+                       atualizar_cache: bool = False,
+                       tamanho_maximo_cache_mb: float = TAMANHO_MAXIMO_PADRAO_MB,
+                       centavos: bool = False,
+                       window: Any = None) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     """
     Retorna 5 DataFrames:
     1. df_sped (Cabeçalhos C100/D100/etc)
@@ -196,30 +730,81 @@ def extrair_dados_sped(caminho_arquivo_sped: Path) -> Tuple[pd.DataFrame, pd.Dat
     3. df_sped_analitico (C190/D190/etc)
     4. df_sped_cte (D190 específico CTE)
     5. df_chaves_difal (NOVO: Apenas chaves que têm C101)
+
+    modo_colunar: grava os campos direto em buffers por coluna (menos memória em SPEDs grandes).
+    False usa o modo antigo (lista de dicionários + pd.to_numeric), que não lê os registros
+    de varejo (C4xx/C8xx/D300/D35x); nos demais o resultado é o mesmo.
+
+    usar_indice: usa o índice de blocos (sped_index) para ler só os blocos C e D.
+
+    num_workers: processos para o modo paralelo (só no modo colunar). 1 = serial,
+    0/None = todos os núcleos. Arquivos pequenos sempre são lidos no modo serial.
+
+    pasta_cache: se informada, guarda/reaproveita os DataFrames em Parquet, pela chave do
+    hash do conteúdo do arquivo (sped_cache), com entradas separadas por modo (colunar/antigo) e
+    por centavos. atualizar_cache=True ignora a entrada existente
+    e reprocessa o arquivo.
+
+    Aceita também SPED compactado (.zip/.gz), descompactado em fluxo durante a leitura
+    (sempre serial e sem índice).
+
+    centavos: valores monetários como int64 em centavos (ver centavos.py); alíquotas seguem float.
+
+    window: se informada (WindowAdapter), recebe o progresso da leitura no evento '-SPED_PROGRESS-'
+    (bytes lidos, total, linhas/s, MB/s), no máximo duas vezes por segundo. A vazão também vai para o log.
     """
+    chave = None
+    if pasta_cache is not None:
+        # O modo antigo não lê os registros de varejo: o resultado dele não serve ao colunar (e vice-versa)
+        variante = '_'.join(([] if modo_colunar else ['legado']) + (['centavos'] if centavos else []))
+        try:
+            if sped_compactado(caminho_arquivo_sped):
+                chave = chave_cache_sped(hash_arquivo_compactado(caminho_arquivo_sped), variante)
+            else:
+                chave = chave_cache_sped(obter_indice_sped(caminho_arquivo_sped)['hash'], variante)
+        except OSError as e:
+            logging.warning(f"Cache do SPED indisponível (falha ao indexar: {e}).")
+        if chave and not atualizar_cache:
+            em_cache = carregar_cache_sped(pasta_cache, chave)
+            if em_cache is not None:
+                return _com_categorias(em_cache)  # Entradas gravadas antes das colunas 'category'
+
+    resultado = _extrair_dados_sped(caminho_arquivo_sped, modo_colunar, usar_indice, num_workers, centavos, window)
+
+    if chave:
+        salvar_cache_sped(pasta_cache, chave, resultado, tamanho_maximo_cache_mb)
+    return resultado
+
+
+def _extrair_dados_sped(caminho_arquivo_sped: Path, modo_colunar: bool, usar_indice: bool,
+                        num_workers: Optional[int], centavos: bool = False,
+                        window: Any = None) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     logging.info('Lendo e processando arquivo SPED...')
-    
+
+    workers = _resolver_num_workers(num_workers)
+    if modo_colunar and workers > 1 and not sped_compactado(caminho_arquivo_sped):
+        resultado_paralelo = _extrair_paralelo(caminho_arquivo_sped, workers, centavos, window)
+        if resultado_paralelo is not None:
+            return _montar_dataframes_colunar(*resultado_paralelo)
+
+    intervalos = _intervalos_via_indice(caminho_arquivo_sped) if usar_indice else None
+
+    if modo_colunar:
+        buffers = _novos_buffers_sped(centavos)
+        chaves_difal: set = set()
+        progresso = ProgressoLeitura(_bytes_a_ler(caminho_arquivo_sped, intervalos), window)
+        primeiro_pai = _ler_arquivo_sped(caminho_arquivo_sped, _processar_linhas_sped_colunar, *buffers, chaves_difal,
+                                         intervalos=intervalos, bruto=True, progresso=progresso)
+        progresso.concluir()
+        return _montar_dataframes_colunar(*buffers, chaves_difal, primeiro_pai)
+
     dados_completos: List[Dict[str, Any]] = []
     dados_itens_sped: List[Dict[str, Any]] = []
     dados_analiticos_sped: List[Dict[str, Any]] = []
     dados_cte_sped_d190: List[Dict[str, Any]] = []
     chaves_com_c101: set = set() # Set para evitar duplicatas
-    
-    encoding_to_try = 'latin-1'
 
-    try:
-        with open(caminho_arquivo_sped, 'r', encoding=encoding_to_try) as f:
-            _processar_linhas_sped(f, dados_completos, dados_itens_sped, dados_analiticos_sped, dados_cte_sped_d190, chaves_com_c101)
-    except UnicodeDecodeError:
-        logging.warning(f"Falha ao ler SPED com {encoding_to_try}. Tentando utf-8...")
-        encoding_to_try = 'utf-8'
-        try:
-            with open(caminho_arquivo_sped, 'r', encoding=encoding_to_try) as f:
-                _processar_linhas_sped(f, dados_completos, dados_itens_sped, dados_analiticos_sped, dados_cte_sped_d190, chaves_com_c101)
-        except Exception as e:
-            raise Exception(f"Erro inesperado ao ler SPED (utf-8): {e}")
-    except Exception as e:
-        raise Exception(f"Erro inesperado ao ler SPED: {e}")
+    _ler_arquivo_sped(caminho_arquivo_sped, _processar_linhas_sped, dados_completos, dados_itens_sped, dados_analiticos_sped, dados_cte_sped_d190, chaves_com_c101, intervalos=intervalos)
 
     # --- Criação dos DataFrames ---
     
@@ -278,5 +863,395 @@ def extrair_dados_sped(caminho_arquivo_sped: Path) -> Tuple[pd.DataFrame, pd.Dat
 
     # 5. NOVO: Chaves com DIFAL (C101)
     df_chaves_difal = pd.DataFrame(list(chaves_com_c101), columns=['CHV_NFE'])
+
+    if centavos:
+        for df in (df_sped, df_sped_itens, df_sped_analitico, df_sped_cte):
+            reais_para_centavos(df)
     
-    return df_sped, df_sped_itens, df_sped_analitico, df_sped_cte, df_chaves_difal
\ No newline at end of file
+    return _com_categorias((df_sped, df_sped_itens, df_sped_analitico, df_sped_cte, df_chaves_difal))
+
+
+# --- Reprocessamento Incremental (retificadora) ---
+# O SPED é dividido em trechos que vão de um registro pai (C100/C500/D100/D500 ou documento de
+# varejo, ver REGISTROS_SEGMENTO) ao próximo, cada um com seu hash. Ao processar outra versão do
+# mesmo CNPJ/período (ex.: retificadora), só os trechos com hash novo passam pelo parser; as linhas dos demais vêm da base salva no
+# cache na última execução.
+
+NOMES_BASE_INCREMENTAL: Tuple[str, ...] = ('segmentos', 'sped', 'itens', 'analitico', 'cte', 'alteracoes')
+VERSAO_SEGMENTOS = 2  # Incrementar quando a divisão em documentos mudar (a base salva deixa de ser comparável)
+COLUNAS_ALTERACOES = ['CHAVE', 'REGISTRO', 'SITUACAO']
+# TIPO_NOTA_SPED da primeira linha -> registro pai (define a ordem das colunas, ver _montar_dataframes_colunar)
+_PAI_POR_TIPO_NOTA = {'Energia Elétrica (C500)': 'C500', 'Comunicação (D500)': 'D500'}
+
+
+def _chave_documento(registro: str, linha_pai: bytes, encoding: str, contexto: Sequence[bytes] = ()) -> str:
+    """
+    Chave do documento aberto pelo registro pai (mesma regra do parser). Documentos de varejo
+    usam as regras de sped_layout, com as linhas de contexto do trecho (ex.: C400 do C405).
+    """
+    campos = linha_pai.decode(encoding, 'replace').strip().split('|')
+    regra = REGRAS_VAREJO.get(registro)
+    if regra is not None and regra.chave is not None:
+        if len(campos) < regra.tamanho_minimo:
+            return ''
+        ultimos: Dict[str, List[str]] = {}
+        for linha in contexto:
+            campos_contexto = linha.decode(encoding, 'replace').strip().split('|')
+            regra_contexto = REGRAS_VAREJO.get(campos_contexto[1] if len(campos_contexto) > 1 else '')
+            if regra_contexto is not None and len(campos_contexto) >= regra_contexto.tamanho_minimo:
+                ultimos[regra_contexto.registro] = campos_contexto
+        ultimos[registro] = campos
+        return regra.chave(ultimos)
+    if registro in ('C100', 'D100'):
+        return campos[9] if len(campos) > 9 else ''
+    if registro == 'C500' and len(campos) > 10:
+        return campos[10] or f"Energia_{campos[6]}_{campos[9]}"
+    if registro == 'D500' and len(campos) > 9:
+        return f"Comunicação_{campos[6]}_{campos[9]}"
+    return ''
+
+
+def _com_trechos_de_contexto(segmentos: Sequence[SegmentoSped], alterados: List[int]) -> List[int]:
+    """
+    Inclui na releitura o trecho da linha de contexto (ex.: C400) de cada documento relido que
+    depende dela (ex.: C405): o parser precisa dela antes do documento para montar a chave.
+    Os trechos de contexto não geram linhas, então relê-los não muda o resultado.
+    """
+    relidos = set(alterados)
+    ultimo_trecho: Dict[str, int] = {}
+    for i, seg in enumerate(segmentos):
+        if i in relidos:
+            relidos.update(ultimo_trecho[reg] for reg in CONTEXTO_DOCUMENTOS.get(seg.registro, ()) if reg in ultimo_trecho)
+        ultimo_trecho[seg.registro] = i
+    return sorted(relidos)
+
+
+def _identificacao_sped(caminho_arquivo_sped: Path, indice: Dict[str, Any], encoding: str) -> str:
+    """CNPJ + período do registro 0000: a retificadora tem a mesma identificação da original."""
+    for linha in iterar_linhas_registros(caminho_arquivo_sped, indice, ['0000'], encoding, 'replace'):
+        campos = linha.strip().split('|')
+        if len(campos) > 7:
+            return f"{campos[7]}_{campos[4]}_{campos[5]}"
+    return Path(caminho_arquivo_sped).stem
+
+
+def _tabela_buffer(buf: _BufferColunar) -> pd.DataFrame:
+    return buf.para_dataframe() if buf.linhas else pd.DataFrame(columns=buf.colunas)
+
+
+def _comparar_documentos(anterior: pd.DataFrame, atual: pd.DataFrame) -> pd.DataFrame:
+    """Notas incluídas, excluídas e alteradas entre duas versões, pela chave do documento."""
+    antes = anterior[anterior['CHAVE'] != ''].drop_duplicates('CHAVE', keep='last').set_index('CHAVE')
+    depois = atual[atual['CHAVE'] != ''].drop_duplicates('CHAVE', keep='last').set_index('CHAVE')
+
+    incluidas = depois.index.difference(antes.index, sort=False)
+    excluidas = antes.index.difference(depois.index, sort=False)
+    comuns = depois.index.intersection(antes.index, sort=False)
+    alteradas = comuns[depois.loc[comuns, 'HASH'].to_numpy() != antes.loc[comuns, 'HASH'].to_numpy()]
+
+    partes = [
+        pd.DataFrame({'CHAVE': chaves, 'REGISTRO': origem.loc[chaves, 'REGISTRO'].to_numpy(), 'SITUACAO': situacao})
+        for chaves, origem, situacao in (
+            (incluidas, depois, 'INCLUÍDA'), (excluidas, antes, 'EXCLUÍDA'), (alteradas, depois, 'ALTERADA')
+        )
+    ]
+    return pd.concat(partes, ignore_index=True)[COLUNAS_ALTERACOES]
+
+
+def _juntar_trechos(antiga: Optional[pd.DataFrame], nova: pd.DataFrame,
+                    fatias: List[Tuple[bool, int, int]]) -> pd.DataFrame:
+    """
+    Monta uma tabela na ordem dos trechos da nova versão. Cada fatia é (da_base, início, fim):
+    linhas [início, fim) da tabela antiga (da_base=True) ou das recém-lidas.
+    """
+    n_antiga = len(antiga) if antiga is not None else 0
+    fontes = [df for df in ((antiga.drop(columns='_SEGMENTO') if n_antiga else None), nova) if df is not None and len(df)]
+    if not fontes:
+        tabela = nova.iloc[0:0].copy()
+        tabela['_SEGMENTO'] = pd.Series(dtype='int64')
+        return tabela
+    combinada = pd.concat(fontes, ignore_index=True) if len(fontes) > 1 else fontes[0].reset_index(drop=True)
+
+    deslocamento_nova = n_antiga
+    posicoes = np.concatenate([np.arange(ini, fim) + (0 if da_base else deslocamento_nova)
+                               for da_base, ini, fim in fatias] or [np.arange(0)])
+    tabela = combinada.take(posicoes).reset_index(drop=True)
+    tabela['_SEGMENTO'] = np.repeat(np.arange(len(fatias)), [fim - ini for _, ini, fim in fatias])
+    return tabela
+
+
+def _processar_trechos_sped(caminho_arquivo_sped: Path, intervalos: List[Tuple[int, int]], encoding: str,
+                            centavos: bool = False) -> Tuple[Any, ...]:
+    """
+    Executado em um processo filho: processa um grupo de trechos do modo incremental e devolve
+    os buffers parciais, as marcas de cada trecho (relativas ao grupo) e as linhas lidas.
+    """
+    buffers = _novos_buffers_sped(centavos)
+    chaves_difal: set = set()
+    marcas: List[Tuple[int, int, int, int]] = []
+    contador = ProgressoLeitura(0, intervalo_log=None)
+    _ler_arquivo_sped(caminho_arquivo_sped, _processar_linhas_sped_colunar, *buffers, chaves_difal, marcas,
+                      intervalos=intervalos, encoding=encoding, bruto=True, progresso=contador)
+    return (*buffers, chaves_difal, marcas, contador.linhas)
+
+
+def _agrupar_trechos(segmentos: Sequence[SegmentoSped], alterados: List[int], num_grupos: int) -> List[List[int]]:
+    """
+    Divide os trechos alterados em até num_grupos grupos de tamanho parecido, na ordem do arquivo.
+    Um grupo só começa em trecho cuja chave não depende de outro (ex.: nunca entre o C400 e o
+    C405), já que cada processo começa com o parser zerado.
+    """
+    tamanhos = [sum(fim - ini for ini, fim in segmentos[i].intervalos) for i in alterados]
+    alvo = sum(tamanhos) / max(num_grupos, 1)
+    grupos: List[List[int]] = []
+    acumulado = 0
+    for i, tamanho in zip(alterados, tamanhos):
+        registro = segmentos[i].registro
+        if not grupos or (acumulado >= alvo and registro and not CONTEXTO_DOCUMENTOS.get(registro)):
+            grupos.append([])
+            acumulado = 0
+        grupos[-1].append(i)
+        acumulado += tamanho
+    return grupos
+
+
+def _ler_trechos_alterados(caminho_arquivo_sped: Path, segmentos: Sequence[SegmentoSped], alterados: List[int],
+                           encoding: str, num_workers: int, centavos: bool = False,
+                           window: Any = None) -> Optional[Tuple[Any, ...]]:
+    """
+    Passa os trechos alterados pelo parser e devolve (buffers, chaves_difal, marcas), com uma
+    marca por trecho (início das linhas dele em cada buffer). Grupos de trechos vão para
+    processos filhos quando há mais de um processo e bytes suficientes (TAMANHO_MINIMO_PARALELO),
+    como no modo paralelo de extrair_dados_sped. None se as marcas não conferem com os trechos.
+    """
+    buffers = _novos_buffers_sped(centavos)
+    chaves_difal: set = set()
+    marcas: List[Tuple[int, int, int, int]] = []
+    if not alterados:
+        return buffers, chaves_difal, marcas
+
+    intervalos_alterados = [iv for i in alterados for iv in segmentos[i].intervalos]
+    bytes_alterados = _bytes_a_ler(caminho_arquivo_sped, intervalos_alterados)
+    grupos = _agrupar_trechos(segmentos, alterados, num_workers * 4) \
+        if num_workers > 1 and bytes_alterados >= TAMANHO_MINIMO_PARALELO else [alterados]
+    progresso = ProgressoLeitura(bytes_alterados, window)
+
+    def conferir(grupo: List[int], marcas_grupo: List[Tuple[int, int, int, int]]) -> bool:
+        if not segmentos[grupo[0]].registro:
+            marcas_grupo.insert(0, (0, 0, 0, 0))  # Trecho antes do primeiro registro pai
+        return len(marcas_grupo) == len(grupo)
+
+    if len(grupos) <= 1:
+        _ler_arquivo_sped(caminho_arquivo_sped, _processar_linhas_sped_colunar, *buffers, chaves_difal, marcas,
+                          intervalos=intervalos_alterados, encoding=encoding, bruto=True, progresso=progresso)
+        progresso.concluir()
+        return (buffers, chaves_difal, marcas) if conferir(alterados, marcas) else None
+
+    logging.info(f"SPED incremental: {len(alterados)} trechos em {len(grupos)} grupos, {num_workers} processos.")
+    intervalos_grupos = [[iv for i in grupo for iv in segmentos[i].intervalos] for grupo in grupos]
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        resultados = executor.map(_processar_trechos_sped, [caminho_arquivo_sped] * len(grupos), intervalos_grupos,
+                                  [encoding] * len(grupos), [centavos] * len(grupos))
+        # map() devolve na ordem dos grupos, que é a ordem dos trechos no arquivo
+        for grupo, intervalos_grupo, (*parciais, chaves_grupo, marcas_grupo, linhas_grupo) in zip(
+                grupos, intervalos_grupos, resultados):
+            if not conferir(grupo, marcas_grupo):
+                return None
+            deslocamento = [buf.linhas for buf in buffers]
+            marcas.extend(tuple(m + d for m, d in zip(marca, deslocamento)) for marca in marcas_grupo)
+            for buf, parcial in zip(buffers, parciais):
+                buf.estender(parcial)
+            chaves_difal |= chaves_grupo
+            progresso.somar(sum(fim - ini for ini, fim in intervalos_grupo), linhas_grupo)
+    progresso.concluir()
+    return buffers, chaves_difal, marcas
+
+
+def extrair_dados_sped_incremental(
+    caminho_arquivo_sped: Path, pasta_cache: Path,
+    tamanho_maximo_cache_mb: float = TAMANHO_MAXIMO_PADRAO_MB, centavos: bool = False, window: Any = None,
+    num_workers: Optional[int] = 1
+) -> Tuple[Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame], pd.DataFrame]:
+    """
+    Igual a extrair_dados_sped, mas reaproveita os documentos que não mudaram desde a última
+    execução do mesmo CNPJ/período. Retorna (os 5 DataFrames, df_alteracoes), onde
+    df_alteracoes lista as notas INCLUÍDAS, EXCLUÍDAS e ALTERADAS em relação à versão anterior
+    (vazio na primeira execução).
+
+    Colunas numéricas podem vir como float64 onde a leitura completa daria int64 (mesmos valores).
+    centavos: como em extrair_dados_sped (a base do modo centavos é guardada à parte).
+    window: como em extrair_dados_sped; o progresso conta só os trechos que passam pelo parser.
+    num_workers: como em extrair_dados_sped. Na primeira execução (sem base) todos os trechos
+    passam pelo parser; com muitos bytes alterados eles são divididos entre os processos.
+    """
+    alteracoes_vazia = pd.DataFrame(columns=COLUNAS_ALTERACOES)
+    workers = _resolver_num_workers(num_workers)
+    if sped_compactado(caminho_arquivo_sped):
+        logging.info("SPED compactado: modo incremental indisponível (sem índice). Lendo o arquivo inteiro.")
+        return _extrair_dados_sped(caminho_arquivo_sped, True, False, workers, centavos, window), alteracoes_vazia
+    try:
+        indice = obter_indice_sped(caminho_arquivo_sped)
+    except OSError as e:
+        logging.warning(f"Modo incremental indisponível (falha ao indexar: {e}). Lendo o arquivo inteiro.")
+        return _extrair_dados_sped(caminho_arquivo_sped, True, False, workers, centavos, window), alteracoes_vazia
+    intervalos = intervalos_dos_blocos(indice, BLOCOS_LIDOS)
+    if not intervalos:
+        return _extrair_dados_sped(caminho_arquivo_sped, True, True, workers, centavos, window), alteracoes_vazia
+
+    encoding = detectar_encoding_sped(caminho_arquivo_sped)
+    nome_base = f"base_{_identificacao_sped(caminho_arquivo_sped, indice, encoding)}_v{VERSAO_CACHE}s{VERSAO_SEGMENTOS}{'_centavos' if centavos else ''}"
+    base = carregar_tabelas_cache(pasta_cache, nome_base, NOMES_BASE_INCREMENTAL)
+
+    segmentos = segmentar_por_documento(caminho_arquivo_sped, indice, intervalos, REGISTROS_SEGMENTO, CONTEXTO_DOCUMENTOS)
+    hashes = [seg.hash for seg in segmentos]
+    ordem_anterior: Dict[str, int] = {}
+    if base is not None:
+        for ordem, hash_seg in zip(base['segmentos']['ORDEM'], base['segmentos']['HASH']):
+            ordem_anterior.setdefault(hash_seg, int(ordem))
+    alterados = [i for i, h in enumerate(hashes) if h not in ordem_anterior]
+    logging.info(f"SPED incremental: {len(segmentos) - len(alterados)} de {len(segmentos)} documentos reaproveitados.")
+    alterados = _com_trechos_de_contexto(segmentos, alterados)
+
+    # 1. Parser só nos trechos novos/alterados, marcando onde começa cada documento nos buffers
+    lidos = _ler_trechos_alterados(caminho_arquivo_sped, segmentos, alterados, encoding, workers, centavos, window)
+    if lidos is None:
+        logging.warning("SPED incremental: trechos não conferem com os registros pai. Lendo o arquivo inteiro.")
+        return _extrair_dados_sped(caminho_arquivo_sped, True, True, workers, centavos, window), alteracoes_vazia
+    buffers, chaves_difal, marcas = lidos
+    marcas.append(tuple(buf.linhas for buf in buffers))
+
+    novas = [_tabela_buffer(buf) for buf in buffers]
+    novas[0]['_DIFAL'] = novas[0]['CHV_NFE'].isin(chaves_difal)
+
+    # 2. Cada tabela na ordem dos trechos da nova versão (um único take por tabela)
+    pos_alterado = {i: k for k, i in enumerate(alterados)}
+    tabelas: Dict[str, pd.DataFrame] = {}
+    for t, nome in enumerate(('sped', 'itens', 'analitico', 'cte')):
+        antiga = base[nome] if base is not None else None
+        if antiga is not None:
+            ordens = np.arange(len(base['segmentos']))
+            seg_antigo = antiga['_SEGMENTO'].to_numpy()
+            inicios = np.searchsorted(seg_antigo, ordens, side='left')
+            fins = np.searchsorted(seg_antigo, ordens, side='right')
+        fatias: List[Tuple[bool, int, int]] = []
+        for i, hash_seg in enumerate(hashes):
+            k = pos_alterado.get(i)
+            if k is not None:
+                fatias.append((False, marcas[k][t], marcas[k + 1][t]))
+            else:
+                o = ordem_anterior[hash_seg]
+                fatias.append((True, int(inicios[o]), int(fins[o])))
+        tabelas[nome] = _juntar_trechos(antiga, novas[t], fatias)
+
+    # 3. Relatório de alterações, pela chave de cada documento
+    tabelas['segmentos'] = pd.DataFrame({
+        'ORDEM': np.arange(len(segmentos)),
+        'HASH': hashes,
+        'REGISTRO': [seg.registro for seg in segmentos],
+        'CHAVE': [_chave_documento(seg.registro, seg.linha_pai, encoding, seg.contexto) for seg in segmentos],
+    })
+    if base is None:
+        df_alteracoes = alteracoes_vazia
+    elif not alterados and base['segmentos']['HASH'].tolist() == hashes:
+        df_alteracoes = base['alteracoes']  # Mesmo arquivo da última execução: mantém o relatório dela
+    else:
+        df_alteracoes = _comparar_documentos(base['segmentos'], tabelas['segmentos'])
+        contagem = df_alteracoes['SITUACAO'].value_counts()
+        logging.info(
+            f"SPED incremental: {contagem.get('INCLUÍDA', 0)} nota(s) incluída(s), "
+            f"{contagem.get('EXCLUÍDA', 0)} excluída(s) e {contagem.get('ALTERADA', 0)} alterada(s) "
+            "em relação à versão anterior."
+        )
+    tabelas['alteracoes'] = df_alteracoes
+
+    salvar_tabelas_cache(pasta_cache, nome_base, tabelas, tamanho_maximo_cache_mb)
+    return _montar_dataframes_incremental(tabelas), df_alteracoes
+
+
+def _montar_dataframes_incremental(
+    tabelas: Dict[str, pd.DataFrame]
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Mesmos passos finais de _montar_dataframes_colunar, sobre as tabelas já montadas."""
+    df_sped = tabelas['sped'].drop(columns=['_SEGMENTO'])
+    chaves_difal = df_sped.loc[df_sped['_DIFAL'].astype(bool), 'CHV_NFE'].unique().tolist()
+    df_sped = df_sped.drop(columns=['_DIFAL'])
+    if df_sped.empty:
+        df_sped = pd.DataFrame()
+    else:
+        if _PAI_POR_TIPO_NOTA.get(df_sped['TIPO_NOTA_SPED'].iloc[0]) in ('C500', 'D500'):
+            df_sped = df_sped[COLUNAS_SPED[:11] + ['CFOP_SPED', 'TIPO_NOTA_SPED']]
+        df_sped.drop_duplicates(subset=['CHV_NFE'], keep='first', inplace=True)
+
+    df_sped_itens = tabelas['itens'].drop(columns=['_SEGMENTO'])
+    if df_sped_itens.empty:
+        df_sped_itens = pd.DataFrame()
+    else:
+        df_sped_itens.drop_duplicates(subset=['CHV_NFE', 'N_ITEM_SPED'], keep='first', inplace=True)
+
+    df_sped_analitico = tabelas['analitico'].drop(columns=['_SEGMENTO'])
+    df_sped_cte = tabelas['cte'].drop(columns=['_SEGMENTO'])
+    return _com_categorias((
+        df_sped,
+        df_sped_itens,
+        df_sped_analitico if not df_sped_analitico.empty else pd.DataFrame(),
+        df_sped_cte if not df_sped_cte.empty else pd.DataFrame(),
+        pd.DataFrame(chaves_difal, columns=['CHV_NFE']),
+    ))
+
+# --- Extração Genérica (tabela de leiaute) ---
+def extrair_registros_sped(caminho_arquivo_sped: Path, registros: Iterable[str]) -> Dict[str, pd.DataFrame]:
+    """
+    Extrai qualquer registro descrito em sped_layout.LEIAUTE_REGISTROS (ex.: '0200', 'E110',
+    'H010', 'K200', 'C800') em um DataFrame por registro, numa única leitura dos blocos
+    necessários. Cada linha recebe também os campos herdados do registro pai (ex.: H010
+    traz o DT_INV do H005). Valores numéricos não são arredondados.
+    """
+    registros = list(registros)
+    desconhecidos = [reg for reg in registros if reg not in LEIAUTE_REGISTROS]
+    if desconhecidos:
+        raise Exception(f"Registros sem leiaute cadastrado em sped_layout: {', '.join(desconhecidos)}")
+
+    # Pais também precisam ser lidos para preencher os campos herdados
+    lidos = set(registros)
+    pendentes = list(registros)
+    while pendentes:
+        leiaute = LEIAUTE_REGISTROS[pendentes.pop()]
+        if leiaute.herda and leiaute.pai and leiaute.pai not in lidos:
+            lidos.add(leiaute.pai)
+            pendentes.append(leiaute.pai)
+    pais = {LEIAUTE_REGISTROS[reg].pai for reg in lidos if LEIAUTE_REGISTROS[reg].herda}
+
+    extratores = {reg.encode('ascii'): (reg, extrator_registro(reg)) for reg in lidos}
+    buffers = {reg: _BufferColunar(*colunas_registro(reg), casas_decimais=None) for reg in registros}
+    colunas = {reg: colunas_registro(reg)[0] for reg in lidos}
+    ultimos: Dict[str, Dict[str, str]] = {}
+
+    intervalos = None
+    try:
+        if not sped_compactado(caminho_arquivo_sped):
+            intervalos = intervalos_dos_blocos(obter_indice_sped(caminho_arquivo_sped), {reg[0] for reg in lidos})
+    except OSError as e:
+        logging.warning(f"Não foi possível indexar o SPED ({e}). Lendo o arquivo inteiro.")
+    encoding = detectar_encoding_sped(caminho_arquivo_sped)
+
+    with closing(iterar_linhas_brutas(caminho_arquivo_sped, intervalos)) as linhas:
+        for linha in linhas:
+            item = extratores.get(linha[1:5] if linha[:1] == b'|' else linha.strip()[1:5])
+            if item is None:
+                continue
+            reg, extrair = item
+            campos = linha.decode(encoding, 'replace').strip().split('|')
+            if len(campos) < 2 or campos[1] != reg:
+                continue
+            leiaute = LEIAUTE_REGISTROS[reg]
+            pai = ultimos.get(leiaute.pai, {}) if leiaute.herda else {}
+            valores = tuple(pai.get(c, '') for c in leiaute.herda) + extrair(campos)
+            if reg in pais:
+                ultimos[reg] = dict(zip(colunas[reg], valores))
+            if reg in buffers:
+                buffers[reg].adicionar(valores)
+
+    return {
+        reg: buf.para_dataframe() if buf.linhas else pd.DataFrame(columns=buf.colunas)
+        for reg, buf in buffers.items()
+    }
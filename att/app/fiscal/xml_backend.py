@@ -0,0 +1,72 @@
+import logging
+import xml.etree.ElementTree as ET
+from typing import Any, Iterator, Optional, Tuple
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # lxml é opcional: sem ele tudo roda no ElementTree da biblioteca padrão
+    lxml_etree = None
+
+# Backend de leitura dos XMLs (xml_parser, usado pela conciliação e pelo Invest). O ElementTree
+# da biblioteca padrão é o padrão; o lxml é opcional (PERFORMANCE.XML_BACKEND = 'lxml' ou 'auto').
+# Os dois produzem os mesmos elementos para o que é lido (tag com '{namespace}', text, attrib, find/iter).
+# Compare os dois na máquina do usuário com: python -m app.fiscal.xml_benchmark
+# (nas leituras atuais, que passam cada elemento pelo Python, o lxml não é mais rápido).
+
+BACKEND_LXML = 'lxml'
+BACKEND_ELEMENTTREE = 'elementtree'
+
+# Erros de XML malformado nos dois backends
+ERROS_PARSE: Tuple[type, ...] = (ET.ParseError,) + ((lxml_etree.XMLSyntaxError,) if lxml_etree is not None else ())
+
+_backend_atual = BACKEND_ELEMENTTREE
+
+
+def lxml_disponivel() -> bool:
+    return lxml_etree is not None
+
+
+def backend_xml() -> str:
+    """Nome do backend em uso ('lxml' ou 'elementtree')."""
+    return _backend_atual
+
+
+def definir_backend_xml(nome: Optional[str]) -> str:
+    """
+    Escolhe o backend: 'auto' (ou vazio) usa lxml se disponível; 'lxml' sem o pacote
+    instalado volta para o ElementTree com um aviso. Retorna o backend efetivo.
+    """
+    global _backend_atual
+    nome = (nome or 'auto').lower()
+    if nome not in ('auto', BACKEND_LXML, BACKEND_ELEMENTTREE):
+        logging.warning(f"Backend de XML desconhecido '{nome}'. Usando o automático.")
+        nome = 'auto'
+    if nome == BACKEND_LXML and lxml_etree is None:
+        logging.warning("lxml não instalado: XMLs serão lidos com o ElementTree.")
+    if nome == BACKEND_ELEMENTTREE or lxml_etree is None:
+        _backend_atual = BACKEND_ELEMENTTREE
+    else:
+        _backend_atual = BACKEND_LXML
+    return _backend_atual
+
+
+def posicao_erro(erro: Exception) -> Optional[Tuple[int, int, bool]]:
+    """
+    (linha a partir de 1, coluna a partir de 0, coluna contada em caracteres?) de um erro de
+    ERROS_PARSE. O ElementTree conta a coluna em caracteres; o lxml, em bytes e a partir de 1.
+    """
+    posicao = getattr(erro, 'position', None)
+    if not posicao or posicao[0] is None or posicao[1] is None:
+        return None
+    linha, coluna = posicao
+    if lxml_etree is not None and isinstance(erro, lxml_etree.XMLSyntaxError):
+        return linha, max(coluna - 1, 0), False
+    return linha, coluna, True
+
+
+def iterparse(fonte: Any, events: Tuple[str, ...] = ('end',)) -> Iterator[Tuple[str, Any]]:
+    """Eventos (evento, elemento) do arquivo, como ET.iterparse."""
+    if _backend_atual == BACKEND_LXML:
+        # Sem resolver entidades externas (mesmo comportamento do ElementTree)
+        return lxml_etree.iterparse(fonte, events=events, resolve_entities=False, no_network=True)
+    return ET.iterparse(fonte, events=events)
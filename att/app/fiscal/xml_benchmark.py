@@ -0,0 +1,135 @@
+"""
+Benchmark dos backends de XML (lxml x ElementTree) em um corpus sintético de NF-e/CT-e.
+
+Uso (na pasta att/):
+    python -m app.fiscal.xml_benchmark --arquivos 2000 --itens 8
+
+Mede arquivos/s de xml_parser (extração arquivo a arquivo) e de invest_logic.ler_xmls_diretamente
+(a mesma extração, pela leitura da pasta, até o DataFrame do Invest) em cada backend disponível
+e confere se os dois backends produzem o mesmo resultado.
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from . import xml_parser
+from .xml_backend import BACKEND_ELEMENTTREE, BACKEND_LXML, definir_backend_xml, lxml_disponivel
+
+NS_NFE_URI = 'http://www.portalfiscal.inf.br/nfe'
+NS_CTE_URI = 'http://www.portalfiscal.inf.br/cte'
+
+
+def _valor(rnd: random.Random) -> str:
+    return f"{rnd.uniform(0, 5000):.2f}"
+
+
+def _xml_nfe(rnd: random.Random, chave: str, numero: int, itens: int) -> str:
+    dets = []
+    for n in range(1, itens + 1):
+        icms = (f"<ICMSSN101><orig>0</orig><CSOSN>101</CSOSN><pCredSN>1.25</pCredSN><vCredICMSSN>{_valor(rnd)}</vCredICMSSN></ICMSSN101>"
+                if rnd.random() < 0.2 else
+                f"<ICMS00><orig>0</orig><CST>00</CST><vBC>{_valor(rnd)}</vBC><pICMS>18.00</pICMS><vICMS>{_valor(rnd)}</vICMS></ICMS00>")
+        dets.append(
+            f'<det nItem="{n}"><prod><cProd>P{n}</cProd><xProd>Produto {n}</xProd><NCM>22030000</NCM><CEST>0300100</CEST>'
+            f'<CFOP>{rnd.choice(["5102", "6102", "5405"])}</CFOP><uCom>UN</uCom><qCom>{rnd.randint(1, 20)}.0000</qCom>'
+            f'<vUnCom>{rnd.uniform(1, 100):.10f}</vUnCom><vProd>{_valor(rnd)}</vProd><vFrete>0.00</vFrete></prod>'
+            f'<imposto><ICMS>{icms}</ICMS><IPI><cEnq>999</cEnq><IPITrib><CST>50</CST><vIPI>{_valor(rnd)}</vIPI></IPITrib></IPI>'
+            f'<PIS><PISAliq><CST>01</CST><vBC>{_valor(rnd)}</vBC><pPIS>1.65</pPIS><vPIS>{_valor(rnd)}</vPIS></PISAliq></PIS>'
+            f'<COFINS><COFINSAliq><CST>01</CST><vBC>{_valor(rnd)}</vBC><pCOFINS>7.60</pCOFINS><vCOFINS>{_valor(rnd)}</vCOFINS></COFINSAliq></COFINS>'
+            f'</imposto></det>'
+        )
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><nfeProc xmlns="{NS_NFE_URI}" versao="4.00"><NFe>'
+        f'<infNFe Id="NFe{chave}" versao="4.00"><ide><nNF>{numero}</nNF><dhEmi>2024-01-15T10:00:00-03:00</dhEmi>'
+        f'<finNFe>1</finNFe></ide><emit><CNPJ>12345678000199</CNPJ></emit>'
+        f'<dest><CNPJ>98765432000100</CNPJ><enderDest><UF>SP</UF></enderDest></dest>{"".join(dets)}'
+        f'<total><ICMSTot><vBC>{_valor(rnd)}</vBC><vICMS>{_valor(rnd)}</vICMS><vST>0.00</vST><vFCPST>0.00</vFCPST>'
+        f'<vIPI>{_valor(rnd)}</vIPI><vIPIDevol>0.00</vIPIDevol><vNF>{_valor(rnd)}</vNF></ICMSTot></total></infNFe></NFe>'
+        f'<protNFe><infProt><chNFe>{chave}</chNFe><nProt>135240000000001</nProt></infProt></protNFe></nfeProc>'
+    )
+
+
+def _xml_cte(rnd: random.Random, chave: str, numero: int) -> str:
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><cteProc xmlns="{NS_CTE_URI}" versao="4.00"><CTe>'
+        f'<infCte Id="CTe{chave}" versao="4.00"><ide><CFOP>6353</CFOP><nCT>{numero}</nCT><xMunIni>A</xMunIni>'
+        f'<xMunFim>B</xMunFim><toma3><toma>0</toma></toma3></ide><emit><CNPJ>11111111000111</CNPJ><IE>1</IE>'
+        f'<enderEmi><UF>SP</UF></enderEmi></emit><rem><CNPJ>22222222000122</CNPJ><xNome>Rem</xNome></rem>'
+        f'<vPrest><vTPrest>{_valor(rnd)}</vTPrest></vPrest><imp><ICMS><ICMS00><CST>00</CST><vBC>{_valor(rnd)}</vBC>'
+        f'<pICMS>12.00</pICMS><vICMS>{_valor(rnd)}</vICMS></ICMS00></ICMS></imp>'
+        f'<infCTeNorm><infCarga><proPred>Carga</proPred></infCarga></infCTeNorm></infCte></CTe></cteProc>'
+    )
+
+
+def gerar_corpus(pasta: Path, arquivos: int, itens: int, semente: int = 1) -> List[Path]:
+    """Gera 'arquivos' XMLs (90% NF-e com 'itens' itens, 10% CT-e)."""
+    rnd = random.Random(semente)
+    caminhos = []
+    for n in range(arquivos):
+        chave = ''.join(rnd.choice('0123456789') for _ in range(44))
+        if n % 10 == 9:
+            caminho, conteudo = pasta / f"{chave}-cte.xml", _xml_cte(rnd, chave, n)
+        else:
+            caminho, conteudo = pasta / f"{chave}-nfe.xml", _xml_nfe(rnd, chave, n, itens)
+        caminho.write_text(conteudo, encoding='utf-8')
+        caminhos.append(caminho)
+    return caminhos
+
+
+def _medir(funcao: Callable[[], object], arquivos: int, repeticoes: int):
+    melhor = float('inf')
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return arquivos / melhor, resultado
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--arquivos', type=int, default=2000)
+    parser.add_argument('--itens', type=int, default=8, help='Itens por NF-e')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    backends = [BACKEND_ELEMENTTREE] + ([BACKEND_LXML] if lxml_disponivel() else [])
+    if not lxml_disponivel():
+        print("lxml não instalado: medindo apenas o ElementTree.")
+
+    try:
+        from .invest_logic import ler_xmls_diretamente
+    except ImportError as e:  # invest_logic depende de FreeSimpleGUI/openpyxl
+        print(f"invest_logic indisponível ({e}): medindo apenas xml_parser.")
+        ler_xmls_diretamente = None
+
+    with tempfile.TemporaryDirectory() as pasta_temp:
+        pasta = Path(pasta_temp)
+        caminhos = gerar_corpus(pasta, args.arquivos, args.itens)
+        print(f"Corpus: {args.arquivos} arquivos ({args.itens} itens por NF-e)\n")
+        print(f"{'backend':<12} {'xml_parser (arq/s)':>20} {'invest_logic (arq/s)':>22}")
+
+        resultados: Dict[str, tuple] = {}
+        for backend in backends:
+            definir_backend_xml(backend)
+            vazao_parser, saida_parser = _medir(
+                lambda: [xml_parser._extrair_arquivo_xml(c) for c in caminhos], len(caminhos), args.repeticoes)
+            vazao_invest, saida_invest = (float('nan'), None)
+            if ler_xmls_diretamente is not None:
+                vazao_invest, saida_invest = _medir(
+                    lambda: ler_xmls_diretamente(pasta, None), len(caminhos), args.repeticoes)
+            resultados[backend] = (saida_parser, saida_invest)
+            print(f"{backend:<12} {vazao_parser:>20,.0f} {vazao_invest:>22,.0f}")
+
+        if len(resultados) == 2:
+            (parser_et, invest_et), (parser_lxml, invest_lxml) = resultados.values()
+            iguais = parser_et == parser_lxml and (invest_et is None or invest_et.equals(invest_lxml))
+            print(f"\nResultados idênticos entre os backends: {'sim' if iguais else 'NÃO'}")
+        definir_backend_xml('auto')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import logging
+import os
+import pickle
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Cache em disco do resultado da extração de cada XML (xml_parser._extrair_arquivo_xml), em SQLite.
+# Cada linha é um arquivo, identificado pelo caminho absoluto e validado por tamanho + mtime:
+# um XML alterado ou substituído é lido de novo (XMLs dentro de .zip: validados pelo .zip). A coluna 'acesso' marca o último uso
+# (política LRU pelo tamanho total dos resultados guardados).
+
+VERSAO_CACHE = 5  # Incrementar sempre que a extração dos XMLs mudar (colunas, regras, situações)
+NOME_ARQUIVO_CACHE = 'xml_cache.sqlite'
+TAMANHO_MAXIMO_PADRAO_MB = 512
+TAMANHO_LOTE_GRAVACAO = 1000
+
+# Situações que dependem só do conteúdo do arquivo. 'erro' (exceção inesperada, ex.: arquivo
+# bloqueado) não é guardado: pode não se repetir na próxima leitura. XMLs malformados
+# ('parse_error') ficam na quarentena (xml_quarentena.py), que não os perde no limite de tamanho.
+SITUACOES_CACHEAVEIS = frozenset({'ok', 'ignorado', 'chave_invalida', 'erro_cte'})
+
+_SQL_CRIAR = """
+CREATE TABLE IF NOT EXISTS xml_extraido (
+    caminho   TEXT PRIMARY KEY,
+    tamanho   INTEGER NOT NULL,
+    mtime_ns  INTEGER NOT NULL,
+    versao    INTEGER NOT NULL,
+    acesso    REAL NOT NULL,
+    bytes     INTEGER NOT NULL,
+    resultado BLOB NOT NULL
+)"""
+
+
+def _abrir(caminho_banco: Path) -> sqlite3.Connection:
+    caminho_banco.parent.mkdir(parents=True, exist_ok=True)
+    conexao = sqlite3.connect(str(caminho_banco), timeout=30)
+    conexao.execute("PRAGMA auto_vacuum = INCREMENTAL")  # Só vale na criação do banco
+    conexao.execute("PRAGMA journal_mode = WAL")          # Leitores não bloqueiam a gravação
+    conexao.execute(_SQL_CRIAR)
+    conexao.execute("CREATE INDEX IF NOT EXISTS ix_xml_extraido_acesso ON xml_extraido (acesso)")
+    return conexao
+
+
+def identificar_arquivo_xml(arquivo: Any) -> Tuple[str, str]:
+    """
+    (chave no cache, arquivo no disco cujo tamanho/mtime valida a entrada). Para XML dentro
+    de .zip (xml_zip.XmlEmZip) a chave inclui o caminho interno e quem valida é o .zip.
+    """
+    no_disco = os.path.abspath(getattr(arquivo, 'arquivo_zip', arquivo))
+    membros = getattr(arquivo, 'membros', ())
+    return '!'.join((no_disco,) + tuple(membros)), no_disco
+
+
+class CacheXml:
+    """
+    Uso em uma leitura de pasta: buscar() para cada arquivo (resultado guardado ou None),
+    guardar() para os que foram lidos e fechar() no fim, que grava e aplica o limite de tamanho.
+    Qualquer falha do SQLite só gera aviso e desativa o cache até o fim da leitura.
+    """
+
+    def __init__(self, pasta_cache: Path, tamanho_maximo_mb: float = TAMANHO_MAXIMO_PADRAO_MB,
+                 atualizar: bool = False):
+        self.tamanho_maximo = int(tamanho_maximo_mb * 1024 * 1024)
+        self.atualizar = atualizar  # True: ignora o que está guardado, mas grava as novas leituras
+        self.acertos = 0
+        self._assinaturas: Dict[str, Tuple[int, int]] = {}
+        self._acessos: List[Tuple[float, str]] = []
+        self._novos: List[Tuple[Any, ...]] = []
+        self._conexao: Optional[sqlite3.Connection] = None
+        try:
+            self._conexao = _abrir(Path(pasta_cache) / NOME_ARQUIVO_CACHE)
+        except (sqlite3.Error, OSError) as e:
+            logging.warning(f"Cache dos XMLs indisponível ({e}). Lendo todos os arquivos.")
+
+    def _falhar(self, e: Exception) -> None:
+        logging.warning(f"Falha no cache dos XMLs ({e}). Cache desativado nesta leitura.")
+        try:
+            self._conexao.close()
+        except Exception:
+            pass
+        self._conexao = None
+
+    def buscar(self, arquivo: Path) -> Optional[Tuple[Any, ...]]:
+        """Campos do resultado guardado para o arquivo, se ele não mudou desde a gravação."""
+        if self._conexao is None:
+            return None
+        caminho, no_disco = identificar_arquivo_xml(arquivo)
+        try:
+            info = os.stat(no_disco)
+        except OSError:
+            return None  # A leitura do arquivo vai registrar o erro
+        self._assinaturas[caminho] = (info.st_size, info.st_mtime_ns)
+        if self.atualizar:
+            return None
+        try:
+            linha = self._conexao.execute(
+                "SELECT resultado FROM xml_extraido WHERE caminho = ? AND tamanho = ? AND mtime_ns = ? AND versao = ?",
+                (caminho, info.st_size, info.st_mtime_ns, VERSAO_CACHE)).fetchone()
+        except sqlite3.Error as e:
+            self._falhar(e)
+            return None
+        if linha is None:
+            return None
+        try:
+            campos = pickle.loads(zlib.decompress(linha[0]))
+        except Exception:
+            return None  # Registro ilegível: o arquivo é lido e o registro substituído
+        self.acertos += 1
+        self._acessos.append((time.time(), caminho))
+        return campos
+
+    def guardar(self, arquivo: Path, situacao: str, campos: Tuple[Any, ...]) -> None:
+        """Registra o resultado de um arquivo lido nesta execução (gravado em lotes)."""
+        if self._conexao is None or situacao not in SITUACOES_CACHEAVEIS:
+            return
+        caminho, _ = identificar_arquivo_xml(arquivo)
+        assinatura = self._assinaturas.get(caminho)
+        if assinatura is None:
+            return  # Sem o stat tirado antes da leitura não há como validar depois
+        dados = zlib.compress(pickle.dumps(tuple(campos), protocol=pickle.HIGHEST_PROTOCOL), 1)
+        self._novos.append((caminho, assinatura[0], assinatura[1], VERSAO_CACHE, time.time(), len(dados), dados))
+        if len(self._novos) >= TAMANHO_LOTE_GRAVACAO:
+            self._gravar()
+
+    def _gravar(self) -> None:
+        if self._conexao is None:
+            return
+        try:
+            with self._conexao:
+                if self._novos:
+                    self._conexao.executemany(
+                        "INSERT OR REPLACE INTO xml_extraido VALUES (?, ?, ?, ?, ?, ?, ?)", self._novos)
+                if self._acessos:
+                    self._conexao.executemany("UPDATE xml_extraido SET acesso = ? WHERE caminho = ?", self._acessos)
+        except sqlite3.Error as e:
+            self._falhar(e)
+        self._novos.clear()
+        self._acessos.clear()
+
+    def fechar(self) -> None:
+        """Grava o que falta, aplica o limite de tamanho (LRU) e fecha o banco."""
+        if self._conexao is None:
+            return
+        self._gravar()
+        if self._conexao is None:
+            return
+        try:
+            self._aplicar_limite_lru()
+            self._conexao.close()
+        except sqlite3.Error as e:
+            self._falhar(e)
+        self._conexao = None
+
+    def _aplicar_limite_lru(self) -> None:
+        """Remove os registros usados há mais tempo até o total caber no limite."""
+        total = self._conexao.execute("SELECT COALESCE(SUM(bytes), 0) FROM xml_extraido").fetchone()[0]
+        if total <= self.tamanho_maximo:
+            return
+        excesso = total - self.tamanho_maximo
+        remover: List[Tuple[str]] = []
+        for caminho, tamanho in self._conexao.execute("SELECT caminho, bytes FROM xml_extraido ORDER BY acesso"):
+            if excesso <= 0:
+                break
+            remover.append((caminho,))
+            excesso -= tamanho
+        with self._conexao:
+            self._conexao.executemany("DELETE FROM xml_extraido WHERE caminho = ?", remover)
+        self._conexao.execute("PRAGMA incremental_vacuum")
+        logging.info(f"Cache dos XMLs: {len(remover)} registros removidos "
+                     f"(limite de {self.tamanho_maximo // (1024 * 1024)} MB).")
+
+
+def limpar_cache_xml(pasta_cache: Path) -> int:
+    """Apaga o cache dos XMLs. Retorna quantos arquivos foram removidos do cache."""
+    caminho_banco = Path(pasta_cache) / NOME_ARQUIVO_CACHE
+    if not caminho_banco.exists():
+        return 0
+    try:
+        conexao = _abrir(caminho_banco)
+        with conexao:
+            removidos = conexao.execute("DELETE FROM xml_extraido").rowcount
+        conexao.execute("VACUUM")
+        conexao.close()
+    except sqlite3.Error as e:
+        raise Exception(f"Não foi possível limpar o cache dos XMLs: {e}")
+    return max(removidos, 0)
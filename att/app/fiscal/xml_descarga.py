@@ -0,0 +1,108 @@
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+# Linhas extraídas dos XMLs com memória limitada: ao chegar a 'limite_linhas' linhas em memória,
+# o bloco é gravado como um row group de um arquivo Parquet temporário e a lista é esvaziada.
+# No fim, o DataFrame é montado a partir do arquivo (colunar, bem menor que as tuplas do Python).
+# Sem limite (0) ou sem pyarrow, tudo fica em memória como antes.
+
+_aviso_pyarrow_emitido = False
+
+
+def _pyarrow_disponivel() -> bool:
+    global _aviso_pyarrow_emitido
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        if not _aviso_pyarrow_emitido:
+            logging.warning("pyarrow não instalado: linhas dos XMLs mantidas em memória.")
+            _aviso_pyarrow_emitido = True
+        return False
+
+
+class LinhasComDescarga:
+    """
+    Lista de linhas (tuplas na ordem de 'colunas') com append/extend/len, que descarrega
+    em Parquet a cada 'limite_linhas'. para_dataframe() devolve o mesmo DataFrame que
+    pd.DataFrame(linhas, columns=colunas) daria, na mesma ordem das linhas.
+    """
+
+    def __init__(self, colunas: Sequence[str], limite_linhas: int = 0, nome: str = 'linhas'):
+        self.colunas = list(colunas)
+        self.limite_linhas = limite_linhas if limite_linhas and limite_linhas > 0 and _pyarrow_disponivel() else 0
+        self.nome = nome
+        self.descarregadas = 0
+        self._linhas: List[Tuple[Any, ...]] = []
+        self._pasta: Optional[Path] = None
+        self._escritor: Any = None
+        self._esquema: Any = None
+
+    def __len__(self) -> int:
+        return self.descarregadas + len(self._linhas)
+
+    def append(self, linha: Tuple[Any, ...]) -> None:
+        self._linhas.append(linha)
+        if self.limite_linhas and len(self._linhas) >= self.limite_linhas:
+            self._descarregar()
+
+    def extend(self, linhas: Iterable[Tuple[Any, ...]]) -> None:
+        self._linhas.extend(linhas)
+        if self.limite_linhas and len(self._linhas) >= self.limite_linhas:
+            self._descarregar()
+
+    def _descarregar(self) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        tabela = pa.Table.from_pandas(pd.DataFrame(self._linhas, columns=self.colunas), preserve_index=False)
+        if self._escritor is None:
+            self._pasta = Path(tempfile.mkdtemp(prefix=f"xml_{self.nome}_"))
+            self._esquema = tabela.schema
+            self._escritor = pq.ParquetWriter(str(self._pasta / f"{self.nome}.parquet"), self._esquema)
+            logging.info(f"XMLs: mais de {self.limite_linhas} linhas de {self.nome}; descarregando em disco ({self._pasta}).")
+        elif not tabela.schema.equals(self._esquema):
+            tabela = tabela.cast(self._esquema)  # Ex.: coluna só com vazios neste bloco
+        self._escritor.write_table(tabela)
+        self.descarregadas += len(self._linhas)
+        self._linhas = []
+
+    def para_dataframe(self) -> pd.DataFrame:
+        """DataFrame com todas as linhas (sem linhas, DataFrame sem colunas). Apaga os temporários."""
+        if not len(self):
+            return pd.DataFrame()
+        if self._escritor is None:
+            df = pd.DataFrame(self._linhas, columns=self.colunas)
+            self._linhas = []
+            return df
+
+        import pyarrow.parquet as pq
+        if self._linhas:
+            self._descarregar()
+        self._escritor.close()
+        self._escritor = None
+        try:
+            # self_destruct libera cada coluna do Arrow assim que ela vira coluna do pandas
+            return pq.read_table(str(self._pasta / f"{self.nome}.parquet")).to_pandas(
+                split_blocks=True, self_destruct=True)
+        finally:
+            self.descartar()
+
+    def descartar(self) -> None:
+        """Fecha e apaga os arquivos temporários (também em caso de erro no meio da leitura)."""
+        if self._escritor is not None:
+            try:
+                self._escritor.close()
+            except Exception:
+                pass
+            self._escritor = None
+        if self._pasta is not None:
+            shutil.rmtree(self._pasta, ignore_errors=True)
+            self._pasta = None
+        self._linhas = []
@@ -0,0 +1,194 @@
+import logging
+import os
+import queue
+import re
+import threading
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Sequence, Union
+
+from .xml_zip import XmlEmZip, listar_xmls_zip
+
+# Descoberta dos XMLs a processar: uma ou mais pastas, percorridas com os.scandir (uma única
+# listagem por pasta, extensões sem diferenciar maiúsculas) e entregues sob demanda, para que
+# a leitura comece antes de a listagem terminar. Também lê o início de cada arquivo: o tipo de
+# documento (tag raiz e modelo) e a chave, para descartar irrelevantes e repetidos sem ler o XML inteiro.
+
+EXTENSAO_XML = '.xml'
+EXTENSAO_ZIP = '.zip'
+TAMANHO_CABECALHO_CHAVE = 4096  # A tag infNFe/infCte/infCFe fica nas primeiras centenas de bytes
+
+# Id da primeira infNFe/infCte/infCFe (com ou sem prefixo de namespace), como o parser usa na chave
+_RE_CHAVE = re.compile(rb'<(?:[\w.-]+:)?inf(?:NFe|Cte|CFe)\b[^>]*?\sId\s*=\s*["\'](?:NFe|CTe|CFe)(\d{44})["\']')
+# Primeira tag de elemento (pula declaração, comentários e DOCTYPE) e o modelo do <ide>
+_RE_RAIZ = re.compile(rb'<(?![?!])(?:[\w.-]+:)?([\w.-]+)')
+_RE_MODELO = re.compile(rb'<(?:[\w.-]+:)?mod>\s*(\d{2})\s*<')
+
+# --- TIPOS DE DOCUMENTO (pela tag raiz) ---
+DOC_NFE = 'nfe'
+DOC_NFCE = 'nfce'        # NF-e modelo 65 (mesmo leiaute da NF-e)
+DOC_CFE = 'cfe'          # CF-e SAT, modelo 59 (par do C800 no SPED)
+DOC_CTE = 'cte'
+DOC_CTE_OS = 'cte_os'    # CT-e OS, modelo 67
+DOC_EVENTO = 'evento'    # Eventos de NF-e/CT-e (cancelamento, carta de correção...)
+DOC_MDFE = 'mdfe'
+DOC_DESCONHECIDO = 'desconhecido'
+
+RAIZES_DOCUMENTO = {
+    'nfeProc': DOC_NFE, 'NFe': DOC_NFE, 'enviNFe': DOC_NFE,
+    'CFe': DOC_CFE,
+    'cteProc': DOC_CTE, 'CTe': DOC_CTE,
+    'cteOSProc': DOC_CTE_OS, 'CTeOS': DOC_CTE_OS,
+    'procEventoNFe': DOC_EVENTO, 'procEventoCTe': DOC_EVENTO, 'evento': DOC_EVENTO, 'eventoCTe': DOC_EVENTO,
+    'mdfeProc': DOC_MDFE, 'MDFe': DOC_MDFE, 'procEventoMDFe': DOC_MDFE, 'eventoMDFe': DOC_MDFE,
+}
+MODELO_NFCE = '65'
+
+
+def _ordem(entrada: os.DirEntry) -> str:
+    return entrada.name.lower()
+
+
+def _percorrer(pasta: str, recursivo: bool) -> Iterator[Union[Path, XmlEmZip]]:
+    """Por pasta: XMLs soltos, depois os XMLs dos .zip, depois as subpastas (ordem alfabética)."""
+    pendentes: List[str] = [pasta]
+    while pendentes:
+        atual = pendentes.pop()
+        xmls: List[os.DirEntry] = []
+        zips: List[os.DirEntry] = []
+        subpastas: List[os.DirEntry] = []
+        try:
+            with os.scandir(atual) as entradas:
+                for entrada in entradas:
+                    try:
+                        if entrada.is_dir():
+                            if recursivo:
+                                subpastas.append(entrada)
+                            continue
+                    except OSError:
+                        continue
+                    extensao = os.path.splitext(entrada.name)[1].lower()
+                    if extensao == EXTENSAO_XML:
+                        xmls.append(entrada)
+                    elif extensao == EXTENSAO_ZIP:
+                        zips.append(entrada)
+        except OSError as e:
+            if atual == pasta:
+                raise
+            logging.warning(f"Pasta de XMLs inacessível, ignorada: {atual} ({e})")
+            continue
+
+        for entrada in sorted(xmls, key=_ordem):
+            yield Path(entrada.path)
+        for entrada in sorted(zips, key=_ordem):
+            yield from listar_xmls_zip(Path(entrada.path))
+        # Pilha: a primeira subpasta em ordem alfabética é a próxima a ser lida
+        pendentes.extend(entrada.path for entrada in sorted(subpastas, key=_ordem, reverse=True))
+
+
+def iterar_arquivos_xml(pastas: Union[Path, Sequence[Path]], recursivo: bool = True) -> Iterator[Union[Path, XmlEmZip]]:
+    """
+    XMLs (soltos ou dentro de .zip) das pastas, na ordem das pastas informadas. O mesmo
+    arquivo alcançado por duas raízes (ex.: uma pasta e sua subpasta) é entregue uma vez.
+    As pastas são validadas antes da primeira entrega.
+    """
+    raizes = [Path(pastas)] if isinstance(pastas, (str, os.PathLike)) else [Path(p) for p in pastas]
+    for raiz in raizes:
+        if not raiz.is_dir():
+            raise Exception(f"A pasta de XMLs não foi encontrada: {raiz}")
+    return _iterar_sem_repetir(raizes, recursivo)
+
+
+def _iterar_sem_repetir(raizes: List[Path], recursivo: bool) -> Iterator[Union[Path, XmlEmZip]]:
+    entregues: set = set()
+    varias_raizes = len(raizes) > 1
+    for raiz in raizes:
+        for arquivo in _percorrer(str(raiz), recursivo):
+            if varias_raizes:
+                identificacao = (os.path.abspath(arquivo.arquivo_zip),) + arquivo.membros \
+                    if isinstance(arquivo, XmlEmZip) else os.path.abspath(arquivo)
+                if identificacao in entregues:
+                    continue
+                entregues.add(identificacao)
+            yield arquivo
+
+
+def chave_no_cabecalho(cabecalho: bytes) -> Optional[str]:
+    """Chave (44 dígitos) do Id da primeira infNFe/infCte/infCFe do trecho inicial do XML, se houver."""
+    encontrado = _RE_CHAVE.search(cabecalho)
+    return encontrado.group(1).decode('ascii') if encontrado else None
+
+
+def identificar_documento(cabecalho: bytes) -> Optional[str]:
+    """
+    Tipo do documento (DOC_*) pela tag raiz no trecho inicial do XML; para NF-e, o modelo
+    (<mod>) separa a NFC-e. Raiz fora de RAIZES_DOCUMENTO: DOC_DESCONHECIDO. None se o
+    trecho não mostra a raiz (ex.: XML em UTF-16): o arquivo é lido por completo.
+    """
+    raiz = _RE_RAIZ.search(cabecalho)
+    if raiz is None:
+        return None
+    tipo = RAIZES_DOCUMENTO.get(raiz.group(1).decode('ascii', 'replace'), DOC_DESCONHECIDO)
+    if tipo == DOC_NFE:
+        modelo = _RE_MODELO.search(cabecalho, raiz.end())
+        if modelo is not None and modelo.group(1).decode('ascii') == MODELO_NFCE:
+            return DOC_NFCE
+    return tipo
+
+
+class FluxoComInicio:
+    """Devolve primeiro os bytes já lidos do início do arquivo e depois o restante do fluxo."""
+
+    def __init__(self, inicio: bytes, fluxo: BinaryIO):
+        self._inicio = inicio
+        self._fluxo = fluxo
+
+    def read(self, tamanho: int = -1) -> bytes:
+        if self._inicio:
+            if tamanho is None or tamanho < 0:
+                dados, self._inicio = self._inicio + self._fluxo.read(), b''
+                return dados
+            dados, self._inicio = self._inicio[:tamanho], self._inicio[tamanho:]
+            return dados
+        return self._fluxo.read(tamanho)
+
+
+class DescobertaEmSegundoPlano:
+    """
+    Lista os arquivos em uma thread enquanto quem itera já vai lendo os primeiros.
+    'descobertos' é o total listado até o momento (usado como total do progresso).
+    Erros da listagem são levantados para quem itera.
+    """
+    _FIM = object()
+
+    def __init__(self, arquivos: Iterator[Union[Path, XmlEmZip]]):
+        self.descobertos = 0
+        self._fila: queue.Queue = queue.Queue()
+        self._erro: Optional[BaseException] = None
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._listar, args=(arquivos,), name='descoberta-xml', daemon=True)
+        self._thread.start()
+
+    def _listar(self, arquivos: Iterator[Union[Path, XmlEmZip]]) -> None:
+        try:
+            for arquivo in arquivos:
+                if self._parar.is_set():
+                    break
+                self.descobertos += 1
+                self._fila.put(arquivo)
+        except BaseException as e:
+            self._erro = e
+        finally:
+            self._fila.put(self._FIM)
+
+    def __iter__(self) -> Iterator[Union[Path, XmlEmZip]]:
+        while True:
+            arquivo = self._fila.get()
+            if arquivo is self._FIM:
+                break
+            yield arquivo
+        if self._erro is not None:
+            raise self._erro
+
+    def parar(self) -> None:
+        """Interrompe a listagem (ex.: a leitura falhou no meio)."""
+        self._parar.set()
@@ -1,12 +1,36 @@
+import io
 import logging
+import os
 import xml.etree.ElementTree as ET
 import pandas as pd
 # import FreeSimpleGUI as sg # REMOVIDO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import List, Any, Dict, Optional, Tuple
+from collections import Counter, deque
+from itertools import chain
+from typing import List, Any, BinaryIO, Deque, Dict, Iterable, Iterator, NamedTuple, Optional, Sequence, Tuple, Union
 
 # Importa as constantes da pasta local
 from .constants import MAPA_FINNFE
+from .categorias import para_categorias
+from .centavos import reais_para_centavos
+from .xml_backend import ERROS_PARSE, backend_xml, definir_backend_xml, iterparse, posicao_erro
+from .xml_cache import TAMANHO_MAXIMO_PADRAO_MB as TAMANHO_MAXIMO_CACHE_MB, CacheXml
+from .xml_descarga import LinhasComDescarga
+from .xml_quarentena import (
+    ETAPA_ABERTURA, ETAPA_CABECALHO, ETAPA_CHAVE, ETAPA_EXTRACAO, ETAPA_LEITURA, ErroXml, QuarentenaXml,
+    salvar_relatorio_erros_xml
+)
+from .xml_reparo import deslocamento_em_bytes, reparar_xml
+from .xml_zip import LeitorZip, XmlEmZip
+from .xml_descoberta import (
+    DOC_CFE, DOC_CTE, DOC_CTE_OS, DOC_DESCONHECIDO, DOC_EVENTO, DOC_MDFE, DOC_NFCE, DOC_NFE, MODELO_NFCE,
+    TAMANHO_CABECALHO_CHAVE, DescobertaEmSegundoPlano, FluxoComInicio, chave_no_cabecalho, identificar_documento,
+    iterar_arquivos_xml
+)
+
+ArquivoXml = Union[Path, XmlEmZip]  # XML solto na pasta ou membro de um .zip
 
 # --- CONSTANTES DE NAMESPACE ---
 NS_NFE = {'nfe': 'http://www.portalfiscal.inf.br/nfe'}
@@ -14,357 +38,1178 @@ NS_CTE_URI = 'http://www.portalfiscal.inf.br/cte'
 NS_CTE_FIND = f"{{{NS_CTE_URI}}}" # Formato {uri}Tag para buscas diretas no ElementTree
 # --- FIM DAS CONSTANTES ---
 
+# --- COLUNAS DOS DATAFRAMES ---
+# As linhas circulam como tuplas nesta ordem (mais leves para enviar entre processos)
+COLUNAS_NFE_TOTAIS = [
+    'CHV_NFE', 'NUM_NF', 'CNPJ_EMITENTE', 'CFOP_XML', 'CEST_XML', 'TIPO_NOTA', 'MODELO_XML',
+    'VL_DOC_XML', 'ICMS_XML', 'ICMS_ST_XML', 'IPI_XML', 'IPI_DEVOL_XML', 'FCP_ST_XML', 'ICMS_SN_XML', 'ICMS_MONO_XML'
+]
+COLUNAS_NFE_ITENS = [
+    'CHV_NFE', 'CNPJ_EMITENTE', 'N_ITEM', 'TIPO_NOTA', 'TIPO_DESTINATARIO', 'COD_PROD', 'DESC_PROD', 'NCM', 'CEST',
+    'cBenef', 'CFOP', 'QTD', 'UNID', 'VLR_UNIT', 'VLR_PROD', 'DESPESA_XML', 'VLR_ICMS', 'VLR_ICMS_ST', 'VLR_FCP_ST',
+    'VLR_IPI', 'VLR_PIS', 'VLR_COFINS', 'VLR_ICMS_SN', 'VLR_ICMS_MONO', 'BC_PIS_COFINS_CALC', 'VLR_TOTAL_NF',
+    'CST_ICMS_XML', 'VLR_BC_ICMS_XML', 'pICMS_XML',
+    # Campos usados pela apuração do Invest (invest_logic) e demais leituras de itens
+    'NUM_NF', 'DATA_EMISSAO', 'CNPJ_DESTINATARIO', 'UF_DESTINATARIO', 'PROTOCOLO', 'VLR_PROD_XML', 'VLR_FRETE',
+    'VLR_SEGURO', 'VLR_DESCONTO', 'VLR_IPI_DEVOL', 'VLR_DIFAL', 'ALIQ_ICMS_XML', 'ALIQ_ICMS_SN_XML',
+    'CST_PIS', 'VLR_BC_PIS', 'ALIQ_PIS', 'CST_COFINS', 'VLR_BC_COFINS', 'ALIQ_COFINS'
+]
+COLUNAS_CTE = [
+    'CHV_CTE', 'NUM_CTE_XML', 'CNPJ_TRANSPORTADOR', 'IE_TRANSPORTADOR', 'UF_EMITENTE_CTE', 'REMETENTE_NOME',
+    'DESTINATARIO_NOME', 'TOMADOR_CNPJ', 'TOMADOR_NOME', 'MUN_ORIGEM', 'MUN_DESTINO', 'VL_TOTAL_CTE_XML',
+    'VL_BC_ICMS_XML', 'VL_ICMS_XML', 'ALIQ_ICMS_XML', 'CFOP_XML', 'CST_XML', 'ITEM_PREDOMINANTE'
+]
+# Eventos de NF-e/CT-e (procEventoNFe...): CHV_DOC é a chave do documento a que o evento se refere
+COLUNAS_EVENTOS = [
+    'CHV_DOC', 'TP_EVENTO', 'DESC_EVENTO', 'N_SEQ_EVENTO', 'DATA_EVENTO', 'PROTOCOLO_EVENTO', 'CSTAT_EVENTO'
+]
+TP_EVENTOS_CANCELAMENTO = ('110111', '110112')   # Cancelamento e cancelamento por substituição
+CSTAT_EVENTO_REGISTRADO = ('135', '136', '155')  # Evento registrado (inclusive fora do prazo)
 
-def processar_pasta_xml(pasta_xmls: Path, window: Any) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    """Lê arquivos XML e retorna três DataFrames: (df_nfe_totais, df_nfe_itens, df_cte_totais)."""
-    logging.info('Lendo arquivos XML (NF-e e CT-e)...')
-    dados_totais: List[Dict[str, Any]] = []    # Para totais de NF-e
-    dados_itens: List[Dict[str, Any]] = []      # Para itens de NF-e
-    dados_cte_xml: List[Dict[str, Any]] = []    # Para totais de CT-e
+NOMES_DOCUMENTO = {
+    DOC_NFE: 'NF-e', DOC_NFCE: 'NFC-e', DOC_CFE: 'CF-e SAT', DOC_CTE: 'CT-e', DOC_CTE_OS: 'CT-e OS', DOC_EVENTO: 'eventos',
+    DOC_MDFE: 'MDF-e', DOC_DESCONHECIDO: 'de tipo desconhecido', '': 'sem NF-e/CT-e',
+}
 
-    # --- HELPERS DE NF-e ---
-    def get_text_nfe(element: Optional[ET.Element], path: str, default: str = '') -> str:
-        if element is None: return default
-        node = element.find(path, NS_NFE)
-        return node.text.strip() if node is not None and node.text is not None else default 
+# --- MODO PARALELO ---
+# Abaixo deste número de arquivos o custo de subir os processos não compensa
+MINIMO_ARQUIVOS_PARALELO = 500
+# Arquivos por lote enviado a um processo (o progresso é atualizado a cada lote)
+TAMANHO_LOTE = 128
+# Lotes em andamento por processo: limita a memória enquanto a pasta ainda está sendo listada
+LOTES_POR_PROCESSO = 4
+
+
+# --- LEITURA DA NF-e EM UMA PASSADA (iterparse) ---
+# Cada elemento de contexto (prod, ICMSTot, ide...) recebe um mapa tag -> campo; ao fechar
+# um filho desse contexto, o texto vai para o campo (a primeira ocorrência vence, como em find()).
+# Os <det> são limpos assim que terminam, então a memória não cresce com o tamanho da nota.
+NS_NFE_URI = NS_NFE['nfe']
+
+def _tag_nfe(nome: str) -> str:
+    return f"{{{NS_NFE_URI}}}{nome}"
+
+def _mapa_nfe(*nomes: str) -> Dict[str, str]:
+    return {_tag_nfe(nome): nome for nome in nomes}
+
+TAG_INF_NFE = _tag_nfe('infNFe')
+TAG_DET = _tag_nfe('det')
+TAG_ICMS_TOT = _tag_nfe('ICMSTot')
+TAG_PROD = _tag_nfe('prod')
+TAG_IMPOSTO = _tag_nfe('imposto')
+TAG_IMPOSTO_DEVOL = _tag_nfe('impostoDevol')
+TAG_ICMS = _tag_nfe('ICMS')
+TAG_IPI = _tag_nfe('IPI')
+TAG_PIS = _tag_nfe('PIS')
+TAG_COFINS = _tag_nfe('COFINS')
+TAG_ENDER_DEST = _tag_nfe('enderDest')
+TAG_INF_PROT = _tag_nfe('infProt')
+TAGS_CABECALHO = {_tag_nfe('ide'): 'ide', _tag_nfe('emit'): 'emit', _tag_nfe('dest'): 'dest'}
+
+# Filhos diretos de cada contexto
+MAPA_CABECALHO = {
+    'ide': _mapa_nfe('nNF', 'mod', 'finNFe', 'dhEmi', 'dEmi'),
+    'emit': _mapa_nfe('CNPJ', 'CPF'),
+    'dest': _mapa_nfe('CNPJ', 'CPF'),
+    'enderDest': _mapa_nfe('UF'),
+}
+MAPA_INF_PROT = _mapa_nfe('nProt')                                            # protNFe/infProt
+MAPA_ICMS_TOT = _mapa_nfe('vNF', 'vICMS', 'vST', 'vIPI', 'vIPIDevol', 'vFCPST')
+MAPA_PROD = _mapa_nfe(
+    'cProd', 'xProd', 'NCM', 'CEST', 'cBenef', 'CFOP', 'uCom', 'qCom', 'vUnCom', 'vProd', 'vFrete', 'vSeg', 'vDesc', 'vOutro'
+)
+MAPA_ICMS_TIPO = _mapa_nfe('CST', 'CSOSN', 'vBC', 'pICMS', 'pCredSN', 'vCredICMSSN')  # Filhos de ICMS00, ICMSSN101...
+MAPA_PIS_TIPO = _mapa_nfe('CST', 'vBC', 'pPIS')                               # Filhos de PISAliq, PISOutr...
+MAPA_COFINS_TIPO = _mapa_nfe('CST', 'vBC', 'pCOFINS')                         # Filhos de COFINSAliq...
+MAPA_DEVOL_IPI = _mapa_nfe('vIPIDevol')                                       # impostoDevol/IPI/vIPIDevol
+# Em qualquer nível dentro de <imposto> (como find('.//nfe:vICMS'))
+MAPA_IMPOSTO = _mapa_nfe(
+    'vICMS', 'vICMSST', 'vFCPST', 'vPIS', 'vCOFINS', 'vIPI', 'vICMSUFDest',
+    'vICMSMono', 'vICMSMonoOp', 'vICMSMonoDifer', 'vICMSMonoRet'
+)
+TAGS_MONO = ('vICMSMono', 'vICMSMonoOp', 'vICMSMonoDifer', 'vICMSMonoRet')
+
+
+def _texto(campos: Dict[str, Optional[str]], campo: str, default: str = '') -> str:
+    valor = campos.get(campo)
+    return valor.strip() if valor is not None else default
+
+def _numero(campos: Dict[str, Optional[str]], campo: str) -> float:
+    texto = _texto(campos, campo)
+    if not texto: return 0.0
+    try:
+        return float(texto.replace(',', '.'))
+    except (ValueError, TypeError):
+        return 0.0
+
+# --- HELPERS DE CT-e ---
+def get_text_cte(element: Optional[ET.Element], tag_name: str, default: str = '') -> str:
+    """Busca uma tag filha usando o namespace de CTe."""
+    if element is None: return default
+    # Tenta buscar direto com namespace
+    node = element.find(f"{NS_CTE_FIND}{tag_name}")
+    return node.text.strip() if node is not None and node.text is not None else default
+
+def get_float_cte(element: Optional[ET.Element], tag_name: str, default: float = 0.0) -> float:
+    text_val = get_text_cte(element, tag_name, '')
+    if not text_val: return default
+    try: return float(text_val.replace(',', '.'))
+    except (ValueError, TypeError): return default
+# --- FIM DOS HELPERS ---
+
+
+# --- Extração de um arquivo (no processo principal ou em um processo filho) ---
+class ResultadoXml(NamedTuple):
+    """
+    O que um arquivo XML produziu. A deduplicação por chave fica com quem junta os
+    resultados, na ordem dos arquivos (a primeira ocorrência de cada chave vence).
+    situacao: 'ok', 'chave_invalida', 'parse_error', 'erro' (inesperado), 'erro_cte', 'ignorado'
+    ou 'duplicada' (chave já vista, lida só no início do arquivo; ver _extrair_arquivo_xml).
+    Eventos usam como chave o tipo + chave do documento + sequência (um por evento).
+    """
+    situacao: str
+    tipo: str = ''                       # DOC_NFE, DOC_NFCE, DOC_CTE, DOC_CTE_OS, DOC_EVENTO (xml_descoberta)
+    chave: str = ''
+    linha: Optional[Tuple[Any, ...]] = None
+    itens: Tuple[Tuple[Any, ...], ...] = ()
+    mensagem: str = ''
+    erro: Optional[ErroXml] = None       # Onde e por que falhou (ou o reparo que permitiu a leitura)
+
+
+ERRO_CHAVE_INVALIDA = ErroXml(ETAPA_CHAVE, 'ChaveInvalida', 'Chave de acesso ausente ou sem 44 dígitos')
+
+
+class _ItemNfe:
+    """Campos de um <det> coletados durante a leitura."""
+    __slots__ = ('det', 'n_item', 'prod', 'imposto', 'icms', 'icms_tipo', 'devol', 'pis', 'pis_tipo',
+                 'cofins', 'cofins_tipo', 'tem_prod', 'tem_imposto', 'tem_icms_tipo', 'devol_tem_filhos',
+                 'campos_prod', 'campos_imposto', 'campos_icms', 'campos_devol', 'campos_pis', 'campos_cofins')
+
+    def __init__(self, det: ET.Element):
+        self.det: Optional[ET.Element] = det
+        self.n_item = det.attrib.get('nItem', '')
+        # Elementos abertos durante a leitura do <det> (liberados quando ele termina)
+        self.prod = self.imposto = self.icms = self.icms_tipo = self.devol = None
+        self.pis = self.pis_tipo = self.cofins = self.cofins_tipo = None
+        self.tem_prod = self.tem_imposto = self.tem_icms_tipo = self.devol_tem_filhos = False
+        self.campos_prod: Dict[str, Optional[str]] = {}
+        self.campos_imposto: Dict[str, Optional[str]] = {}
+        self.campos_icms: Dict[str, Optional[str]] = {}
+        self.campos_devol: Dict[str, Optional[str]] = {}
+        self.campos_pis: Dict[str, Optional[str]] = {}
+        self.campos_cofins: Dict[str, Optional[str]] = {}
+
+    def encerrar(self) -> None:
+        self.tem_prod = self.prod is not None
+        self.tem_imposto = self.imposto is not None
+        self.tem_icms_tipo = self.icms_tipo is not None
+        self.det = self.prod = self.imposto = self.icms = self.icms_tipo = self.devol = None
+        self.pis = self.pis_tipo = self.cofins = self.cofins_tipo = None
+
+
+class _LeituraXml:
+    """Resultado da passada única: campos da NF-e (se houver) e a raiz do documento (usada pelo CT-e)."""
+
+    def __init__(self):
+        self.raiz: Optional[ET.Element] = None
+        self.inf_nfe: Optional[ET.Element] = None
+        self.chave = ''
+        self.cabecalho: Dict[str, Dict[str, Optional[str]]] = {}  # 'ide'/'emit'/'dest'/'enderDest' -> campos
+        self.dest: Optional[ET.Element] = None
+        self.totais: Optional[Dict[str, Optional[str]]] = None     # Filhos do primeiro ICMSTot
+        self.protocolo: Optional[Dict[str, Optional[str]]] = None  # Filhos do infProt (nfeProc)
+        self.itens: List[_ItemNfe] = []
+
+
+def _abrir_xml(arquivo: ArquivoXml, zips: Optional[LeitorZip]) -> BinaryIO:
+    """Arquivo no disco ou membro de ZIP (descompactado em fluxo, sem arquivo temporário)."""
+    if isinstance(arquivo, XmlEmZip):
+        return zips.abrir(arquivo)
+    return open(arquivo, 'rb')
+
+
+def _ler_xml(f: BinaryIO) -> _LeituraXml:
+    """Percorre o arquivo uma única vez coletando os campos da NF-e (ver mapas acima)."""
+    leitura = _LeituraXml()
+    pilha: List[ET.Element] = []
+    contextos: Dict[ET.Element, Tuple[Dict[str, str], Dict[str, Optional[str]]]] = {}
+    item: Optional[_ItemNfe] = None
+    dentro_imposto = False
+
+    for evento, elem in iterparse(f, events=('start', 'end')):
+        tag = elem.tag
+        if evento == 'start':
+            pai = pilha[-1] if pilha else None
+            pilha.append(elem)
+            if pai is None:
+                leitura.raiz = elem
+            elif tag == TAG_DET:
+                item = _ItemNfe(elem)
+                leitura.itens.append(item)
+            elif item is not None and pai is item.det:
+                if tag == TAG_PROD and item.prod is None:
+                    item.prod = elem
+                    contextos[elem] = (MAPA_PROD, item.campos_prod)
+                elif tag == TAG_IMPOSTO and item.imposto is None:
+                    item.imposto = elem
+                    dentro_imposto = True
+                elif tag == TAG_IMPOSTO_DEVOL and item.devol is None:
+                    item.devol = elem
+            elif item is not None and pai is item.imposto:
+                if tag == TAG_ICMS and item.icms is None:
+                    item.icms = elem
+                elif tag == TAG_PIS and item.pis is None:
+                    item.pis = elem
+                elif tag == TAG_COFINS and item.cofins is None:
+                    item.cofins = elem
+            elif item is not None and pai is item.icms and item.icms_tipo is None:
+                item.icms_tipo = elem  # Primeiro filho de ICMS (ICMS00, ICMSSN101...)
+                contextos[elem] = (MAPA_ICMS_TIPO, item.campos_icms)
+            elif item is not None and pai is item.pis and item.pis_tipo is None:
+                item.pis_tipo = elem
+                contextos[elem] = (MAPA_PIS_TIPO, item.campos_pis)
+            elif item is not None and pai is item.cofins and item.cofins_tipo is None:
+                item.cofins_tipo = elem
+                contextos[elem] = (MAPA_COFINS_TIPO, item.campos_cofins)
+            elif item is not None and pai is item.devol and tag == TAG_IPI:
+                contextos[elem] = (MAPA_DEVOL_IPI, item.campos_devol)
+            elif tag == TAG_INF_NFE and leitura.inf_nfe is None:
+                leitura.inf_nfe = elem
+                leitura.chave = elem.attrib.get('Id', '').replace('NFe', '')
+            elif pai is leitura.inf_nfe and tag in TAGS_CABECALHO and TAGS_CABECALHO[tag] not in leitura.cabecalho:
+                nome = TAGS_CABECALHO[tag]
+                leitura.cabecalho[nome] = {}
+                contextos[elem] = (MAPA_CABECALHO[nome], leitura.cabecalho[nome])
+                if nome == 'dest':
+                    leitura.dest = elem
+            elif pai is leitura.dest and tag == TAG_ENDER_DEST and 'enderDest' not in leitura.cabecalho:
+                leitura.cabecalho['enderDest'] = {}
+                contextos[elem] = (MAPA_CABECALHO['enderDest'], leitura.cabecalho['enderDest'])
+            elif tag == TAG_ICMS_TOT and leitura.totais is None:
+                leitura.totais = {}
+                contextos[elem] = (MAPA_ICMS_TOT, leitura.totais)
+            elif tag == TAG_INF_PROT and leitura.protocolo is None:
+                leitura.protocolo = {}
+                contextos[elem] = (MAPA_INF_PROT, leitura.protocolo)
+            continue
+
+        pilha.pop()
+        contextos.pop(elem, None)
+        if pilha:
+            contexto = contextos.get(pilha[-1])
+            if contexto is not None:
+                campo = contexto[0].get(tag)
+                if campo is not None:
+                    contexto[1].setdefault(campo, elem.text)
+        if dentro_imposto:
+            if elem is item.imposto:
+                dentro_imposto = False
+            else:
+                campo = MAPA_IMPOSTO.get(tag)
+                if campo is not None:
+                    item.campos_imposto.setdefault(campo, elem.text)
+        elif item is not None:
+            if elem is item.devol:
+                item.devol_tem_filhos = len(elem) > 0  # Mesmo teste de 'if imposto_devol:'
+            elif elem is item.det:
+                item.encerrar()
+                item = None
+                elem.clear()  # Item já lido: libera a subárvore
+    return leitura
+
+
+def _extrair_nfe(leitura: _LeituraXml, itens_lidos: List[Tuple[Any, ...]]) -> Tuple[Any, ...]:
+    """Linha de totais da NF-e; os itens vão sendo anexados a itens_lidos."""
+    chave_nfe = leitura.chave
+    ide = leitura.cabecalho.get('ide', {})
+    emit = leitura.cabecalho.get('emit', {})
+    dest = leitura.cabecalho.get('dest', {})
+
+    numero_nf = _texto(ide, 'nNF')
+    modelo = _texto(ide, 'mod')
+    fin_nfe_code = _texto(ide, 'finNFe', default='1')
+    tipo_nota_texto = MAPA_FINNFE.get(fin_nfe_code, 'Desconhecido')
+
+    cnpj_emitente = _texto(emit, 'CNPJ', default=_texto(emit, 'CPF'))
+    cnpj_dest = _texto(dest, 'CNPJ')
+    cpf_dest = _texto(dest, 'CPF')
+
+    tipo_dest = 'PJ' if (cnpj_dest and len(cnpj_dest) >= 14) else ('PF' if cpf_dest else 'OUTRO')
+    data_emissao = _texto(ide, 'dhEmi', default=_texto(ide, 'dEmi'))[:10]
+    uf_dest = _texto(leitura.cabecalho.get('enderDest', {}), 'UF')
+    protocolo = _texto(leitura.protocolo or {}, 'nProt')
+
+    totais = leitura.totais or {}
+    dados_impostos: Dict[str, float] = {
+        'VL_DOC_XML': round(_numero(totais, 'vNF'), 2),
+        'ICMS_XML': round(_numero(totais, 'vICMS'), 2),
+        'ICMS_ST_XML': round(_numero(totais, 'vST'), 2),
+        'IPI_XML': round(_numero(totais, 'vIPI'), 2),
+        'IPI_DEVOL_XML': round(_numero(totais, 'vIPIDevol'), 2),
+        'FCP_ST_XML': round(_numero(totais, 'vFCPST'), 2),
+        'ICMS_SN_XML': 0.0, 'ICMS_MONO_XML': 0.0
+    }
+
+    cfops_set: set[str] = set()
+    cest_set: set[str] = set()
+    icms_sn_total_itens: float = 0.0
+    icms_mono_total_itens: float = 0.0
+
+    for item in leitura.itens:
+        if not item.tem_prod or not item.tem_imposto: continue
+        prod = item.campos_prod
+        imposto = item.campos_imposto
+        pis = item.campos_pis
+        cofins = item.campos_cofins
+
+        cfop_text = _texto(prod, 'CFOP'); cfops_set.add(cfop_text)
+        cest_code = _texto(prod, 'CEST'); cest_set.add(cest_code)
+
+        cst_icms_xml = ''; vlr_bc_icms_xml = 0.0; p_icms_xml = 0.0; p_icms_xml_raw = 0.0
+        p_cred_sn = 0.0; vlr_icms_sn_item = 0.0; vlr_icms_mono_item = 0.0
+
+        if item.tem_icms_tipo:
+            icms = item.campos_icms
+            cst_icms_xml = _texto(icms, 'CST', default=_texto(icms, 'CSOSN'))
+            vlr_bc_icms_xml = _numero(icms, 'vBC')
+            p_icms_xml_raw = _numero(icms, 'pICMS')
+            if p_icms_xml_raw > 0: p_icms_xml = round(p_icms_xml_raw / 100.0, 4)
+            p_cred_sn = _numero(icms, 'pCredSN')
+            vlr_icms_sn_item = _numero(icms, 'vCredICMSSN')
+
+        icms_sn_total_itens += vlr_icms_sn_item
+
+        # Soma campos de ICMS Monofásico
+        for tag_mono in TAGS_MONO:
+             vlr_icms_mono_item += _numero(imposto, tag_mono)
+        icms_mono_total_itens += vlr_icms_mono_item
+
+        vlr_unit_base = _numero(prod, 'vUnCom'); quantidade = _numero(prod, 'qCom')
+        vlr_frete_item = _numero(prod, 'vFrete'); vlr_seguro_item = _numero(prod, 'vSeg')
+        vlr_desconto_item = _numero(prod, 'vDesc'); vlr_outras_desp = _numero(prod, 'vOutro')
+
+        vlr_icms_item = _numero(imposto, 'vICMS')
+        vlr_icms_st_item = _numero(imposto, 'vICMSST')
+        vlr_fcp_st_item = _numero(imposto, 'vFCPST')
+        vlr_pis_item = _numero(imposto, 'vPIS')
+        vlr_cofins_item = _numero(imposto, 'vCOFINS')
+
+        vlr_ipi_devol = _numero(item.campos_devol, 'vIPIDevol') if item.devol_tem_filhos else 0.0
+        vlr_ipi_item = _numero(imposto, 'vIPI') + vlr_ipi_devol
+
+        vlr_prod_base = _numero(prod, 'vProd')
+        vlr_prod_calculado = round(vlr_prod_base + vlr_ipi_item + vlr_icms_st_item + vlr_fcp_st_item + vlr_frete_item + vlr_seguro_item - vlr_desconto_item + vlr_outras_desp, 2)
+
+        icms_a_deduzir = (round(vlr_icms_item, 2) + round(vlr_icms_sn_item, 2)) if vlr_icms_mono_item == 0.0 else 0.0
+        bc_pis_cofins_item = round(vlr_prod_calculado - icms_a_deduzir - round(vlr_icms_st_item, 2) - round(vlr_fcp_st_item, 2) - round(vlr_ipi_item, 2), 2)
+
+        # Mesma ordem de COLUNAS_NFE_ITENS
+        itens_lidos.append((
+            chave_nfe, cnpj_emitente, item.n_item,
+            tipo_nota_texto, tipo_dest,
+            _texto(prod, 'cProd'), _texto(prod, 'xProd'),
+            _texto(prod, 'NCM'), cest_code, _texto(prod, 'cBenef'),
+            cfop_text, quantidade, _texto(prod, 'uCom'),
+            vlr_unit_base, vlr_prod_calculado, round(vlr_outras_desp, 2),
+            round(vlr_icms_item, 2), round(vlr_icms_st_item, 2),
+            round(vlr_fcp_st_item, 2), round(vlr_ipi_item, 2),
+            round(vlr_pis_item, 2), round(vlr_cofins_item, 2),
+            round(vlr_icms_sn_item, 2), round(vlr_icms_mono_item, 2),
+            max(bc_pis_cofins_item, 0.0), dados_impostos['VL_DOC_XML'],
+            cst_icms_xml, round(vlr_bc_icms_xml, 2), p_icms_xml,
+            numero_nf, data_emissao, cnpj_dest, uf_dest, protocolo,
+            round(vlr_prod_base, 2), round(vlr_frete_item, 2), round(vlr_seguro_item, 2), round(vlr_desconto_item, 2),
+            round(vlr_ipi_devol, 2), round(_numero(imposto, 'vICMSUFDest'), 2), p_icms_xml_raw, p_cred_sn,
+            _texto(pis, 'CST'), round(_numero(pis, 'vBC'), 2), _numero(pis, 'pPIS'),
+            _texto(cofins, 'CST'), round(_numero(cofins, 'vBC'), 2), _numero(cofins, 'pCOFINS')
+        ))
+
+    dados_impostos['ICMS_SN_XML'] = round(icms_sn_total_itens, 2)
+    dados_impostos['ICMS_MONO_XML'] = round(icms_mono_total_itens, 2)
+
+    # Mesma ordem de COLUNAS_NFE_TOTAIS
+    return (
+        chave_nfe, numero_nf, cnpj_emitente,
+        '/'.join(sorted(list(filter(None, cfops_set)))) if cfops_set else '',
+        '/'.join(sorted(list(filter(None, cest_set)))) if cest_set else '',
+        tipo_nota_texto, modelo,
+        *(dados_impostos[c] for c in COLUNAS_NFE_TOTAIS[7:])
+    )
+
+
+def _extrair_cte(inf_cte: ET.Element, chave_cte: str) -> Tuple[Any, ...]:
+    """Linha do CT-e, na ordem de COLUNAS_CTE."""
+    # --- Navegação Estrutural ---
+    ide = inf_cte.find(f"{NS_CTE_FIND}ide")
+    emi = inf_cte.find(f"{NS_CTE_FIND}emit")
+    rem = inf_cte.find(f"{NS_CTE_FIND}rem")
+    dest = inf_cte.find(f"{NS_CTE_FIND}dest")
+    receb = inf_cte.find(f"{NS_CTE_FIND}receb")
+    exped = inf_cte.find(f"{NS_CTE_FIND}exped")
+
+    vPrest = inf_cte.find(f"{NS_CTE_FIND}vPrest")
+    imp = inf_cte.find(f"{NS_CTE_FIND}imp")
+
+    # Busca ICMS dentro de imp
+    icms_element = imp.find(f"{NS_CTE_FIND}ICMS") if imp is not None else None
+    icms_type_tag = next(iter(icms_element), None) if icms_element is not None else None
+
+    # --- Dados Básicos ---
+    num_cte_xml = get_text_cte(ide, 'nCT')
+    cfop_xml = get_text_cte(ide, 'CFOP')
+
+    # --- Emitente (Transportadora) ---
+    cnpj_emi_cte = get_text_cte(emi, 'CNPJ')
+    ie_emi_cte = get_text_cte(emi, 'IE')
+    uf_emi_cte = get_text_cte(emi.find(f"{NS_CTE_FIND}enderEmi"), 'UF') if emi.find(f"{NS_CTE_FIND}enderEmi") is not None else ''
+
+    # --- Partes Envolvidas (para referência) ---
+    # Helper rápido para extrair dados de partes
+    def get_party_data(node):
+        if node is None: return '', ''
+        return (get_text_cte(node, 'CNPJ') or get_text_cte(node, 'CPF')), get_text_cte(node, 'xNome')
+
+    cnpj_rem, nome_rem = get_party_data(rem)
+    cnpj_dest, nome_dest = get_party_data(dest)
+    cnpj_receb, nome_receb = get_party_data(receb)
+    cnpj_exped, nome_exped = get_party_data(exped)
+
+    # --- LÓGICA DO TOMADOR (PAGADOR) ---
+    # 0=Remetente, 1=Expedidor, 2=Recebedor, 3=Destinatário, 4=Outros
+    toma3 = ide.find(f"{NS_CTE_FIND}toma3")
+    toma4 = ide.find(f"{NS_CTE_FIND}toma4")
+
+    tomador_indicador = ''
+    tomador_cnpj = ''
+    tomador_nome = ''
+
+    if toma3 is not None:
+        tomador_indicador = get_text_cte(toma3, 'toma')
+    elif toma4 is not None:
+        tomador_indicador = get_text_cte(toma4, 'toma')
+
+    if tomador_indicador == '0': # Remetente
+        tomador_cnpj = cnpj_rem
+        tomador_nome = nome_rem
+    elif tomador_indicador == '1': # Expedidor
+        tomador_cnpj = cnpj_exped
+        tomador_nome = nome_exped
+    elif tomador_indicador == '2': # Recebedor
+        tomador_cnpj = cnpj_receb
+        tomador_nome = nome_receb
+    elif tomador_indicador == '3': # Destinatário
+        tomador_cnpj = cnpj_dest
+        tomador_nome = nome_dest
+    elif tomador_indicador == '4': # Outros
+        # Se for 4, o CNPJ/Nome está dentro da tag toma4 (se ela existir com dados)
+        # Às vezes toma4 tem filho <toma> e o CNPJ está lá, ou segue a estrutura de terceiros
+        if toma4 is not None:
+             tomador_cnpj = get_text_cte(toma4, 'CNPJ') or get_text_cte(toma4, 'CPF')
+             tomador_nome = get_text_cte(toma4, 'xNome')
+
+    # --- PRODUTO PREDOMINANTE (CORREÇÃO) ---
+    # Busca em infCteNorm -> infCarga -> proPred
+    item_predominante = ''
+    inf_norm = inf_cte.find(f"{NS_CTE_FIND}infCTeNorm")
+    if inf_norm is not None:
+        inf_carga = inf_norm.find(f"{NS_CTE_FIND}infCarga")
+        if inf_carga is not None:
+            item_predominante = get_text_cte(inf_carga, 'proPred')
+
+    # Fallback caso não ache na infCarga (raro, mas existe em CTe antigos ou simplificados)
+    if not item_predominante:
+         compl = inf_cte.find(f"{NS_CTE_FIND}compl")
+         if compl is not None and compl.find(f"{NS_CTE_FIND}ObsCont/infCont") is not None:
+             item_predominante = get_text_cte(compl.find(f"{NS_CTE_FIND}ObsCont/infCont"), 'xCampo')
+
+    # --- Valores e Impostos ---
+    vlr_total_cte = get_float_cte(vPrest, 'vTPrest')
+    vlr_bc_xml = get_float_cte(icms_type_tag, 'vBC')
+    vlr_icms_xml = get_float_cte(icms_type_tag, 'vICMS')
+    aliq_icms_xml = get_float_cte(icms_type_tag, 'pICMS')
+    cst_cte = get_text_cte(icms_type_tag, 'CST')
+
+    # --- Locais ---
+    mun_origem = get_text_cte(ide, 'xMunIni')
+    mun_destino = get_text_cte(ide, 'xMunFim')
+
+    return (
+        chave_cte, num_cte_xml, cnpj_emi_cte, ie_emi_cte, uf_emi_cte, nome_rem, nome_dest,
+        tomador_cnpj, tomador_nome, mun_origem, mun_destino,
+        round(vlr_total_cte, 2), round(vlr_bc_xml, 2), round(vlr_icms_xml, 2), round(aliq_icms_xml, 2),
+        cfop_xml, cst_cte, item_predominante,
+    )
+
+
+def _extrair_cte_os(inf_cte: ET.Element, chave_cte: str) -> Tuple[Any, ...]:
+    """Linha do CT-e OS (modelo 67), na ordem de COLUNAS_CTE. Sem remetente/destinatário: o tomador vem em <toma>."""
+    ide = inf_cte.find(f"{NS_CTE_FIND}ide")
+    emi = inf_cte.find(f"{NS_CTE_FIND}emit")
+    toma = inf_cte.find(f"{NS_CTE_FIND}toma")
+    vPrest = inf_cte.find(f"{NS_CTE_FIND}vPrest")
+    icms_element = inf_cte.find(f"{NS_CTE_FIND}imp/{NS_CTE_FIND}ICMS")
+    icms_type_tag = next(iter(icms_element), None) if icms_element is not None else None
+    servico = inf_cte.find(f"{NS_CTE_FIND}infCTeNorm/{NS_CTE_FIND}infServico")
+
+    return (
+        chave_cte, get_text_cte(ide, 'nCT'), get_text_cte(emi, 'CNPJ'), get_text_cte(emi, 'IE'),
+        get_text_cte(emi.find(f"{NS_CTE_FIND}enderEmit") if emi is not None else None, 'UF'), '', '',
+        get_text_cte(toma, 'CNPJ', default=get_text_cte(toma, 'CPF')), get_text_cte(toma, 'xNome'),
+        get_text_cte(ide, 'xMunIni'), get_text_cte(ide, 'xMunFim'),
+        round(get_float_cte(vPrest, 'vTPrest'), 2), round(get_float_cte(icms_type_tag, 'vBC'), 2),
+        round(get_float_cte(icms_type_tag, 'vICMS'), 2), round(get_float_cte(icms_type_tag, 'pICMS'), 2),
+        get_text_cte(ide, 'CFOP'), get_text_cte(icms_type_tag, 'CST'), get_text_cte(servico, 'xDescServ'),
+    )
+
+
+# Campos do evento (filhos em qualquer nível, sem olhar o namespace: NF-e e CT-e usam os mesmos nomes)
+CAMPOS_EVENTO = ('chNFe', 'chCTe', 'tpEvento', 'nSeqEvento', 'dhEvento', 'descEvento')
+CAMPOS_RETORNO_EVENTO = ('cStat', 'nProt')  # Só dentro de retEvento (o nProt do detEvento é o da nota)
+TAGS_RETORNO_EVENTO = ('retEvento', 'retEventoCTe')
+
+
+def _nome_local(tag: str) -> str:
+    return tag.rpartition('}')[2]
 
-    def get_float_nfe(element: Optional[ET.Element], path: str, default: float = 0.0) -> float:
-        text_val = get_text_nfe(element, path, '') 
-        if not text_val: return default
-        try:
-            return float(text_val.replace(',', '.')) 
-        except (ValueError, TypeError):
-            return default
-
-    # --- HELPERS DE CT-e ---
-    def get_text_cte(element: Optional[ET.Element], tag_name: str, default: str = '') -> str:
-        """Busca uma tag filha usando o namespace de CTe."""
-        if element is None: return default
-        # Tenta buscar direto com namespace
-        node = element.find(f"{NS_CTE_FIND}{tag_name}")
-        return node.text.strip() if node is not None and node.text is not None else default 
-    
-    def get_float_cte(element: Optional[ET.Element], tag_name: str, default: float = 0.0) -> float:
-        text_val = get_text_cte(element, tag_name, '') 
-        if not text_val: return default
-        try: return float(text_val.replace(',', '.')) 
-        except (ValueError, TypeError): return default
-    # --- FIM DOS HELPERS ---
 
+def _extrair_evento(f: Any) -> ResultadoXml:
+    """Evento de NF-e/CT-e (procEventoNFe, procEventoCTe...), lido em fluxo sem montar a árvore."""
+    evento: Dict[str, Optional[str]] = {}
+    retorno: Dict[str, Optional[str]] = {}
+    dentro_retorno = False
+    for acao, elem in iterparse(f, events=('start', 'end')):
+        nome = _nome_local(elem.tag)
+        if nome in TAGS_RETORNO_EVENTO:
+            dentro_retorno = acao == 'start'
+        elif acao == 'end':
+            if dentro_retorno:
+                if nome in CAMPOS_RETORNO_EVENTO:
+                    retorno.setdefault(nome, elem.text)
+            elif nome in CAMPOS_EVENTO:
+                evento.setdefault(nome, elem.text)
+            elem.clear()
+
+    chave_doc = _texto(evento, 'chNFe', default=_texto(evento, 'chCTe'))
+    if len(chave_doc) != 44:
+        return ResultadoXml('chave_invalida', erro=ERRO_CHAVE_INVALIDA)
+    tp_evento = _texto(evento, 'tpEvento')
+    n_seq = _texto(evento, 'nSeqEvento')
+    linha = (chave_doc, tp_evento, _texto(evento, 'descEvento'), n_seq, _texto(evento, 'dhEvento')[:10],
+             _texto(retorno, 'nProt'), _texto(retorno, 'cStat'))
+    return ResultadoXml('ok', DOC_EVENTO, f"{tp_evento}{chave_doc}{n_seq}", linha)
+
+
+# --- CF-e SAT (modelo 59) ---
+# Leiaute próprio, sem namespace: ide/emit/dest, det/prod + det/imposto (ICMS00, ICMSSN102...,
+# PISAliq, COFINSAliq...) e total (ICMSTot + vCFe). Entra nas tabelas da NF-e, com a chave do
+# Id da infCFe (CFe + 44 dígitos), que é a CHV_CFE do C800.
+SECOES_CFE = ('ide', 'emit', 'dest', 'ICMSTot')
+IMPOSTOS_ITEM_CFE = ('ICMS', 'PIS', 'COFINS')
+TIPO_NOTA_CFE = MAPA_FINNFE['1']  # O CF-e é sempre uma venda ao consumidor (o cancelamento é outro documento)
+
+
+def _extrair_cfe(f: Any, estado: '_EstadoExtracao') -> ResultadoXml:
+    """CF-e SAT lido em fluxo: linha de totais e itens nas colunas da NF-e (COLUNAS_NFE_TOTAIS/ITENS)."""
+    secoes: Dict[str, Dict[str, Optional[str]]] = {nome: {} for nome in SECOES_CFE}
+    v_cfe: Optional[str] = None
+    itens_cfe: List[Tuple[str, Dict[str, Dict[str, Optional[str]]]]] = []
+    item: Optional[Dict[str, Dict[str, Optional[str]]]] = None
+    caminho: List[str] = []
+    chave = ''
+    for acao, elem in iterparse(f, events=('start', 'end')):
+        nome = _nome_local(elem.tag)
+        if acao == 'start':
+            if nome == 'infCFe' and not chave:
+                chave = estado.chave = elem.attrib.get('Id', '').replace('CFe', '')
+            elif nome == 'det':
+                item = {'nItem': {'nItem': elem.attrib.get('nItem', '')}, 'prod': {}, 'ICMS': {}, 'PIS': {}, 'COFINS': {}}
+            caminho.append(nome)
+            continue
+        caminho.pop()
+        pai = caminho[-1] if caminho else ''
+        if item is not None:
+            if nome == 'det':
+                itens_cfe.append((item['nItem']['nItem'], item))
+                item = None
+                elem.clear()  # Item já lido: libera a subárvore
+            elif pai == 'prod':
+                item['prod'].setdefault(nome, elem.text)
+            elif len(caminho) >= 2 and caminho[-2] in IMPOSTOS_ITEM_CFE:
+                item[caminho[-2]].setdefault(nome, elem.text)  # Filhos de ICMS00, PISAliq, COFINSAliq...
+        elif pai in secoes:
+            secoes[pai].setdefault(nome, elem.text)
+        elif pai == 'total' and nome == 'vCFe':
+            v_cfe = v_cfe or elem.text
+
+    if len(chave) != 44:
+        return ResultadoXml('chave_invalida', erro=ERRO_CHAVE_INVALIDA)
+    estado.etapa = ETAPA_EXTRACAO
+    ide, emit, dest, totais = (secoes[nome] for nome in SECOES_CFE)
+    numero = _texto(ide, 'nCFe')
+    data = _texto(ide, 'dEmi')
+    data_emissao = f"{data[:4]}-{data[4:6]}-{data[6:8]}" if len(data) == 8 else data  # AAAAMMDD
+    cnpj_emitente = _texto(emit, 'CNPJ')
+    cnpj_dest = _texto(dest, 'CNPJ')
+    tipo_dest = 'PJ' if len(cnpj_dest) >= 14 else ('PF' if _texto(dest, 'CPF') else 'OUTRO')
+    vl_doc = round(_numero({'vCFe': v_cfe}, 'vCFe'), 2)
+
+    cfops: set = set()
+    cests: set = set()
+    for n_item, campos in itens_cfe:
+        prod, icms, pis, cofins = campos['prod'], campos['ICMS'], campos['PIS'], campos['COFINS']
+        cfop = _texto(prod, 'CFOP'); cfops.add(cfop)
+        cest = _texto(prod, 'CEST'); cests.add(cest)
+        vlr_prod = _numero(prod, 'vProd')
+        vlr_desconto = _numero(prod, 'vDesc')
+        vlr_outras = _numero(prod, 'vOutro')
+        # vItem já desconta os rateios de desconto/acréscimo sobre o subtotal
+        vlr_item = round(_numero(prod, 'vItem') if _texto(prod, 'vItem') else vlr_prod - vlr_desconto + vlr_outras, 2)
+        vlr_icms = round(_numero(icms, 'vICMS'), 2)
+        p_icms_raw = _numero(icms, 'pICMS')
+        # Mesma ordem de COLUNAS_NFE_ITENS (campos que o CF-e não tem ficam vazios/zerados)
+        estado.itens.append((
+            chave, cnpj_emitente, n_item, TIPO_NOTA_CFE, tipo_dest,
+            _texto(prod, 'cProd'), _texto(prod, 'xProd'), _texto(prod, 'NCM'), cest, '',
+            cfop, _numero(prod, 'qCom'), _texto(prod, 'uCom'),
+            _numero(prod, 'vUnCom'), vlr_item, round(vlr_outras, 2),
+            vlr_icms, 0.0, 0.0, 0.0,
+            round(_numero(pis, 'vPIS'), 2), round(_numero(cofins, 'vCOFINS'), 2), 0.0, 0.0,
+            max(round(vlr_item - vlr_icms, 2), 0.0), vl_doc,
+            _texto(icms, 'CST', default=_texto(icms, 'CSOSN')), vlr_item if p_icms_raw > 0 else 0.0,
+            round(p_icms_raw / 100.0, 4) if p_icms_raw > 0 else 0.0,
+            numero, data_emissao, cnpj_dest, '', '',
+            round(vlr_prod, 2), 0.0, 0.0, round(vlr_desconto, 2),
+            0.0, 0.0, p_icms_raw, 0.0,
+            # Alíquotas de PIS/COFINS vêm em fração no CF-e (0.0165); na NF-e, em percentual
+            _texto(pis, 'CST'), round(_numero(pis, 'vBC'), 2), round(_numero(pis, 'pPIS') * 100, 4),
+            _texto(cofins, 'CST'), round(_numero(cofins, 'vBC'), 2), round(_numero(cofins, 'pCOFINS') * 100, 4)
+        ))
+
+    # Mesma ordem de COLUNAS_NFE_TOTAIS
+    linha = (
+        chave, numero, cnpj_emitente,
+        '/'.join(sorted(filter(None, cfops))), '/'.join(sorted(filter(None, cests))),
+        TIPO_NOTA_CFE, _texto(ide, 'mod'),
+        vl_doc, round(_numero(totais, 'vICMS'), 2), 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
+    )
+    return ResultadoXml('ok', DOC_CFE, chave, linha, tuple(estado.itens))
+
+
+class _EstadoExtracao:
+    """Até onde a leitura de um arquivo chegou (para registrar onde ela falhou)."""
+    __slots__ = ('etapa', 'chave', 'itens')
+
+    def __init__(self):
+        self.etapa = ETAPA_ABERTURA
+        self.chave = ''
+        self.itens: List[Tuple[Any, ...]] = []
+
+
+def _extrair_arquivo_xml(arquivo: ArquivoXml, zips: Optional[LeitorZip] = None,
+                         chaves_vistas: Optional[set] = None, reparar: bool = False) -> ResultadoXml:
+    """
+    Lê um XML de NF-e, NFC-e, CF-e SAT, CT-e, CT-e OS ou evento. Nunca levanta exceção: erros voltam
+    na situação do resultado, com o registro do erro (ErroXml). O tipo é identificado pelo
+    início do arquivo (xml_descoberta): MDF-e e documentos desconhecidos voltam como 'ignorado'
+    sem leitura completa.
+    zips: ZIPs já abertos, para membros de ZIP (sem ele, cada membro reabre o ZIP).
+    chaves_vistas: se a chave do Id no início do arquivo já estiver aqui, o XML não é lido
+    por completo e volta como 'duplicada' (quem junta os resultados confirma a repetição).
+    reparar: um XML que o parser recusou passa pelo reparo (xml_reparo.py) e é lido de novo.
+    """
+    if isinstance(arquivo, XmlEmZip) and zips is None:
+        with LeitorZip() as zips_temporarios:
+            return _extrair_arquivo_xml(arquivo, zips_temporarios, chaves_vistas, reparar)
+
+    estado = _EstadoExtracao()
     try:
-        lista_arquivos_xml = list(pasta_xmls.glob('*.xml')) + list(pasta_xmls.glob('*.XML'))
-    except FileNotFoundError: raise Exception(f"A pasta de XMLs não foi encontrada: {pasta_xmls}")
-    
-    total_files = len(lista_arquivos_xml)
-    logging.info(f"Encontrados {total_files} arquivos .xml/.XML para processar.")
-    window.write_event_value('-PROGRESS_UPDATE-', (0, total_files))
+        with _abrir_xml(arquivo, zips) as f:
+            return _extrair_documento(f, estado, chaves_vistas)
+    except ERROS_PARSE as e:
+        return _resultado_erro_parse(arquivo, zips, chaves_vistas, estado.etapa, e, reparar)
+    except Exception as e:
+        # Itens lidos antes do erro são mantidos (mesmo comportamento da leitura item a item)
+        return ResultadoXml('erro', DOC_NFE if estado.chave else '', estado.chave, itens=tuple(estado.itens),
+                            mensagem=str(e), erro=ErroXml(estado.etapa, type(e).__name__, str(e)))
+
+
+def _extrair_documento(f: BinaryIO, estado: _EstadoExtracao, chaves_vistas: Optional[set]) -> ResultadoXml:
+    """Extração a partir do fluxo aberto (o arquivo ou o conteúdo reparado). Levanta os erros."""
+    estado.etapa = ETAPA_CABECALHO
+    inicio = f.read(TAMANHO_CABECALHO_CHAVE)
+    tipo_doc = identificar_documento(inicio)
+    if tipo_doc in (DOC_MDFE, DOC_DESCONHECIDO):
+        return ResultadoXml('ignorado', tipo_doc)
+    if chaves_vistas and tipo_doc != DOC_EVENTO:
+        chave_inicio = chave_no_cabecalho(inicio)
+        if chave_inicio is not None and chave_inicio in chaves_vistas:
+            return ResultadoXml('duplicada', chave=chave_inicio)
+    estado.etapa = ETAPA_LEITURA
+    if tipo_doc == DOC_EVENTO:
+        return _extrair_evento(FluxoComInicio(inicio, f))
+    if tipo_doc == DOC_CFE:
+        return _extrair_cfe(FluxoComInicio(inicio, f), estado)
+    leitura = _ler_xml(FluxoComInicio(inicio, f))
+    estado.etapa = ETAPA_EXTRACAO
+    root = leitura.raiz
+
+    # Tenta encontrar tags de NF-e e CT-e
+    inf_nfe = leitura.inf_nfe
+
+    # --- LÓGICA DE BUSCA DO CT-e ---
+    # Busca <CTe> na raiz <cteProc> ou direto
+    cte_element = root.find(f"{NS_CTE_FIND}CTe")
+    if cte_element is None and root.tag == f"{NS_CTE_FIND}CTe":
+        cte_element = root # Caso o XML seja apenas o CTe sem o proc
+
+    if cte_element is not None:
+        inf_cte = cte_element.find(f"{NS_CTE_FIND}infCte")
+    else:
+        inf_cte = root.find(f".//{NS_CTE_FIND}infCte") # Fallback genérico
+    # --- FIM DA BUSCA CT-e ---
 
-    chaves_processadas: set[str] = set()
-    arquivos_com_erro = 0
+    if inf_nfe is not None:
+        chave = estado.chave = leitura.chave
+        if not chave or len(chave) != 44:
+            return ResultadoXml('chave_invalida', erro=ERRO_CHAVE_INVALIDA)
+        linha = _extrair_nfe(leitura, estado.itens)
+        tipo_nfe = DOC_NFCE if _texto(leitura.cabecalho.get('ide', {}), 'mod') == MODELO_NFCE else DOC_NFE
+        return ResultadoXml('ok', tipo_nfe, chave, linha, tuple(estado.itens))
 
-    for i, arquivo in enumerate(lista_arquivos_xml):
+    if inf_cte is not None:
+        chave_cte = inf_cte.attrib.get('Id', '').replace('CTe', '')
+        if not chave_cte or len(chave_cte) != 44:
+            return ResultadoXml('chave_invalida', erro=ERRO_CHAVE_INVALIDA)
+        if tipo_doc == DOC_CTE_OS:
+            tipo_cte, extrair_cte = DOC_CTE_OS, _extrair_cte_os
+        else:
+            tipo_cte, extrair_cte = DOC_CTE, _extrair_cte
         try:
-            tree = ET.parse(str(arquivo))
-            root = tree.getroot()
-            
-            # Tenta encontrar tags de NF-e e CT-e
-            inf_nfe = root.find('.//nfe:infNFe', NS_NFE)
-            
-            # --- LÓGICA DE BUSCA DO CT-e ---
-            # Busca <CTe> na raiz <cteProc> ou direto
-            cte_element = root.find(f"{NS_CTE_FIND}CTe")
-            if cte_element is None and root.tag == f"{NS_CTE_FIND}CTe":
-                cte_element = root # Caso o XML seja apenas o CTe sem o proc
-
-            if cte_element is not None:
-                inf_cte = cte_element.find(f"{NS_CTE_FIND}infCte")
+            return ResultadoXml('ok', tipo_cte, chave_cte, extrair_cte(inf_cte, chave_cte))
+        except Exception as e_cte:
+            return ResultadoXml('erro_cte', tipo_cte, chave_cte, mensagem=str(e_cte),
+                                erro=ErroXml(ETAPA_EXTRACAO, type(e_cte).__name__, str(e_cte)))
+
+    return ResultadoXml('ignorado')
+
+
+def _resultado_erro_parse(arquivo: ArquivoXml, zips: Optional[LeitorZip], chaves_vistas: Optional[set],
+                          etapa: str, erro_parse: Exception, reparar: bool) -> ResultadoXml:
+    """
+    Registro do XML malformado com a posição do erro em bytes (o arquivo é lido de novo só
+    para isso: são poucos) e, com reparar, a leitura do conteúdo reparado.
+    """
+    try:
+        with _abrir_xml(arquivo, zips) as f:
+            dados: Optional[bytes] = f.read()
+    except Exception:
+        dados = None
+    linha = coluna = deslocamento = None
+    posicao = posicao_erro(erro_parse)
+    if posicao is not None:
+        linha, coluna, em_caracteres = posicao
+        if dados is not None:
+            deslocamento = deslocamento_em_bytes(dados, linha, coluna, em_caracteres)
+    erro = ErroXml(etapa, type(erro_parse).__name__, str(erro_parse), deslocamento, linha, coluna)
+
+    reparado = reparar_xml(dados) if reparar and dados is not None else None
+    if reparado is not None:
+        conteudo, descricao = reparado
+        estado = _EstadoExtracao()
+        try:
+            resultado = _extrair_documento(io.BytesIO(conteudo), estado, chaves_vistas)
+            return resultado._replace(erro=(resultado.erro or erro)._replace(reparo=descricao))
+        except Exception:
+            pass  # Nem o conteúdo reparado é legível: vale o erro original
+    return ResultadoXml('parse_error', erro=erro)
+
+
+# Chaves já lidas por este processo filho (descarte antecipado de repetidos; ver _extrair_lote_xml)
+_chaves_vistas_processo: set = set()
+
+
+def _extrair_lote_xml(arquivos: Sequence[ArquivoXml], backend: str, reparar: bool = False) -> List[ResultadoXml]:
+    """
+    Executado em um processo filho: extrai um lote de arquivos, na ordem recebida.
+    As chaves lidas aqui só valem dentro deste processo: uma 'duplicada' devolvida por ele
+    pode ser a primeira ocorrência na ordem dos arquivos, e então é relida pelo principal.
+    """
+    definir_backend_xml(backend)  # O processo filho não herda a escolha do principal
+    resultados = []
+    with LeitorZip() as zips:
+        for arquivo in arquivos:
+            resultado = _extrair_arquivo_xml(arquivo, zips, _chaves_vistas_processo, reparar)
+            if resultado.chave and resultado.situacao != 'duplicada':
+                _chaves_vistas_processo.add(resultado.chave)
+            resultados.append(resultado)
+    return resultados
+
+
+class _AcumuladorXml:
+    """
+    Junta os resultados na ordem dos arquivos, descartando chaves repetidas (a primeira vence).
+    limite_linhas: linhas em memória por tabela antes de descarregar em Parquet (0 = sem limite).
+    """
+
+    def __init__(self, window: Any, limite_linhas: int = 0):
+        self.window = window
+        self.dados_totais = LinhasComDescarga(COLUNAS_NFE_TOTAIS, limite_linhas, 'nfe_totais')
+        self.dados_itens = LinhasComDescarga(COLUNAS_NFE_ITENS, limite_linhas, 'nfe_itens')
+        self.dados_cte_xml = LinhasComDescarga(COLUNAS_CTE, limite_linhas, 'cte')
+        self.dados_eventos = LinhasComDescarga(COLUNAS_EVENTOS, limite_linhas, 'eventos')
+        self.chaves_processadas: set[str] = set()
+        self.arquivos_com_erro = 0
+        self.por_tipo: Counter = Counter()     # Documentos aproveitados, por tipo
+        self.ignorados: Counter = Counter()    # Arquivos sem NF-e/CT-e/evento, por tipo
+        self.erros: List[Tuple[ArquivoXml, str, ErroXml]] = []  # Para o relatório de erros
+        self.reparados = 0
+
+    def _registrar_erro(self, arquivo: ArquivoXml, resultado: ResultadoXml) -> None:
+        if resultado.erro is not None:
+            self.erros.append((arquivo, resultado.situacao, resultado.erro))
+
+    def adicionar(self, arquivo: ArquivoXml, resultado: ResultadoXml) -> None:
+        situacao = resultado.situacao
+        if situacao == 'ignorado':
+            self.ignorados[resultado.tipo] += 1
+            return
+        if situacao == 'chave_invalida':
+            self._registrar_erro(arquivo, resultado); self.arquivos_com_erro += 1
+            return
+        if situacao == 'parse_error':
+            self.window.write_event_value('-XML_PARSE_ERROR-', arquivo.name); self.arquivos_com_erro += 1
+            self._registrar_erro(arquivo, resultado)
+            return
+
+        if resultado.chave:
+            if resultado.chave in self.chaves_processadas:
+                return
+            self.chaves_processadas.add(resultado.chave)
+
+        self.dados_itens.extend(resultado.itens)
+        if situacao == 'ok':
+            if resultado.erro is not None:
+                self._registrar_erro(arquivo, resultado); self.reparados += 1
+            self.por_tipo[resultado.tipo] += 1
+            if resultado.tipo in (DOC_NFE, DOC_NFCE, DOC_CFE):
+                self.dados_totais.append(resultado.linha)
+            elif resultado.tipo == DOC_EVENTO:
+                self.dados_eventos.append(resultado.linha)
+            else:
+                self.dados_cte_xml.append(resultado.linha)
+        elif situacao == 'erro_cte':
+            logging.warning(f"Erro ao processar dados do CT-e {arquivo.name}: {resultado.mensagem}")
+            self._registrar_erro(arquivo, resultado); self.arquivos_com_erro += 1
+        else:
+            logging.error(f"Erro inesperado ao processar o XML {arquivo.name}: {resultado.mensagem}"); self.arquivos_com_erro += 1
+            self._registrar_erro(arquivo, resultado)
+
+    def descartar(self) -> None:
+        for linhas in (self.dados_totais, self.dados_itens, self.dados_cte_xml, self.dados_eventos):
+            linhas.descartar()
+
+
+class _LeituraPastaXml:
+    """
+    Leva cada arquivo, na ordem da descoberta, ao acumulador: erro da quarentena ou resultado
+    do cache (se houver), descarte de chaves repetidas pelo início do arquivo ou extração
+    completa. As leituras novas são guardadas no cache; as malformadas, na quarentena.
+    """
+
+    def __init__(self, window: Any, cache: Optional[CacheXml], limite_linhas: int = 0,
+                 quarentena: Optional[QuarentenaXml] = None, reparar: bool = False):
+        self.window = window
+        self.cache = cache
+        self.quarentena = quarentena
+        self.reparar = reparar
+        self.acumulador = _AcumuladorXml(window, limite_linhas)
+        self.zips = LeitorZip()
+        self.concluidos = 0
+        self.em_zip = 0
+        self.do_cache = 0
+        self.em_quarentena = 0
+        self.repetidos = 0
+
+    def resultado_guardado(self, arquivo: ArquivoXml) -> Optional[ResultadoXml]:
+        if self.quarentena is not None:
+            erro = self.quarentena.buscar(arquivo)
+            if erro is not None:
+                return ResultadoXml('parse_error', erro=erro)
+        if self.cache is None:
+            return None
+        campos = self.cache.buscar(arquivo)
+        return ResultadoXml(*campos) if campos is not None else None
+
+    def extrair(self, arquivo: ArquivoXml) -> ResultadoXml:
+        # O próprio acumulador diz quais chaves já valem: a 'duplicada' aqui é sempre confirmada
+        return _extrair_arquivo_xml(arquivo, self.zips, self.acumulador.chaves_processadas, self.reparar)
+
+    def concluir(self, arquivo: ArquivoXml, resultado: ResultadoXml, lido: bool) -> None:
+        self.concluidos += 1
+        if isinstance(arquivo, XmlEmZip):
+            self.em_zip += 1
+        if not lido:
+            if resultado.erro is not None and resultado.erro.em_quarentena:
+                self.em_quarentena += 1
             else:
-                inf_cte = root.find(f".//{NS_CTE_FIND}infCte") # Fallback genérico
-            # --- FIM DA BUSCA CT-e ---
-
-            # ==========================================
-            # PROCESSO NF-e
-            # ==========================================
-            if inf_nfe is not None:
-                chave_nfe = inf_nfe.attrib.get('Id', '').replace('NFe', '')
-                if not chave_nfe or len(chave_nfe) != 44:
-                    arquivos_com_erro += 1
-                    continue
-
-                if chave_nfe in chaves_processadas:
-                    window.write_event_value('-PROGRESS_UPDATE-', (i + 1, total_files)) 
-                    continue
-                chaves_processadas.add(chave_nfe)
-                
-                ide = inf_nfe.find('nfe:ide', NS_NFE)
-                emit = inf_nfe.find('nfe:emit', NS_NFE)
-                dest = inf_nfe.find('nfe:dest', NS_NFE)
-                
-                numero_nf = get_text_nfe(ide, 'nfe:nNF')
-                fin_nfe_code = get_text_nfe(ide, 'nfe:finNFe', default='1')
-                tipo_nota_texto = MAPA_FINNFE.get(fin_nfe_code, 'Desconhecido') 
-                
-                cnpj_emitente = get_text_nfe(emit, 'nfe:CNPJ', default=get_text_nfe(emit, 'nfe:CPF'))
-                cnpj_dest = get_text_nfe(dest, 'nfe:CNPJ')
-                cpf_dest = get_text_nfe(dest, 'nfe:CPF')
-                
-                tipo_dest = 'PJ' if (cnpj_dest and len(cnpj_dest) >= 14) else ('PF' if cpf_dest else 'OUTRO')
-                
-                icms_tot_element = root.find('.//nfe:ICMSTot', NS_NFE)
-                dados_impostos: Dict[str, float] = {
-                    'VL_DOC_XML': round(get_float_nfe(icms_tot_element, 'nfe:vNF'), 2),
-                    'ICMS_XML': round(get_float_nfe(icms_tot_element, 'nfe:vICMS'), 2),
-                    'ICMS_ST_XML': round(get_float_nfe(icms_tot_element, 'nfe:vST'), 2),
-                    'IPI_XML': round(get_float_nfe(icms_tot_element, 'nfe:vIPI'), 2),
-                    'IPI_DEVOL_XML': round(get_float_nfe(icms_tot_element, 'nfe:vIPIDevol'), 2),
-                    'FCP_ST_XML': round(get_float_nfe(icms_tot_element, 'nfe:vFCPST'), 2),
-                    'ICMS_SN_XML': 0.0, 'ICMS_MONO_XML': 0.0
-                }
-                    
-                cfops_set: set[str] = set()
-                cest_set: set[str] = set()
-                icms_sn_total_itens: float = 0.0
-                icms_mono_total_itens: float = 0.0
-                
-                itens_list = root.findall('.//nfe:det', NS_NFE)
-
-                for item in itens_list:
-                    prod = item.find('nfe:prod', NS_NFE)
-                    imposto = item.find('nfe:imposto', NS_NFE)
-                    if prod is None or imposto is None: continue 
-
-                    cfop_text = get_text_nfe(prod, 'nfe:CFOP'); cfops_set.add(cfop_text)
-                    cest_code = get_text_nfe(prod, 'nfe:CEST'); cest_set.add(cest_code)
-                    
-                    cst_icms_xml = ''; vlr_bc_icms_xml = 0.0; p_icms_xml = 0.0
-                    vlr_icms_sn_item = 0.0; vlr_icms_mono_item = 0.0
-                    
-                    icms_element = imposto.find('nfe:ICMS', NS_NFE)
-                    if icms_element is not None:
-                        icms_type_tag = next(iter(icms_element), None) 
-                        if icms_type_tag is not None:
-                            cst_icms_xml = get_text_nfe(icms_type_tag, 'nfe:CST', default=get_text_nfe(icms_type_tag, 'nfe:CSOSN'))
-                            vlr_bc_icms_xml = get_float_nfe(icms_type_tag, 'nfe:vBC') 
-                            p_icms_xml_raw = get_float_nfe(icms_type_tag, 'nfe:pICMS')
-                            if p_icms_xml_raw > 0: p_icms_xml = round(p_icms_xml_raw / 100.0, 4)
-                            vlr_icms_sn_item = get_float_nfe(icms_type_tag, 'nfe:vCredICMSSN')
-                    
-                    icms_sn_total_itens += vlr_icms_sn_item
-                    
-                    # Soma campos de ICMS Monofásico
-                    for tag_mono in ['vICMSMono', 'vICMSMonoOp', 'vICMSMonoDifer', 'vICMSMonoRet']:
-                         vlr_icms_mono_item += get_float_nfe(imposto.find(f'.//nfe:{tag_mono}', NS_NFE), '.')
-                    icms_mono_total_itens += vlr_icms_mono_item
-                            
-                    vlr_unit_base = get_float_nfe(prod, 'nfe:vUnCom'); quantidade = get_float_nfe(prod, 'nfe:qCom')
-                    vlr_frete_item = get_float_nfe(prod, 'nfe:vFrete'); vlr_seguro_item = get_float_nfe(prod, 'nfe:vSeg')
-                    vlr_desconto_item = get_float_nfe(prod, 'nfe:vDesc'); vlr_outras_desp = get_float_nfe(prod, 'nfe:vOutro')
-                    
-                    vlr_icms_item = get_float_nfe(imposto.find('.//nfe:vICMS', NS_NFE), '.')
-                    vlr_icms_st_item = get_float_nfe(imposto.find('.//nfe:vICMSST', NS_NFE), '.')
-                    vlr_fcp_st_item = get_float_nfe(imposto.find('.//nfe:vFCPST', NS_NFE), '.')
-                    vlr_pis_item = get_float_nfe(imposto.find('.//nfe:vPIS', NS_NFE), '.')
-                    vlr_cofins_item = get_float_nfe(imposto.find('.//nfe:vCOFINS', NS_NFE), '.')
-                    
-                    vlr_ipi_item = get_float_nfe(imposto.find('.//nfe:vIPI', NS_NFE), '.')
-                    imposto_devol = item.find('nfe:impostoDevol', NS_NFE) 
-                    if imposto_devol: vlr_ipi_item += get_float_nfe(imposto_devol, 'nfe:IPI/nfe:vIPIDevol')
-                    
-                    vlr_prod_base = get_float_nfe(prod, 'nfe:vProd')
-                    vlr_prod_calculado = round(vlr_prod_base + vlr_ipi_item + vlr_icms_st_item + vlr_fcp_st_item + vlr_frete_item + vlr_seguro_item - vlr_desconto_item + vlr_outras_desp, 2)
-                    
-                    icms_a_deduzir = (round(vlr_icms_item, 2) + round(vlr_icms_sn_item, 2)) if vlr_icms_mono_item == 0.0 else 0.0
-                    bc_pis_cofins_item = round(vlr_prod_calculado - icms_a_deduzir - round(vlr_icms_st_item, 2) - round(vlr_fcp_st_item, 2) - round(vlr_ipi_item, 2), 2)
-
-                    item_data: Dict[str, Any] = {
-                        'CHV_NFE': chave_nfe, 'CNPJ_EMITENTE': cnpj_emitente, 'N_ITEM': item.attrib.get('nItem', ''), 
-                        'TIPO_NOTA': tipo_nota_texto, 'TIPO_DESTINATARIO': tipo_dest,
-                        'COD_PROD': get_text_nfe(prod, 'nfe:cProd'), 'DESC_PROD': get_text_nfe(prod, 'nfe:xProd'), 
-                        'NCM': get_text_nfe(prod, 'nfe:NCM'), 'CEST': cest_code, 'cBenef': get_text_nfe(prod, 'nfe:cBenef'), 
-                        'CFOP': cfop_text, 'QTD': quantidade, 'UNID': get_text_nfe(prod, 'nfe:uCom'), 
-                        'VLR_UNIT': vlr_unit_base, 'VLR_PROD': vlr_prod_calculado, 'DESPESA_XML': round(vlr_outras_desp, 2),
-                        'VLR_ICMS': round(vlr_icms_item, 2), 'VLR_ICMS_ST': round(vlr_icms_st_item, 2), 
-                        'VLR_FCP_ST': round(vlr_fcp_st_item, 2), 'VLR_IPI': round(vlr_ipi_item, 2), 
-                        'VLR_PIS': round(vlr_pis_item, 2), 'VLR_COFINS': round(vlr_cofins_item, 2), 
-                        'VLR_ICMS_SN': round(vlr_icms_sn_item, 2), 'VLR_ICMS_MONO': round(vlr_icms_mono_item, 2), 
-                        'BC_PIS_COFINS_CALC': max(bc_pis_cofins_item, 0.0), 'VLR_TOTAL_NF': dados_impostos['VL_DOC_XML'],
-                        'CST_ICMS_XML': cst_icms_xml, 'VLR_BC_ICMS_XML': round(vlr_bc_icms_xml, 2), 'pICMS_XML': p_icms_xml
-                    }
-                    dados_itens.append(item_data)
-                    
-                dados_impostos['ICMS_SN_XML'] = round(icms_sn_total_itens, 2)
-                dados_impostos['ICMS_MONO_XML'] = round(icms_mono_total_itens, 2)
-
-                linha_completa: Dict[str, Any] = {
-                    'CHV_NFE': chave_nfe, 'NUM_NF': numero_nf, 'CNPJ_EMITENTE': cnpj_emitente,
-                    'CFOP_XML': '/'.join(sorted(list(filter(None, cfops_set)))) if cfops_set else '',
-                    'CEST_XML': '/'.join(sorted(list(filter(None, cest_set)))) if cest_set else '',
-                    'TIPO_NOTA': tipo_nota_texto
-                }
-                linha_completa.update(dados_impostos)
-                dados_totais.append(linha_completa)
-            
-
-            elif inf_cte is not None:
-                try:
-                    chave_cte = inf_cte.attrib.get('Id', '').replace('CTe', '')
-                    if not chave_cte or len(chave_cte) != 44:
-                        arquivos_com_erro += 1
-                        continue
-                    
-                    if chave_cte in chaves_processadas:
-                        window.write_event_value('-PROGRESS_UPDATE-', (i + 1, total_files)) 
-                        continue
-                    chaves_processadas.add(chave_cte)
-
-                    # --- Navegação Estrutural ---
-                    ide = inf_cte.find(f"{NS_CTE_FIND}ide")
-                    emi = inf_cte.find(f"{NS_CTE_FIND}emit")
-                    rem = inf_cte.find(f"{NS_CTE_FIND}rem")
-                    dest = inf_cte.find(f"{NS_CTE_FIND}dest")
-                    receb = inf_cte.find(f"{NS_CTE_FIND}receb")
-                    exped = inf_cte.find(f"{NS_CTE_FIND}exped")
-                    
-                    vPrest = inf_cte.find(f"{NS_CTE_FIND}vPrest")
-                    imp = inf_cte.find(f"{NS_CTE_FIND}imp")
-                    
-                    # Busca ICMS dentro de imp
-                    icms_element = imp.find(f"{NS_CTE_FIND}ICMS") if imp is not None else None
-                    icms_type_tag = next(iter(icms_element), None) if icms_element is not None else None
-
-                    # --- Dados Básicos ---
-                    num_cte_xml = get_text_cte(ide, 'nCT') 
-                    cfop_xml = get_text_cte(ide, 'CFOP')
-                    
-                    # --- Emitente (Transportadora) ---
-                    cnpj_emi_cte = get_text_cte(emi, 'CNPJ')
-                    ie_emi_cte = get_text_cte(emi, 'IE')
-                    uf_emi_cte = get_text_cte(emi.find(f"{NS_CTE_FIND}enderEmi"), 'UF') if emi.find(f"{NS_CTE_FIND}enderEmi") is not None else ''
-
-                    # --- Partes Envolvidas (para referência) ---
-                    # Helper rápido para extrair dados de partes
-                    def get_party_data(node):
-                        if node is None: return '', ''
-                        return (get_text_cte(node, 'CNPJ') or get_text_cte(node, 'CPF')), get_text_cte(node, 'xNome')
-
-                    cnpj_rem, nome_rem = get_party_data(rem)
-                    cnpj_dest, nome_dest = get_party_data(dest)
-                    cnpj_receb, nome_receb = get_party_data(receb)
-                    cnpj_exped, nome_exped = get_party_data(exped)
-
-                    # --- LÓGICA DO TOMADOR (PAGADOR) ---
-                    # 0=Remetente, 1=Expedidor, 2=Recebedor, 3=Destinatário, 4=Outros
-                    toma3 = ide.find(f"{NS_CTE_FIND}toma3")
-                    toma4 = ide.find(f"{NS_CTE_FIND}toma4")
-                    
-                    tomador_indicador = ''
-                    tomador_cnpj = ''
-                    tomador_nome = ''
-
-                    if toma3 is not None:
-                        tomador_indicador = get_text_cte(toma3, 'toma')
-                    elif toma4 is not None:
-                        tomador_indicador = get_text_cte(toma4, 'toma')
-                        
-                    if tomador_indicador == '0': # Remetente
-                        tomador_cnpj = cnpj_rem
-                        tomador_nome = nome_rem
-                    elif tomador_indicador == '1': # Expedidor
-                        tomador_cnpj = cnpj_exped
-                        tomador_nome = nome_exped
-                    elif tomador_indicador == '2': # Recebedor
-                        tomador_cnpj = cnpj_receb
-                        tomador_nome = nome_receb
-                    elif tomador_indicador == '3': # Destinatário
-                        tomador_cnpj = cnpj_dest
-                        tomador_nome = nome_dest
-                    elif tomador_indicador == '4': # Outros
-                        # Se for 4, o CNPJ/Nome está dentro da tag toma4 (se ela existir com dados)
-                        # Às vezes toma4 tem filho <toma> e o CNPJ está lá, ou segue a estrutura de terceiros
-                        if toma4 is not None:
-                             tomador_cnpj = get_text_cte(toma4, 'CNPJ') or get_text_cte(toma4, 'CPF')
-                             tomador_nome = get_text_cte(toma4, 'xNome')
-
-                    # --- PRODUTO PREDOMINANTE (CORREÇÃO) ---
-                    # Busca em infCteNorm -> infCarga -> proPred
-                    item_predominante = ''
-                    inf_norm = inf_cte.find(f"{NS_CTE_FIND}infCTeNorm")
-                    if inf_norm is not None:
-                        inf_carga = inf_norm.find(f"{NS_CTE_FIND}infCarga")
-                        if inf_carga is not None:
-                            item_predominante = get_text_cte(inf_carga, 'proPred')
-
-                    # Fallback caso não ache na infCarga (raro, mas existe em CTe antigos ou simplificados)
-                    if not item_predominante:
-                         compl = inf_cte.find(f"{NS_CTE_FIND}compl")
-                         if compl is not None and compl.find(f"{NS_CTE_FIND}ObsCont/infCont") is not None:
-                             item_predominante = get_text_cte(compl.find(f"{NS_CTE_FIND}ObsCont/infCont"), 'xCampo')
-                    
-                    # --- Valores e Impostos ---
-                    vlr_total_cte = get_float_cte(vPrest, 'vTPrest')
-                    vlr_bc_xml = get_float_cte(icms_type_tag, 'vBC')
-                    vlr_icms_xml = get_float_cte(icms_type_tag, 'vICMS')
-                    aliq_icms_xml = get_float_cte(icms_type_tag, 'pICMS')
-                    cst_cte = get_text_cte(icms_type_tag, 'CST')
-                    
-                    # --- Locais ---
-                    mun_origem = get_text_cte(ide, 'xMunIni')
-                    mun_destino = get_text_cte(ide, 'xMunFim')
-
-                    dados_cte_xml.append({
-                        'CHV_CTE': chave_cte,
-                        'NUM_CTE_XML': num_cte_xml,
-                        'CNPJ_TRANSPORTADOR': cnpj_emi_cte,
-                        'IE_TRANSPORTADOR': ie_emi_cte,
-                        'UF_EMITENTE_CTE': uf_emi_cte,
-                        'REMETENTE_NOME': nome_rem,
-                        'DESTINATARIO_NOME': nome_dest,
-                        'TOMADOR_CNPJ': tomador_cnpj,
-                        'TOMADOR_NOME': tomador_nome,
-                        'MUN_ORIGEM': mun_origem,
-                        'MUN_DESTINO': mun_destino,
-                        'VL_TOTAL_CTE_XML': round(vlr_total_cte, 2),
-                        'VL_BC_ICMS_XML': round(vlr_bc_xml, 2),
-                        'VL_ICMS_XML': round(vlr_icms_xml, 2),
-                        'ALIQ_ICMS_XML': round(aliq_icms_xml, 2),
-                        'CFOP_XML': cfop_xml,
-                        'CST_XML': cst_cte,
-                        'ITEM_PREDOMINANTE': item_predominante,
-                    })
-
-                except Exception as e_cte:
-                    logging.warning(f"Erro ao processar dados do CT-e {arquivo.name}: {e_cte}")
-                    arquivos_com_erro += 1
-                    continue
-            
+                self.do_cache += 1
+        if resultado.situacao == 'duplicada':
+            if resultado.chave in self.acumulador.chaves_processadas:
+                self.repetidos += 1
+                return
+            # Repetida só para o processo filho: esta é a primeira ocorrência na ordem dos arquivos
+            resultado = _extrair_arquivo_xml(arquivo, self.zips, reparar=self.reparar)
+        if lido:
+            reparado = resultado.erro is not None and bool(resultado.erro.reparo)
+            if self.cache is not None and not reparado:  # Reparados dependem da opção: não vão ao cache
+                self.cache.guardar(arquivo, resultado.situacao, resultado)
+            if self.quarentena is not None:
+                if resultado.situacao == 'parse_error':
+                    self.quarentena.registrar(arquivo, resultado.erro)
+                else:
+                    self.quarentena.liberar(arquivo)
+        self.acumulador.adicionar(arquivo, resultado)
+
+    def progresso(self, descobertos: int) -> None:
+        self.window.write_event_value('-PROGRESS_UPDATE-', (self.concluidos, max(descobertos, self.concluidos)))
+
+    def fechar(self) -> None:
+        self.zips.fechar()
+        if self.cache is not None:
+            self.cache.fechar()
+        if self.quarentena is not None:
+            self.quarentena.fechar()
+
+
+def _resolver_num_workers(num_workers: Optional[int]) -> int:
+    """0/None = automático (todos os núcleos); 1 = serial."""
+    if not num_workers or num_workers < 0:
+        return os.cpu_count() or 1
+    return num_workers
+
+
+def _processar_serial(entradas: Iterable[Tuple[ArquivoXml, Optional[ResultadoXml]]], leitura: _LeituraPastaXml,
+                      descoberta: DescobertaEmSegundoPlano) -> None:
+    for arquivo, resultado in entradas:
+        if resultado is None:
+            leitura.concluir(arquivo, leitura.extrair(arquivo), lido=True)
+        else:
+            leitura.concluir(arquivo, resultado, lido=False)
+        leitura.progresso(descoberta.descobertos)
+
+
+def _processar_paralelo(entradas: Iterable[Tuple[ArquivoXml, Optional[ResultadoXml]]], leitura: _LeituraPastaXml,
+                        descoberta: DescobertaEmSegundoPlano, num_workers: int) -> None:
+    """
+    Lotes de arquivos em processos filhos, enviados à medida que a pasta é listada. Os lotes
+    são concluídos na ordem de envio (a primeira chave vence). Se o pool quebrar, o restante
+    é lido no modo serial, sem perder o que já foi concluído.
+    """
+    logging.info(f"Processando XMLs em paralelo em {num_workers} processos.")
+    fila: Deque[Tuple[List[Tuple[ArquivoXml, Optional[ResultadoXml]]], Any]] = deque()
+    executor: Optional[ProcessPoolExecutor] = ProcessPoolExecutor(max_workers=num_workers)
+
+    def enviar(lote: List[Tuple[ArquivoXml, Optional[ResultadoXml]]]) -> None:
+        a_ler = [arquivo for arquivo, resultado in lote if resultado is None]
+        futuro = executor.submit(_extrair_lote_xml, a_ler, backend_xml(), leitura.reparar) \
+            if a_ler and executor is not None else None
+        fila.append((lote, futuro))
+
+    def concluir_primeiro() -> None:
+        nonlocal executor
+        lote, futuro = fila.popleft()
+        lidos: Optional[Iterator[ResultadoXml]] = None
+        if futuro is not None:
+            try:
+                lidos = iter(futuro.result())
+            except BrokenProcessPool as e:
+                logging.warning(f"Falha no modo paralelo dos XMLs ({e}). Lendo o restante no modo serial.")
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = None
+        for arquivo, resultado in lote:
+            if resultado is not None:
+                leitura.concluir(arquivo, resultado, lido=False)
             else:
-                tag_name = root.tag.split('}')[-1] if '}' in root.tag else root.tag
-                if tag_name not in ['cteProc', 'CteProc', 'nfeProc']: 
-                    pass
-                continue
-            
-        except ET.ParseError: 
-            window.write_event_value('-XML_PARSE_ERROR-', arquivo.name); arquivos_com_erro += 1
-            continue
-        except Exception as e: 
-            logging.error(f"Erro inesperado ao processar o XML {arquivo.name}: {e}"); arquivos_com_erro += 1
-            continue
-        
-        window.write_event_value('-PROGRESS_UPDATE-', (i + 1, total_files))
+                leitura.concluir(arquivo, next(lidos) if lidos is not None else leitura.extrair(arquivo), lido=True)
+        leitura.progresso(descoberta.descobertos)
+
+    try:
+        lote: List[Tuple[ArquivoXml, Optional[ResultadoXml]]] = []
+        for entrada in entradas:
+            lote.append(entrada)
+            if len(lote) >= TAMANHO_LOTE:
+                enviar(lote)
+                lote = []
+            while fila and (len(fila) >= num_workers * LOTES_POR_PROCESSO
+                            or fila[0][1] is None or fila[0][1].done()):
+                concluir_primeiro()
+        if lote:
+            enviar(lote)
+        while fila:
+            concluir_primeiro()
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
 
-    if not dados_totais and not dados_cte_xml: 
+
+class _SemJanela:
+    """Janela nula para leituras sem interface (benchmark, scripts)."""
+
+    def write_event_value(self, *_) -> None:
+        pass
+
+
+def processar_pasta_xml(pasta_xmls: Union[Path, Sequence[Path]], window: Any, centavos: bool = False,
+                        num_workers: Optional[int] = 1, pasta_cache: Optional[Path] = None,
+                        tamanho_maximo_cache_mb: float = TAMANHO_MAXIMO_CACHE_MB,
+                        atualizar_cache: bool = False, recursivo: bool = True,
+                        limite_linhas_memoria: int = 0, pasta_quarentena: Optional[Path] = None,
+                        reparar: bool = False,
+                        relatorio_erros: Optional[Path] = None) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Lê arquivos XML e retorna quatro DataFrames: (df_nfe_totais, df_nfe_itens, df_cte_totais, df_eventos).
+    NFC-e e CF-e SAT entram com as NF-e (coluna MODELO_XML) e CT-e OS com os CT-e; df_eventos traz os eventos
+    de NF-e/CT-e (ver chaves_canceladas_xml). MDF-e e outros documentos são ignorados pelo início do arquivo.
+    pasta_xmls: uma pasta ou uma lista de pastas; recursivo: inclui as subpastas. XMLs dentro
+    de .zip também são lidos (ver xml_descoberta.py). A leitura começa enquanto as pastas
+    ainda estão sendo listadas.
+    centavos: valores monetários como int64 em centavos (ver centavos.py).
+    num_workers: processos para ler os arquivos em paralelo. 1 = serial, 0/None = todos os
+    núcleos. Pastas pequenas são sempre lidas no modo serial. O resultado é o mesmo nos dois modos.
+    pasta_cache: se informada, o resultado de cada arquivo fica guardado (xml_cache.py) e só
+    arquivos novos ou alterados são lidos de novo. atualizar_cache: relê tudo e regrava o cache.
+    window: recebe os eventos de progresso; None para ler sem interface.
+    limite_linhas_memoria: acima deste número de linhas (por tabela) as linhas vão para Parquet
+    temporário e os DataFrames são montados a partir dele (xml_descarga.py); 0 = tudo em memória.
+    pasta_quarentena: se informada, XMLs malformados ficam em quarentena (xml_quarentena.py) e
+    não são lidos de novo enquanto não mudarem. reparar: tenta reparar os malformados (xml_reparo.py).
+    relatorio_erros: CSV com um registro por arquivo com erro (etapa, exceção, posição em bytes),
+    gravado só se houver erros.
+    """
+    arquivos = iterar_arquivos_xml(pasta_xmls, recursivo=recursivo)  # Valida as pastas antes de começar
+    if window is None:
+        window = _SemJanela()
+    logging.info(f'Lendo arquivos XML (NF-e e CT-e) com {backend_xml()}...')
+    window.write_event_value('-PROGRESS_UPDATE-', (0, 0))
+
+    cache = CacheXml(pasta_cache, tamanho_maximo_cache_mb, atualizar=atualizar_cache) if pasta_cache is not None else None
+    quarentena = QuarentenaXml(pasta_quarentena, reparar, atualizar=atualizar_cache) \
+        if pasta_quarentena is not None else None
+    leitura = _LeituraPastaXml(window, cache, limite_linhas_memoria, quarentena, reparar)
+    descoberta = DescobertaEmSegundoPlano(arquivos)
+    entradas = ((arquivo, leitura.resultado_guardado(arquivo)) for arquivo in descoberta)
+    try:
+        return _ler_entradas(entradas, leitura, descoberta, num_workers, centavos, relatorio_erros)
+    finally:
+        leitura.acumulador.descartar()  # Temporários em Parquet, se a leitura parou no meio
+
+
+def _ler_entradas(entradas: Iterator[Tuple[ArquivoXml, Optional[ResultadoXml]]], leitura: _LeituraPastaXml,
+                  descoberta: DescobertaEmSegundoPlano, num_workers: Optional[int], centavos: bool,
+                  relatorio_erros: Optional[Path] = None) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    try:
+        workers = _resolver_num_workers(num_workers)
+        if workers > 1:
+            # Só vale subir os processos se houver arquivos suficientes para ler (fora do cache)
+            iniciais: List[Tuple[ArquivoXml, Optional[ResultadoXml]]] = []
+            a_ler = 0
+            for entrada in entradas:
+                iniciais.append(entrada)
+                a_ler += entrada[1] is None
+                if a_ler >= MINIMO_ARQUIVOS_PARALELO:
+                    break
+            entradas = chain(iniciais, entradas)
+            if a_ler < MINIMO_ARQUIVOS_PARALELO:
+                workers = 1
+        if workers > 1:
+            _processar_paralelo(entradas, leitura, descoberta, workers)
+        else:
+            _processar_serial(entradas, leitura, descoberta)
+    finally:
+        descoberta.parar()
+        leitura.fechar()
+
+    acumulador = leitura.acumulador
+    total_files = leitura.concluidos
+    logging.info(f"Encontrados {total_files} arquivos .xml/.XML ({leitura.em_zip} dentro de arquivos .zip).")
+    if leitura.do_cache:
+        logging.info(f"{leitura.do_cache} de {total_files} XMLs vieram do cache.")
+    if leitura.repetidos:
+        logging.info(f"{leitura.repetidos} XMLs com chave repetida descartados sem leitura completa.")
+    if acumulador.por_tipo:
+        logging.info("Documentos lidos: " + ", ".join(
+            f"{qtd} {NOMES_DOCUMENTO.get(tipo, tipo)}" for tipo, qtd in acumulador.por_tipo.most_common()) + ".")
+    if acumulador.ignorados:
+        logging.info("XMLs ignorados: " + ", ".join(
+            f"{qtd} {NOMES_DOCUMENTO.get(tipo, tipo)}" for tipo, qtd in acumulador.ignorados.most_common()) + ".")
+
+    if not acumulador.dados_totais and not acumulador.dados_cte_xml:
         logging.warning("Nenhum XML de NF-e ou CT-e válido foi processado.")
-    
-    if arquivos_com_erro > 0:
-        logging.warning(f"{arquivos_com_erro} de {total_files} arquivos XML não puderam ser processados.")
+
+    if acumulador.arquivos_com_erro > 0:
+        logging.warning(f"{acumulador.arquivos_com_erro} de {total_files} arquivos XML não puderam ser processados.")
+    if leitura.em_quarentena:
+        logging.info(f"{leitura.em_quarentena} XMLs malformados em quarentena não foram lidos de novo (sem alteração desde o erro).")
+    if acumulador.reparados:
+        logging.info(f"{acumulador.reparados} XMLs malformados foram lidos após reparo.")
+    if relatorio_erros is not None and acumulador.erros:
+        try:
+            salvar_relatorio_erros_xml(acumulador.erros, relatorio_erros)
+            logging.info(f"Detalhes dos erros nos XMLs salvos em: {relatorio_erros}")
+        except OSError as e:
+            logging.warning(f"Não foi possível salvar o relatório de erros dos XMLs ({e}).")
 
     logging.info("Processamento de XMLs (NF-e e CT-e) concluído.")
-    df_totais = pd.DataFrame(dados_totais)
-    df_itens = pd.DataFrame(dados_itens) 
-    df_cte_xml = pd.DataFrame(dados_cte_xml)
+    df_totais = acumulador.dados_totais.para_dataframe()
+    df_itens = acumulador.dados_itens.para_dataframe()
+    df_cte_xml = acumulador.dados_cte_xml.para_dataframe()
+    df_eventos = acumulador.dados_eventos.para_dataframe()
 
     if not df_totais.empty: df_totais.drop_duplicates(subset=['CHV_NFE'], keep='first', inplace=True)
     if not df_itens.empty: df_itens.drop_duplicates(subset=['CHV_NFE', 'N_ITEM'], keep='first', inplace=True)
     if not df_cte_xml.empty: df_cte_xml.drop_duplicates(subset=['CHV_CTE'], keep='first', inplace=True)
-    
-    return df_totais, df_itens, df_cte_xml
\ No newline at end of file
+
+    if centavos:
+        # Valores já arredondados em 2 casas (vários são somas calculadas acima): conversão exata
+        for df in (df_totais, df_itens, df_cte_xml):
+            reais_para_centavos(df)
+    # CFOP, CST, tipo de nota, UF... como 'category' (ver categorias.py)
+    for df in (df_totais, df_itens, df_cte_xml):
+        para_categorias(df)
+
+    return df_totais, df_itens, df_cte_xml, df_eventos
+
+
+def processar_pasta_xml_com_opcoes(pasta_xmls: Union[Path, Sequence[Path]], window: Any,
+                                   opcoes_desempenho: Optional[Dict[str, Any]] = None,
+                                   centavos: bool = False,
+                                   relatorio_erros: Optional[Path] = None) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    processar_pasta_xml com as opções de PERFORMANCE do config.json (backend, processos, cache,
+    subpastas, quarentena e reparo). Conciliação e Invest leem os XMLs por aqui: com o mesmo
+    cache, quem roda depois na mesma pasta reaproveita o que o primeiro já leu.
+    """
+    opcoes = opcoes_desempenho or {}
+    definir_backend_xml(opcoes.get('XML_BACKEND', 'elementtree'))
+    pasta_cache = opcoes.get('PASTA_CACHE') if opcoes.get('XML_CACHE', False) else None
+    pasta_quarentena = opcoes.get('PASTA_CACHE') if opcoes.get('XML_QUARENTENA', True) else None
+    return processar_pasta_xml(
+        pasta_xmls, window, centavos=centavos, num_workers=opcoes.get('XML_WORKERS', 1),
+        pasta_cache=Path(pasta_cache) if pasta_cache else None,
+        tamanho_maximo_cache_mb=opcoes.get('XML_CACHE_MAX_MB', TAMANHO_MAXIMO_CACHE_MB),
+        atualizar_cache=opcoes.get('ATUALIZAR_CACHE', False),
+        recursivo=opcoes.get('XML_RECURSIVO', True),
+        limite_linhas_memoria=opcoes.get('XML_LIMITE_LINHAS_MEMORIA', 0),
+        pasta_quarentena=Path(pasta_quarentena) if pasta_quarentena else None,
+        reparar=opcoes.get('XML_REPARAR', False),
+        relatorio_erros=relatorio_erros
+    )
+
+
+def chaves_canceladas_xml(df_eventos: pd.DataFrame) -> set:
+    """Chaves de NF-e/CT-e com evento de cancelamento registrado na SEFAZ."""
+    if df_eventos is None or df_eventos.empty:
+        return set()
+    cancelados = df_eventos['TP_EVENTO'].isin(TP_EVENTOS_CANCELAMENTO) & \
+        df_eventos['CSTAT_EVENTO'].isin(CSTAT_EVENTO_REGISTRADO)
+    return set(df_eventos.loc[cancelados, 'CHV_DOC'])
\ No newline at end of file
@@ -0,0 +1,181 @@
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from .xml_cache import identificar_arquivo_xml
+
+# Erros de leitura dos XMLs, um registro por arquivo, e a quarentena dos malformados.
+# Um XML que o parser recusou fica registrado com o tamanho + mtime do arquivo (como no cache,
+# XMLs dentro de .zip são validados pelo .zip) e não é lido de novo nas próximas execuções
+# enquanto não mudar: o registro do erro é repetido no relatório. O banco fica na pasta de
+# cache (PERFORMANCE.PASTA_CACHE), separado do cache dos XMLs.
+
+NOME_ARQUIVO_QUARENTENA = 'xml_quarentena.sqlite'
+
+# --- Etapas da leitura de um arquivo (onde o erro aconteceu) ---
+ETAPA_ABERTURA = 'abertura'        # Abrir o arquivo ou o membro do ZIP
+ETAPA_CABECALHO = 'cabecalho'      # Início do arquivo (tipo de documento e chave)
+ETAPA_LEITURA = 'leitura'          # Parser percorrendo o XML
+ETAPA_EXTRACAO = 'extracao'        # Montagem das linhas da NF-e/CT-e/evento
+ETAPA_CHAVE = 'chave'              # Chave de acesso ausente ou inválida
+
+COLUNAS_RELATORIO_ERROS = ['ARQUIVO', 'SITUACAO', 'ETAPA', 'ERRO', 'DESLOCAMENTO_BYTES', 'LINHA', 'COLUNA',
+                           'MENSAGEM', 'EM_QUARENTENA', 'REPARO']
+
+_SQL_CRIAR = """
+CREATE TABLE IF NOT EXISTS xml_quarentena (
+    caminho      TEXT PRIMARY KEY,
+    tamanho      INTEGER NOT NULL,
+    mtime_ns     INTEGER NOT NULL,
+    com_reparo   INTEGER NOT NULL,
+    registro     REAL NOT NULL,
+    etapa        TEXT NOT NULL,
+    classe       TEXT NOT NULL,
+    mensagem     TEXT NOT NULL,
+    deslocamento INTEGER,
+    linha        INTEGER,
+    coluna       INTEGER
+)"""
+
+
+class ErroXml(NamedTuple):
+    """Por que um arquivo não foi aproveitado (ou precisou de reparo para ser lido)."""
+    etapa: str                          # ETAPA_*
+    classe: str                         # Classe da exceção (ex.: 'ParseError')
+    mensagem: str = ''
+    deslocamento: Optional[int] = None  # Byte do arquivo onde o parser parou (a partir de 0)
+    linha: Optional[int] = None
+    coluna: Optional[int] = None
+    reparo: str = ''                    # Reparos que tornaram o arquivo legível (ver xml_reparo.py)
+    em_quarentena: bool = False         # Registro repetido da quarentena, sem nova leitura
+
+
+def _abrir(caminho_banco: Path) -> sqlite3.Connection:
+    caminho_banco.parent.mkdir(parents=True, exist_ok=True)
+    conexao = sqlite3.connect(str(caminho_banco), timeout=30)
+    conexao.execute("PRAGMA journal_mode = WAL")
+    conexao.execute(_SQL_CRIAR)
+    return conexao
+
+
+class QuarentenaXml:
+    """
+    Uso em uma leitura de pasta: buscar() antes de ler cada arquivo (registro do erro, se o
+    arquivo está em quarentena e não mudou), registrar() para os malformados lidos agora,
+    liberar() para os que voltaram a ser lidos sem erro e fechar() no fim, que grava.
+    Os registros são poucos e ficam todos em memória. Falhas do SQLite só geram aviso.
+    """
+
+    def __init__(self, pasta_cache: Path, reparar: bool = False, atualizar: bool = False):
+        self.reparar = reparar
+        self.atualizar = atualizar  # True: relê os arquivos em quarentena (ex.: 'ignorar cache')
+        self._registros: Dict[str, Tuple[int, int, bool, ErroXml]] = {}
+        self._novos: List[Tuple[Any, ...]] = []
+        self._liberados: List[Tuple[str]] = []
+        self._conexao: Optional[sqlite3.Connection] = None
+        try:
+            self._conexao = _abrir(Path(pasta_cache) / NOME_ARQUIVO_QUARENTENA)
+            for caminho, tamanho, mtime_ns, com_reparo, etapa, classe, mensagem, deslocamento, linha, coluna \
+                    in self._conexao.execute(
+                        "SELECT caminho, tamanho, mtime_ns, com_reparo, etapa, classe, mensagem, "
+                        "deslocamento, linha, coluna FROM xml_quarentena"):
+                self._registros[caminho] = (tamanho, mtime_ns, bool(com_reparo),
+                                            ErroXml(etapa, classe, mensagem, deslocamento, linha, coluna))
+        except (sqlite3.Error, OSError) as e:
+            logging.warning(f"Quarentena dos XMLs indisponível ({e}). Arquivos malformados serão lidos de novo.")
+            self._conexao = None
+        if self._registros:
+            logging.info(f"{len(self._registros)} XMLs malformados em quarentena.")
+
+    def buscar(self, arquivo: Any) -> Optional[ErroXml]:
+        """Erro registrado para o arquivo, se ele continua igual (e o reparo já foi tentado, se ativo)."""
+        if not self._registros or self.atualizar:
+            return None
+        caminho, no_disco = identificar_arquivo_xml(arquivo)
+        registro = self._registros.get(caminho)
+        if registro is None:
+            return None
+        tamanho, mtime_ns, com_reparo, erro = registro
+        if self.reparar and not com_reparo:
+            return None  # Entrou em quarentena sem o reparo ativo: tenta reparar agora
+        try:
+            info = os.stat(no_disco)
+        except OSError:
+            return None
+        if (info.st_size, info.st_mtime_ns) != (tamanho, mtime_ns):
+            return None
+        return erro._replace(em_quarentena=True)
+
+    def registrar(self, arquivo: Any, erro: ErroXml) -> None:
+        """Põe em quarentena um arquivo que o parser recusou nesta execução."""
+        if self._conexao is None:
+            return
+        caminho, no_disco = identificar_arquivo_xml(arquivo)
+        try:
+            info = os.stat(no_disco)
+        except OSError:
+            return
+        self._registros[caminho] = (info.st_size, info.st_mtime_ns, self.reparar, erro)
+        self._novos.append((caminho, info.st_size, info.st_mtime_ns, int(self.reparar), time.time(),
+                            erro.etapa, erro.classe, erro.mensagem, erro.deslocamento, erro.linha, erro.coluna))
+
+    def liberar(self, arquivo: Any) -> None:
+        """Tira da quarentena um arquivo que foi lido sem erro de parser (foi corrigido ou reparado)."""
+        if self._conexao is None or not self._registros:
+            return
+        caminho, _ = identificar_arquivo_xml(arquivo)
+        if self._registros.pop(caminho, None) is not None:
+            self._liberados.append((caminho,))
+
+    def fechar(self) -> None:
+        """Grava as mudanças e fecha o banco."""
+        if self._conexao is None:
+            return
+        try:
+            with self._conexao:
+                if self._liberados:
+                    self._conexao.executemany("DELETE FROM xml_quarentena WHERE caminho = ?", self._liberados)
+                if self._novos:
+                    self._conexao.executemany(
+                        "INSERT OR REPLACE INTO xml_quarentena VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self._novos)
+            self._conexao.close()
+        except sqlite3.Error as e:
+            logging.warning(f"Falha ao gravar a quarentena dos XMLs ({e}).")
+        if self._liberados:
+            logging.info(f"{len(self._liberados)} XMLs saíram da quarentena.")
+        self._novos.clear()
+        self._liberados.clear()
+        self._conexao = None
+
+
+def limpar_quarentena_xml(pasta_cache: Path) -> int:
+    """Esvazia a quarentena dos XMLs. Retorna quantos arquivos foram liberados."""
+    caminho_banco = Path(pasta_cache) / NOME_ARQUIVO_QUARENTENA
+    if not caminho_banco.exists():
+        return 0
+    try:
+        conexao = _abrir(caminho_banco)
+        with conexao:
+            removidos = conexao.execute("DELETE FROM xml_quarentena").rowcount
+        conexao.close()
+    except sqlite3.Error as e:
+        raise Exception(f"Não foi possível limpar a quarentena dos XMLs: {e}")
+    return max(removidos, 0)
+
+
+def salvar_relatorio_erros_xml(erros: Sequence[Tuple[Any, str, ErroXml]], caminho: Path) -> None:
+    """
+    Grava os erros (arquivo, situação, ErroXml) em CSV (';', UTF-8 com BOM, abre direto no Excel).
+    """
+    linhas = [(str(arquivo), situacao, erro.etapa, erro.classe, erro.deslocamento, erro.linha, erro.coluna,
+               erro.mensagem, 'SIM' if erro.em_quarentena else 'NAO', erro.reparo)
+              for arquivo, situacao, erro in erros]
+    df = pd.DataFrame(linhas, columns=COLUNAS_RELATORIO_ERROS)
+    for coluna in ('DESLOCAMENTO_BYTES', 'LINHA', 'COLUNA'):
+        df[coluna] = df[coluna].astype('Int64')
+    df.to_csv(caminho, sep=';', index=False, encoding='utf-8-sig')
@@ -0,0 +1,159 @@
+import codecs
+import re
+from typing import List, Optional, Tuple
+
+# Reparo de XMLs malformados (opcional, PERFORMANCE.XML_REPARAR) e localização do erro em bytes.
+# Só roda para arquivos que o parser recusou. Os reparos corrigem defeitos comuns de quem gera
+# ou copia os XMLs, sem inventar dados: conteúdo antes da raiz (BOM duplicado, espaços, lixo),
+# codificação declarada no prólogo diferente da real, conteúdo após o fim do documento e
+# arquivos truncados depois do fim da NF-e/CT-e/evento (ex.: protocolo cortado).
+
+_RE_DECLARACAO = re.compile(rb'^<\?xml\b[^>]*?\?>')
+_RE_ENCODING = re.compile(rb'(\sencoding\s*=\s*["\'])([\w.:-]+)(["\'])')
+# Tags de abertura/fechamento (ignora declarações, comentários, CDATA e DOCTYPE)
+_RE_TAG = re.compile(rb'<(/?)([A-Za-z_][\w.:-]*)(?:\s[^<>]*?)?(/?)>')
+_RE_COMENTARIO_CDATA = re.compile(rb'<!--.*?-->|<!\[CDATA\[.*?\]\]>', re.S)
+# Fim de um documento completo: o que vem depois dele pode ser descartado de um arquivo truncado
+_RE_FIM_DOCUMENTO = re.compile(rb'</(?:[\w.-]+:)?(?:NFe|CTe|CTeOS|evento|eventoCTe)>')
+
+_BOMS_UTF16 = (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+_NOMES_UTF8 = ('utf-8', 'utf8')
+
+
+def _codificacao_declarada(dados: bytes) -> Optional[str]:
+    declaracao = _RE_DECLARACAO.match(dados)
+    if declaracao is None:
+        return None
+    encoding = _RE_ENCODING.search(declaracao.group(0))
+    return encoding.group(2).decode('ascii').lower() if encoding else None
+
+
+def deslocamento_em_bytes(dados: bytes, linha: int, coluna: int, em_caracteres: bool = True) -> Optional[int]:
+    """
+    Posição (em bytes, a partir de 0) de uma linha/coluna informada pelo parser (ver
+    xml_backend.posicao_erro). Coluna em caracteres: convertida pela codificação declarada
+    (UTF-8 se não houver). None se a posição não existe no arquivo ou se ele está em UTF-16.
+    """
+    if linha < 1 or dados.startswith(_BOMS_UTF16):
+        return None
+    linhas = dados.splitlines(keepends=True)  # Mesmas quebras do parser: \n, \r\n e \r
+    if linha > len(linhas) + 1:
+        return None
+    inicio_linha = sum(len(trecho) for trecho in linhas[:linha - 1])
+    texto_linha = linhas[linha - 1] if linha <= len(linhas) else b''
+    if not em_caracteres or _codificacao_declarada(dados) not in (None,) + _NOMES_UTF8:
+        return inicio_linha + min(coluna, len(texto_linha))  # Codificações de 1 byte por caractere
+    # UTF-8: cada caractere começa em um byte que não é de continuação (10xxxxxx)
+    vistos = 0
+    for posicao, byte in enumerate(texto_linha):
+        if byte & 0xC0 != 0x80:
+            if vistos == coluna:
+                return inicio_linha + posicao
+            vistos += 1
+    return inicio_linha + len(texto_linha)
+
+
+def _corrigir_codificacao(dados: bytes, reparos: List[str]) -> bytes:
+    """Deixa o arquivo em UTF-8 com a declaração em UTF-8 quando a declarada não confere."""
+    if dados.isascii():
+        return dados
+    declarada = _codificacao_declarada(dados)
+    try:
+        dados.decode('utf-8')
+        eh_utf8 = True
+    except UnicodeDecodeError:
+        eh_utf8 = False
+    if eh_utf8:
+        if declarada in (None,) + _NOMES_UTF8:
+            return dados
+        reparos.append(f'codificação declarada {declarada} trocada por UTF-8')
+        return _declarar_utf8(dados)
+    if declarada not in (None,) + _NOMES_UTF8:
+        return dados  # Declarou uma codificação de 1 byte e não é UTF-8: a declaração pode estar certa
+    # Declarado (ou assumido) UTF-8 com bytes de Windows-1252/Latin-1
+    try:
+        texto = dados.decode('cp1252')
+        origem = 'Windows-1252'
+    except UnicodeDecodeError:
+        texto = dados.decode('latin-1')
+        origem = 'Latin-1'
+    reparos.append(f'texto em {origem} declarado como UTF-8 convertido')
+    return _declarar_utf8(texto.encode('utf-8'))
+
+
+def _declarar_utf8(dados: bytes) -> bytes:
+    declaracao = _RE_DECLARACAO.match(dados)
+    if declaracao is None:
+        return dados
+    nova, trocas = _RE_ENCODING.subn(rb'\g<1>UTF-8\g<3>', declaracao.group(0), count=1)
+    if not trocas:
+        return dados
+    return nova + dados[declaracao.end():]
+
+
+def _tags_abertas(dados: bytes) -> Tuple[List[bytes], Optional[int]]:
+    """
+    Tags ainda abertas no fim do trecho e onde a raiz fechou (None se não fechou).
+    Fechamentos que não casam com a tag aberta são ignorados (o reparo não os corrige).
+    """
+    sem_comentarios = _RE_COMENTARIO_CDATA.sub(lambda m: b' ' * len(m.group(0)), dados)
+    pilha: List[bytes] = []
+    for tag in _RE_TAG.finditer(sem_comentarios):
+        fechamento, nome, vazia = tag.groups()
+        if vazia:
+            continue
+        if not fechamento:
+            pilha.append(nome)
+        elif pilha and pilha[-1] == nome:
+            pilha.pop()
+            if not pilha:
+                return pilha, tag.end()
+    return pilha, None
+
+
+def _corrigir_estrutura(dados: bytes, reparos: List[str]) -> Optional[bytes]:
+    """Remove o que vem após o fim da raiz ou fecha um arquivo truncado após o fim do documento."""
+    abertas, fim_raiz = _tags_abertas(dados)
+    if fim_raiz is not None:
+        if dados[fim_raiz:].strip(b' \t\r\n\x00'):
+            reparos.append('conteúdo após o fim do documento removido')
+        return dados[:fim_raiz]
+    if not abertas:
+        return dados
+    fins = list(_RE_FIM_DOCUMENTO.finditer(dados))
+    if not fins:
+        return None  # Truncado antes do fim da NF-e/CT-e: os dados estariam incompletos
+    corte = fins[-1].end()
+    abertas, _ = _tags_abertas(dados[:corte])
+    reparos.append('arquivo truncado fechado após o fim do documento')
+    return dados[:corte] + b''.join(b'</' + nome + b'>' for nome in reversed(abertas))
+
+
+def reparar_xml(dados: bytes) -> Optional[Tuple[bytes, str]]:
+    """
+    (conteúdo reparado, descrição dos reparos) ou None se não há o que reparar. Quem chama
+    lê o conteúdo reparado de novo; se ainda falhar, o erro original é que vale.
+    """
+    reparos: List[str] = []
+    reparado = dados
+    era_utf16 = reparado.startswith(_BOMS_UTF16)
+    if era_utf16:
+        try:
+            reparado = reparado.decode('utf-16').encode('utf-8')
+        except UnicodeDecodeError:
+            return None
+        reparos.append('UTF-16 convertido para UTF-8')
+    inicio = reparado.find(b'<')
+    if inicio < 0:
+        return None
+    if inicio > 0:
+        reparos.append('conteúdo antes do início do XML removido (BOM/espaços)')
+        reparado = reparado[inicio:]
+    if era_utf16:
+        reparado = _declarar_utf8(reparado)
+    else:
+        reparado = _corrigir_codificacao(reparado, reparos)
+    reparado = _corrigir_estrutura(reparado, reparos)
+    if reparado is None or not reparos:
+        return None
+    return reparado, '; '.join(reparos)
@@ -0,0 +1,105 @@
+import io
+import logging
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple
+
+# XMLs dentro de arquivos .zip (inclusive ZIPs dentro de ZIPs), lidos sem extrair para o disco.
+# Cada XML vira um XmlEmZip; o conteúdo é entregue ao parser em fluxo pelo LeitorZip.
+# ZIPs aninhados são abertos em memória (o ZipFile precisa de acesso aleatório ao conteúdo).
+
+PROFUNDIDADE_MAXIMA_ZIP = 5  # ZIP dentro de ZIP dentro de ZIP...; além disso é ignorado
+SEPARADOR_MEMBRO = '!'       # Usado só para exibir/identificar: 'lote.zip!notas/123.xml'
+
+
+class XmlEmZip(NamedTuple):
+    """XML guardado em um ZIP: o .zip no disco e o caminho em cada nível ('interno.zip', 'nota.xml')."""
+    arquivo_zip: Path
+    membros: Tuple[str, ...]
+
+    @property
+    def name(self) -> str:
+        """Nome do XML (mesmo uso de Path.name nas mensagens)."""
+        return PurePosixPath(self.membros[-1]).name
+
+    def __str__(self) -> str:
+        return SEPARADOR_MEMBRO.join((str(self.arquivo_zip),) + self.membros)
+
+
+def _eh_xml(nome: str) -> bool:
+    return nome.lower().endswith('.xml')
+
+
+def _eh_zip(nome: str) -> bool:
+    return nome.lower().endswith('.zip')
+
+
+def _listar_zip(arquivo_zip: zipfile.ZipFile, origem: Path, prefixo: Tuple[str, ...],
+                encontrados: List[XmlEmZip]) -> None:
+    for membro in arquivo_zip.infolist():
+        if membro.is_dir():
+            continue
+        caminho = prefixo + (membro.filename,)
+        if _eh_xml(membro.filename):
+            encontrados.append(XmlEmZip(origem, caminho))
+        elif _eh_zip(membro.filename):
+            if len(caminho) > PROFUNDIDADE_MAXIMA_ZIP:
+                logging.warning(f"ZIP aninhado demais, ignorado: {XmlEmZip(origem, caminho)}")
+                continue
+            try:
+                with zipfile.ZipFile(io.BytesIO(arquivo_zip.read(membro))) as interno:
+                    _listar_zip(interno, origem, caminho, encontrados)
+            except (zipfile.BadZipFile, OSError, RuntimeError) as e:
+                logging.warning(f"ZIP ilegível, ignorado: {XmlEmZip(origem, caminho)} ({e})")
+
+
+def listar_xmls_zip(caminho_zip: Path) -> List[XmlEmZip]:
+    """Todos os XMLs do ZIP, na ordem em que estão guardados, entrando nos ZIPs aninhados."""
+    encontrados: List[XmlEmZip] = []
+    try:
+        with zipfile.ZipFile(caminho_zip) as arquivo_zip:
+            _listar_zip(arquivo_zip, Path(caminho_zip), (), encontrados)
+    except (zipfile.BadZipFile, OSError, RuntimeError) as e:
+        logging.warning(f"ZIP ilegível, ignorado: {Path(caminho_zip).name} ({e})")
+    return encontrados
+
+
+class LeitorZip:
+    """
+    Mantém abertos os ZIPs (e ZIPs aninhados) do XML atual, para que os próximos membros
+    do mesmo arquivo não reabram tudo. Ao passar para outro .zip no disco, fecha os anteriores.
+    """
+
+    def __init__(self):
+        self._abertos: Dict[Tuple[str, ...], zipfile.ZipFile] = {}
+        self._origem: Optional[Path] = None
+
+    def _zip(self, origem: Path, caminho: Tuple[str, ...]) -> zipfile.ZipFile:
+        arquivo_zip = self._abertos.get(caminho)
+        if arquivo_zip is None:
+            if caminho:
+                pai = self._zip(origem, caminho[:-1])
+                arquivo_zip = zipfile.ZipFile(io.BytesIO(pai.read(caminho[-1])))
+            else:
+                arquivo_zip = zipfile.ZipFile(origem)
+            self._abertos[caminho] = arquivo_zip
+        return arquivo_zip
+
+    def abrir(self, xml: XmlEmZip) -> BinaryIO:
+        """Fluxo binário do XML (descompactado enquanto é lido)."""
+        if xml.arquivo_zip != self._origem:
+            self.fechar()
+            self._origem = xml.arquivo_zip
+        return self._zip(xml.arquivo_zip, xml.membros[:-1]).open(xml.membros[-1])
+
+    def fechar(self) -> None:
+        for arquivo_zip in self._abertos.values():
+            arquivo_zip.close()
+        self._abertos.clear()
+        self._origem = None
+
+    def __enter__(self) -> 'LeitorZip':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.fechar()
@@ -6,17 +6,22 @@ import pandas as pd
 import numpy as np
 # import FreeSimpleGUI as sg # REMOVIDO
 from pathlib import Path
-from typing import List, Tuple, Any, Dict, Optional, IO
+from typing import List, Tuple, Any, Dict, NamedTuple, Optional, IO
 
 # --- IMPORTAÇÕES DOS MÓDULOS ---
-from app.fiscal.sped_parser import extrair_dados_sped
-from app.fiscal.xml_parser import processar_pasta_xml
+from app.fiscal.sped_parser import extrair_dados_sped, extrair_dados_sped_incremental
+from app.fiscal.xml_parser import chaves_canceladas_xml, processar_pasta_xml_com_opcoes
 from app.fiscal.rules_parser import ler_regras_acumuladores
 from app.fiscal.report_generator import gerar_relatorio_excel
+from app.fiscal.categorias import para_categorias, preencher_nulos
+from app.fiscal.centavos import centavos_para_reais
 from app.fiscal.core_logic import (
-    get_acumulador,
-    check_cfop_status,
-    calcular_status_geral,
+    get_acumulador_vetorizado,
+    check_cfop_status_vetorizado,
+    calcular_status_geral_vetorizado,
+    check_item_cfop_vetorizado,
+    indexar_cfops,
+    notas_com_cfop,
     _executar_analise_detalhada_interna,
     _calcular_totalizadores_cfop_cst
 )
@@ -87,8 +92,13 @@ def executar_analise_completa(
     caminho_regras_detalhadas: Optional[Path] = None,
     template_apuracao_path: Optional[Path] = None,
     tipo_setor: str = 'Comercio',
-    regras_cliente: Dict[str, Any] = None # <--- REGRAS DO CADASTRO DE CLIENTES
+    regras_cliente: Dict[str, Any] = None, # <--- REGRAS DO CADASTRO DE CLIENTES
+    opcoes_desempenho: Optional[Dict[str, Any]] = None # <--- SEÇÃO "PERFORMANCE" DO config.json
 ) -> None:
+    """
+    Conciliação disparada pela interface (em thread): o resultado volta pelos eventos do window,
+    '-THREAD_DONE-' (caminho do relatório, total de problemas) ou '-THREAD_ERROR-'.
+    """
 
     # Configura Handler de Log Visual se 'window' for nosso Adapter
     if hasattr(window, 'write_event_value'):
@@ -100,7 +110,73 @@ def executar_analise_completa(
             vis_handler.setFormatter(vis_formatter)
             logger.addHandler(vis_handler)
 
+    try:
+        resultado = executar_conciliacao(
+            caminho_sped, pasta_xmls, caminho_regras, cfop_sem_credito_icms, cfop_sem_credito_ipi, tolerancia_valor,
+            caminho_regras_detalhadas=caminho_regras_detalhadas, template_apuracao_path=template_apuracao_path,
+            tipo_setor=tipo_setor, regras_cliente=regras_cliente, opcoes_desempenho=opcoes_desempenho,
+            window=window, username=username
+        )
+    except Exception as e:
+        window.write_event_value('-THREAD_ERROR-', f"Erro Crítico: {e}")
+        return
+    window.write_event_value('-THREAD_DONE-', (resultado.caminho_relatorio, resultado.total_problemas))
+
+
+class ResultadoConciliacao(NamedTuple):
+    """DataFrames das abas do relatório (já em reais) e onde ele foi gravado."""
+    conciliacao: pd.DataFrame
+    itens: pd.DataFrame
+    aliquotas: pd.DataFrame
+    totalizadores_entrada: pd.DataFrame
+    totalizadores_saida: pd.DataFrame
+    cte: pd.DataFrame
+    alteracoes_sped: Optional[pd.DataFrame]  # Só no modo incremental (SPED_INCREMENTAL)
+    base_difal: pd.DataFrame
+    total_problemas: int
+    caminho_relatorio: Optional[Path]         # None quando gerar_relatorio=False
+
+
+def _pasta_saida(caminho_saida: Optional[Path], caminho_sped: Path) -> Path:
+    """Pasta dos arquivos gerados: a informada, a do .xlsx informado ou, sem destino, a do SPED."""
+    if caminho_saida is None:
+        return Path(caminho_sped).parent
+    caminho_saida = Path(caminho_saida)
+    pasta = caminho_saida.parent if caminho_saida.suffix.lower() == '.xlsx' else caminho_saida
+    pasta.mkdir(parents=True, exist_ok=True)
+    return pasta
+
+
+def _caminho_relatorio(caminho_saida: Optional[Path], caminho_sped: Path) -> Path:
+    if caminho_saida is not None and Path(caminho_saida).suffix.lower() == '.xlsx':
+        return Path(caminho_saida)
+    return _pasta_saida(caminho_saida, caminho_sped) / f'Relatorio_Conciliacao_Fiscal_{time.strftime("%Y%m%d_%H%M%S")}.xlsx'
+
+
+def executar_conciliacao(
+    caminho_sped: Path, pasta_xmls: Path, caminho_regras: Path,
+    cfop_sem_credito_icms: List[str], cfop_sem_credito_ipi: List[str], tolerancia_valor: float,
+    caminho_regras_detalhadas: Optional[Path] = None,
+    template_apuracao_path: Optional[Path] = None,
+    tipo_setor: str = 'Comercio',
+    regras_cliente: Dict[str, Any] = None,
+    opcoes_desempenho: Optional[Dict[str, Any]] = None,
+    caminho_saida: Optional[Path] = None,
+    gerar_relatorio: bool = True,
+    window: Any = None,
+    username: str = ''
+) -> ResultadoConciliacao:
+    """
+    Conciliação completa sem interface (também usada pela tela, via executar_analise_completa).
+
+    caminho_saida: arquivo .xlsx do relatório ou pasta onde ele é gravado com data/hora no nome
+    (o CSV de erros dos XMLs vai para a mesma pasta). None: pasta do SPED, como na interface.
+    gerar_relatorio: False só devolve os DataFrames (sem Excel nem CSV de erros).
+    window: opcional, recebe os eventos de progresso ('-SPED_PROGRESS-', '-PROGRESS_UPDATE-').
+    Erros são registrados no log e relançados.
+    """
     global df_itens_global
+    caminho_sped, caminho_regras = Path(caminho_sped), Path(caminho_regras)
     try:
         logging.info(f"Análise iniciada pelo usuário: {username}. Setor selecionado: {tipo_setor}")
 
@@ -108,18 +184,51 @@ def executar_analise_completa(
         regras_cliente = regras_cliente or {}
         ignorar_pis_cofins = regras_cliente.get('nao_calcular_pis_cofins', False)
         exigir_acumulador = regras_cliente.get('exigir_acumulador', False)
+        opcoes_desempenho = opcoes_desempenho or {}
 
         if ignorar_pis_cofins:
             logging.info("REGRA ATIVA: Não calcular PIS/COFINS (Simples Nacional).")
         if exigir_acumulador:
             logging.info("REGRA ATIVA: Exigir Acumulador preenchido.")
 
+        # Valores em centavos (int64): somas e comparações exatas até a conciliação das notas/CT-e;
+        # depois tudo volta para reais (itens, totalizadores, relatório e templates seguem em float)
+        centavos = bool(opcoes_desempenho.get('VALORES_EM_CENTAVOS', False))
+        casas_calculo = 0 if centavos else 2
+        if centavos:
+            logging.info("Valores monetários em centavos (aritmética inteira) na conciliação.")
+            tolerancia_valor = round(tolerancia_valor * 100)  # Mesma unidade dos valores
+
         # 2. Extração de dados
         logging.info("Iniciando extração do SPED...")
-        df_sped, df_sped_itens, df_sped_analitico_combinado, df_sped_cte_d190, df_chaves_difal = extrair_dados_sped(caminho_sped)
+        pasta_cache = opcoes_desempenho.get('PASTA_CACHE') if opcoes_desempenho.get('SPED_CACHE', False) else None
+        df_alteracoes_sped = None
+        if pasta_cache and opcoes_desempenho.get('SPED_INCREMENTAL', False) and not opcoes_desempenho.get('ATUALIZAR_CACHE', False):
+            # Retificadora: só os documentos que mudaram desde a última análise do mesmo CNPJ/período são relidos
+            dados_sped, df_alteracoes_sped = extrair_dados_sped_incremental(
+                caminho_sped, Path(pasta_cache),
+                tamanho_maximo_cache_mb=opcoes_desempenho.get('SPED_CACHE_MAX_MB', 2048), centavos=centavos,
+                window=window, num_workers=opcoes_desempenho.get('SPED_WORKERS', 1)
+            )
+        else:
+            dados_sped = extrair_dados_sped(
+                caminho_sped, num_workers=opcoes_desempenho.get('SPED_WORKERS', 1),
+                pasta_cache=Path(pasta_cache) if pasta_cache else None,
+                atualizar_cache=opcoes_desempenho.get('ATUALIZAR_CACHE', False),
+                tamanho_maximo_cache_mb=opcoes_desempenho.get('SPED_CACHE_MAX_MB', 2048), centavos=centavos,
+                window=window
+            )
+        df_sped, df_sped_itens, df_sped_analitico_combinado, df_sped_cte_d190, df_chaves_difal = dados_sped
 
         logging.info("Iniciando extração dos XMLs (NF-e e CT-e)...")
-        df_xml_totais, df_xml_itens, df_xml_cte_totais = processar_pasta_xml(pasta_xmls, window)
+        df_xml_totais, df_xml_itens, df_xml_cte_totais, df_xml_eventos = processar_pasta_xml_com_opcoes(
+            pasta_xmls, window, opcoes_desempenho, centavos=centavos,
+            relatorio_erros=_pasta_saida(caminho_saida, caminho_sped) / f'Erros_XML_{time.strftime("%Y%m%d_%H%M%S")}.csv'
+            if gerar_relatorio else None
+        )
+        chaves_canceladas = chaves_canceladas_xml(df_xml_eventos)
+        if chaves_canceladas:
+            logging.info(f"{len(chaves_canceladas)} documentos com evento de cancelamento nos XMLs.")
         df_itens_global = df_xml_itens
 
         logging.info("Iniciando leitura das regras...")
@@ -132,15 +241,17 @@ def executar_analise_completa(
         total_problemas = 0
 
         # -------------------------------------------------------------------------
-        # 3. Conciliação TOTAL DA NOTA (C100, C500, D500 vs XML NF-e)
+        # 3. Conciliação TOTAL DA NOTA (C100, C500, C800, D500 vs XML NF-e)
         # -------------------------------------------------------------------------
-        logging.info('Cruzando dados SPED (C100, C500, D500) x XML (NF-e)...')
+        logging.info('Cruzando dados SPED (C100, C500, C800, D500) x XML (NF-e)...')
 
         df_recon = pd.merge(df_xml_totais, df_sped, on='CHV_NFE', how='outer', indicator=True)
 
+        # Nota cancelada (evento nos XMLs) que só aparece de um lado não é falta
+        cond_cancelada = (df_recon['_merge'] != 'both') & df_recon['CHV_NFE'].isin(chaves_canceladas)
         df_recon['SITUACAO_NOTA'] = np.select(
-            [df_recon['_merge'] == 'left_only', df_recon['_merge'] == 'right_only'],
-            ['FALTA NO SPED', 'FALTA XML'],
+            [cond_cancelada, df_recon['_merge'] == 'left_only', df_recon['_merge'] == 'right_only'],
+            ['CANCELADA', 'FALTA NO SPED', 'FALTA XML'],
             default='OK'
         )
         df_recon.drop(columns=['_merge'], inplace=True)
@@ -155,7 +266,9 @@ def executar_analise_completa(
             if col not in df_recon.columns: df_recon[col] = ''
 
         df_recon[numeric_cols] = df_recon[numeric_cols].fillna(0).round(2)
-        df_recon[string_cols] = df_recon[string_cols].fillna('')
+        if centavos:
+            df_recon[numeric_cols] = df_recon[numeric_cols].astype('int64')
+        preencher_nulos(df_recon, string_cols, '')
 
         df_recon['TIPO_NOTA'] = np.where(
             (df_recon['TIPO_NOTA'] == '') & (df_recon['TIPO_NOTA_SPED'] != ''),
@@ -165,7 +278,7 @@ def executar_analise_completa(
         df_recon.loc[(df_recon['SITUACAO_NOTA'] == 'OK') & (df_recon['CNPJ_EMITENTE'] == ''), 'SITUACAO_NOTA'] = 'SEM CNPJ NO XML'
 
         logging.info('Aplicando regras de acumuladores (NF-e, C500, D500)...')
-        df_recon['ACUMULADOR'] = df_recon.apply(get_acumulador, axis=1, regras_map=regras_map)
+        df_recon['ACUMULADOR'] = get_acumulador_vetorizado(df_recon, regras_map)
 
         df_recon['ICMS_TOTAL_XML'] = (df_recon['ICMS_XML'] + df_recon['ICMS_SN_XML']).round(2)
         df_recon['IPI_TOTAL_XML'] = (df_recon['IPI_XML'] + df_recon['IPI_DEVOL_XML']).round(2)
@@ -182,20 +295,21 @@ def executar_analise_completa(
             df_recon['IPI_SPED']
         )
 
-        df_recon['STATUS_CFOP'] = df_recon.apply(check_cfop_status, axis=1)
+        df_recon['STATUS_CFOP'] = check_cfop_status_vetorizado(df_recon)
 
         # Verificação de Impostos
         impostos_a_verificar = ['ICMS', 'ICMS_ST', 'IPI', 'FCP_ST', 'ICMS_MONO']
+        cfops_sem_credito = {'ICMS': cfop_sem_credito_icms, 'IPI': cfop_sem_credito_ipi}
+        # CFOPs do SPED separados uma vez para todas as listas de CFOP sem crédito
+        indice_cfop_sped = indexar_cfops(df_recon['CFOP_SPED']) if 'CFOP_SPED' in df_recon.columns else None
         for imposto in impostos_a_verificar:
             sped_col, status_col = f'{imposto}_SPED', f'STATUS_{imposto}'; xml_col = f'{imposto}_XML'; xml_total_col = f'{imposto}_TOTAL_XML' if imposto in ['ICMS', 'IPI'] else xml_col
             if sped_col not in df_recon.columns: df_recon[sped_col] = 0.0
             if xml_total_col not in df_recon.columns: df_recon[xml_total_col] = df_recon[xml_col] if xml_col in df_recon.columns else 0.0
             cond_cfop_sem_credito = pd.Series(False, index=df_recon.index)
-            cfop_sped_col_exists = 'CFOP_SPED' in df_recon.columns
-            if imposto == 'ICMS' and cfop_sem_credito_icms and cfop_sped_col_exists:
-                cond_cfop_sem_credito = df_recon['CFOP_SPED'].apply(lambda x: isinstance(x, str) and any(cfop in x.split('/') for cfop in cfop_sem_credito_icms))
-            elif imposto == 'IPI' and cfop_sem_credito_ipi and cfop_sped_col_exists:
-                cond_cfop_sem_credito = df_recon['CFOP_SPED'].apply(lambda x: isinstance(x, str) and any(cfop in x.split('/') for cfop in cfop_sem_credito_ipi))
+            if cfops_sem_credito.get(imposto) and indice_cfop_sped is not None:
+                cond_cfop_sem_credito = pd.Series(
+                    notas_com_cfop(indice_cfop_sped, cfops_sem_credito[imposto], len(df_recon)), index=df_recon.index)
             cond_valores_iguais = (df_recon[xml_total_col] - df_recon[sped_col]).abs() <= tolerancia_valor
             df_recon[status_col] = np.where(cond_valores_iguais | cond_cfop_sem_credito, 'OK', 'DIVERGENTE')
 
@@ -211,8 +325,8 @@ def executar_analise_completa(
             df_recon['BC_PIS_COFINS_CALC'] = 0.0
 
         df_recon['BC_PIS_COFINS_CALC'] = df_recon['BC_PIS_COFINS_CALC'].apply(lambda x: max(x, 0))
-        df_recon['PIS_CALC'] = (df_recon['BC_PIS_COFINS_CALC'] * 0.0165).round(2)
-        df_recon['COFINS_CALC'] = (df_recon['BC_PIS_COFINS_CALC'] * 0.0760).round(2)
+        df_recon['PIS_CALC'] = (df_recon['BC_PIS_COFINS_CALC'] * 0.0165).round(casas_calculo)
+        df_recon['COFINS_CALC'] = (df_recon['BC_PIS_COFINS_CALC'] * 0.0760).round(casas_calculo)
 
         df_recon['STATUS_PIS'] = np.where((df_recon['PIS_CALC'] - df_recon['PIS_SPED']).abs() <= tolerancia_valor, 'OK', 'DIVERGENTE')
         df_recon['STATUS_COFINS'] = np.where((df_recon['COFINS_CALC'] - df_recon['COFINS_SPED']).abs() <= tolerancia_valor, 'OK', 'DIVERGENTE')
@@ -228,7 +342,7 @@ def executar_analise_completa(
         status_cols_to_na = [col for col in df_recon.columns if col.startswith('STATUS_')]
         df_recon.loc[df_recon['SITUACAO_NOTA'] != 'OK', status_cols_to_na] = 'N/A'
 
-        df_recon['STATUS_GERAL'] = df_recon.apply(calcular_status_geral, axis=1)
+        df_recon['STATUS_GERAL'] = calcular_status_geral_vetorizado(df_recon)
 
         # --- APLICA REGRA: EXIGIR ACUMULADOR ---
         if exigir_acumulador:
@@ -238,24 +352,19 @@ def executar_analise_completa(
             mask_nota_existe = (df_recon['SITUACAO_NOTA'] == 'OK')
             df_recon.loc[mask_falta_acumulador & mask_nota_existe, 'STATUS_GERAL'] = 'REVISAR'
 
+        # Status, situação e acumulador prontos: 'category' daqui em diante (também nos itens, pelo merge)
+        para_categorias(df_recon)
+
+        if centavos:
+            for df in (df_recon, df_itens_global, df_sped_itens):
+                centavos_para_reais(df)
+
         # -------------------------------------------------------------------------
         # 4. Preparação dos Itens (C170)
         # -------------------------------------------------------------------------
         df_itens_final = df_itens_global.copy() if df_itens_global is not None else pd.DataFrame()
         if not df_itens_final.empty:
 
-            def check_item_cfop(row: pd.Series) -> str:
-                xml_cfop = str(row.get('CFOP', ''))
-                sped_item_cfop = str(row.get('CFOP_SPED_ITEM', ''))
-                if sped_item_cfop == 'N/A no SPED' or not sped_item_cfop: return 'REVISAR (Sem SPED)'
-                if not xml_cfop: return 'REVISAR (Sem XML)'
-                if xml_cfop == sped_item_cfop: return 'OK'
-                expected_sped_cfop = xml_cfop
-                if xml_cfop.startswith('5'): expected_sped_cfop = '1' + xml_cfop[1:]
-                elif xml_cfop.startswith('6'): expected_sped_cfop = '2' + xml_cfop[1:]
-                elif xml_cfop.startswith('7'): expected_sped_cfop = '3' + xml_cfop[1:]
-                return 'OK' if sped_item_cfop == expected_sped_cfop else 'DIVERGENTE'
-
             if not df_sped_itens.empty:
                 logging.info("Cruzando itens XML x SPED (C170) usando N_ITEM...")
                 try:
@@ -276,9 +385,9 @@ def executar_analise_completa(
                 for col in sped_c170_cols:
                     if col not in df_itens_final.columns: df_itens_final[col] = np.nan
 
-                df_itens_final['CFOP_SPED_ITEM'] = df_itens_final['CFOP_SPED_ITEM'].fillna('N/A no SPED')
+                preencher_nulos(df_itens_final, ['CFOP_SPED_ITEM'], 'N/A no SPED')
                 cols_to_fill_zero = [col for col in sped_c170_cols[1:]]
-                df_itens_final[cols_to_fill_zero] = df_itens_final[cols_to_fill_zero].fillna(0.0)
+                preencher_nulos(df_itens_final, cols_to_fill_zero, 0.0)
 
             else:
                 logging.warning("Itens SPED (C170) não encontrados. CFOP do item ficará 'N/A'.")
@@ -286,7 +395,7 @@ def executar_analise_completa(
                 df_itens_final['VLR_IPI_SPED_ITEM'] = 0.0
 
             logging.info("Calculando status do CFOP a nível de item (NF-e)...")
-            df_itens_final['STATUS_CFOP_ITEM'] = df_itens_final.apply(check_item_cfop, axis=1)
+            df_itens_final['STATUS_CFOP_ITEM'] = check_item_cfop_vetorizado(df_itens_final)
 
             if caminho_regras_detalhadas and not df_itens_final.empty:
                 logging.info("Iniciando análise detalhada opcional (PROCV NF-e)...")
@@ -340,7 +449,7 @@ def executar_analise_completa(
                         if pd.api.types.is_numeric_dtype(df_itens_final[col]):
                             df_itens_final[col] = df_itens_final[col].fillna(0)
                         else:
-                            df_itens_final[col] = df_itens_final[col].fillna('')
+                            preencher_nulos(df_itens_final, [col], '')
 
                 logging.info("Calculando impostos proporcionais a nível de item (NF-e)...")
                 df_itens_final['VLR_PROD'] = pd.to_numeric(df_itens_final['VLR_PROD'], errors='coerce').fillna(0)
@@ -409,9 +518,10 @@ def executar_analise_completa(
         if not df_recon.empty:
             df_recon_relatorio = df_recon[[col for col in colunas_relatorio if col in df_recon.columns]]
             if 'STATUS_GERAL' in df_recon.columns:
-                total_problemas = df_recon['STATUS_GERAL'].apply(lambda x: isinstance(x, str) and x != 'OK' and x != 'N/A').sum()
+                total_problemas = df_recon['STATUS_GERAL'].apply(lambda x: isinstance(x, str) and x not in ('OK', 'N/A', 'CANCELADA')).sum()
 
         if not df_itens_final.empty:
+            para_categorias(df_itens_final)  # STATUS_CFOP_ITEM e demais status calculados nos itens
             colunas_itens_xml = [
                 'STATUS_GERAL', 'SITUACAO_NOTA', 'TIPO_NOTA', 'CHV_NFE', 'NUM_NF', 'CNPJ_EMITENTE', 'ACUMULADOR', 'N_ITEM',
                 'TIPO_DESTINATARIO',
@@ -458,7 +568,7 @@ def executar_analise_completa(
 
         # 5. Totalizadores e Base DIFAL
         logging.info("Calculando totalizadores combinados (NF-e, CT-e, Energia, Com)...")
-        df_totalizadores_cst = _calcular_totalizadores_cfop_cst(df_sped_analitico_combinado)
+        df_totalizadores_cst = _calcular_totalizadores_cfop_cst(df_sped_analitico_combinado, centavos=centavos)
 
         if not df_totalizadores_cst.empty:
             cfop_str = df_totalizadores_cst['CFOP (SPED)'].astype(str)
@@ -473,8 +583,10 @@ def executar_analise_completa(
             logging.info("Calculando Base de Cálculo para abatimento de DIFAL (C101)...")
             df_analitico_difal = pd.merge(df_sped_analitico_combinado, df_chaves_difal, on='CHV_NFE', how='inner')
             if not df_analitico_difal.empty:
-                df_base_difal_por_cfop = df_analitico_difal.groupby('CFOP_SPED_ITEM')['VL_BC_ICMS_SPED_ITEM'].sum().reset_index()
+                df_base_difal_por_cfop = df_analitico_difal.groupby('CFOP_SPED_ITEM', observed=True)['VL_BC_ICMS_SPED_ITEM'].sum().reset_index()
                 df_base_difal_por_cfop.rename(columns={'CFOP_SPED_ITEM': 'CFOP', 'VL_BC_ICMS_SPED_ITEM': 'VALOR_BASE_DIFAL'}, inplace=True)
+                if centavos:
+                    centavos_para_reais(df_base_difal_por_cfop, ['VALOR_BASE_DIFAL'])
 
         # -------------------------------------------------------------------------
         # 6. Conciliação CT-e (Atualizado com Novas Colunas)
@@ -586,8 +698,7 @@ def executar_analise_completa(
                 if col in df_report_cte.columns: df_report_cte[col] = df_report_cte[col].fillna(0.0)
 
             cols_texto_cte = ['CHV_CTE_XML', 'CFOP_XML', 'CST_XML', 'CNPJ_TRANSPORTADOR', 'IE_TRANSPORTADOR', 'UF_EMITENTE_CTE', 'REMETENTE_NOME', 'DESTINATARIO_NOME', 'TOMADOR_CNPJ', 'TOMADOR_NOME', 'MUN_ORIGEM', 'MUN_DESTINO', 'ITEM_PREDOMINANTE']
-            for col in cols_texto_cte:
-                if col in df_report_cte.columns: df_report_cte[col] = df_report_cte[col].fillna('')
+            preencher_nulos(df_report_cte, cols_texto_cte, '')
 
             if 'CHV_CTE_y' in df_report_cte.columns: df_report_cte.rename(columns={'CHV_CTE_y': 'CHV_CTE_XML'}, inplace=True)
 
@@ -598,21 +709,27 @@ def executar_analise_completa(
             df_report_cte['SITUACAO_CTE'] = 'FALTA XML'
             df_report_cte.rename(columns={'NUM_CTE_SPED': 'CHV_CTE'}, inplace=True)
 
+        if centavos:
+            centavos_para_reais(df_report_cte)
+
         df_sped_cte_d190_final = df_report_cte
 
         # 7. Geração do Arquivo Excel
-        caminho_saida = caminho_sped.parent / f'Relatorio_Conciliacao_Fiscal_{time.strftime("%Y%m%d_%H%M%S")}.xlsx'
-        logging.info(f"Gerando relatório em Excel: {caminho_saida}")
-
-        gerar_relatorio_excel(
-            caminho_saida,
-            df_recon_relatorio,
-            df_itens_aba,
-            df_aliquota_aba,
-            df_totalizadores_entrada,
-            df_totalizadores_saida,
-            df_sped_cte_d190_final
-        )
+        caminho_relatorio = None
+        if gerar_relatorio:
+            caminho_relatorio = _caminho_relatorio(caminho_saida, caminho_sped)
+            logging.info(f"Gerando relatório em Excel: {caminho_relatorio}")
+
+            gerar_relatorio_excel(
+                caminho_relatorio,
+                df_recon_relatorio,
+                df_itens_aba,
+                df_aliquota_aba,
+                df_totalizadores_entrada,
+                df_totalizadores_saida,
+                df_sped_cte_d190_final,
+                df_alteracoes_sped
+            )
 
         # 8. Preenchimento do Template de Apuração
         if template_apuracao_path:
@@ -659,9 +776,13 @@ def executar_analise_completa(
                 logging.error(f"Falha ao preencher o template de apuração: {e}", exc_info=True)
                 # sg.popup_error(f"O relatório principal foi gerado, mas falhou ao preencher o template de apuração:\n\n{e}", title="Erro no Template")
 
-        logging.info("Relatório Excel gerado com sucesso.")
-        window.write_event_value('-THREAD_DONE-', (caminho_saida, total_problemas))
+        if caminho_relatorio:
+            logging.info("Relatório Excel gerado com sucesso.")
+        return ResultadoConciliacao(
+            df_recon_relatorio, df_itens_aba, df_aliquota_aba, df_totalizadores_entrada, df_totalizadores_saida,
+            df_sped_cte_d190_final, df_alteracoes_sped, df_base_difal_por_cfop, int(total_problemas), caminho_relatorio
+        )
 
-    except Exception as e:
+    except Exception:
         logging.exception("Ocorreu uma falha crítica na análise.")
-        window.write_event_value('-THREAD_ERROR-', f"Erro Crítico: {e}")
+        raise
@@ -1,6 +1,9 @@
 import logging
 from pathlib import Path
-from typing import Callable, Optional, Tuple, Set
+from typing import Callable, Iterator, Optional, Tuple, Set
+
+from app.fiscal.sped_index import obter_indice_sped, iterar_linhas_registros
+from app.fiscal.sped_compactado import abrir_sped_texto, sped_compactado
 
 logger = logging.getLogger(__name__)
 
@@ -35,62 +38,63 @@ class KeysExtractorLogic:
             if not input_p.exists():
                 raise FileNotFoundError(f"Arquivo não encontrado: {input_path}")
 
-            # 1. Contagem de linhas para a barra de progresso
-            if progress_callback:
-                try:
-                    with open(input_p, 'r', encoding='latin-1', errors='ignore') as f:
-                        total_lines = sum(1 for _ in f)
-                except Exception:
-                    total_lines = 0
-
-            logger.info(f"Iniciando varredura organizada em: {input_p}")
-
-            # 2. Leitura do arquivo
-            with open(input_p, 'r', encoding='latin-1', errors='ignore') as infile:
-                for line in infile:
-                    lines_read += 1
-                    
-                    # Atualiza progresso a cada 5000 linhas
-                    if progress_callback and total_lines > 0 and lines_read % 5000 == 0:
-                        percent = int((lines_read / total_lines) * 100)
-                        progress_callback(percent)
-
-                    line = line.strip()
-                    if not line.startswith('|') or not line.endswith('|'):
-                        continue
-                    
-                    parts = line.split('|')
-                    if len(parts) < 3: continue
-                    
-                    reg = parts[1]
-                    
-                    # Captura CNPJ Declarante (apenas informativo se precisar depois)
-                    if reg == '0000' and len(parts) > 7:
-                        cnpj_declarante = parts[7]
-
-                    # --- TRATAMENTO ESPECÍFICO POR TIPO DE NOTA ---
-                    
-                    # C100: Nota Fiscal (NFe) -> Vai para nfe_keys
-                    elif reg == 'C100':
-                        if len(parts) > 9:
-                            ind_oper = parts[2]
-                            chave = parts[9]
-                            
-                            if ind_oper == '0': # 0 = Entrada
-                                chave_limpa = ''.join(filter(str.isdigit, chave))
-                                if len(chave_limpa) == 44:
-                                    nfe_keys.add(chave_limpa)
-
-                    # D100: Conhecimento de Transporte (CTe) -> Vai para cte_keys
-                    elif reg == 'D100':
-                        if len(parts) > 10:
-                            ind_oper = parts[2]
-                            chave = parts[10] # D100 é coluna 10
-                            
-                            if ind_oper == '0': # 0 = Entrada (Tomador)
-                                chave_limpa = ''.join(filter(str.isdigit, chave))
-                                if len(chave_limpa) == 44:
-                                    cte_keys.add(chave_limpa)
+            # 1. Índice do SPED: só as linhas 0000, C100 e D100 são lidas
+            # (SPED compactado não tem índice: é lido inteiro, descompactando em fluxo)
+            registros_lidos = ('0000', 'C100', 'D100')
+            if sped_compactado(input_p):
+                linhas = self._linhas_compactado(input_p, registros_lidos)
+                logger.info(f"Iniciando varredura organizada em: {input_p} (compactado)")
+            else:
+                indice = obter_indice_sped(input_p)
+                total_lines = sum(len(indice['registros'].get(reg, [])) for reg in registros_lidos)
+                linhas = iterar_linhas_registros(input_p, indice, registros_lidos, encoding='latin-1', errors='ignore')
+                logger.info(f"Iniciando varredura organizada em: {input_p} ({total_lines} registros indexados)")
+
+            # 2. Leitura dos registros
+            for line in linhas:
+                lines_read += 1
+
+                # Atualiza progresso a cada 5000 linhas
+                if progress_callback and total_lines > 0 and lines_read % 5000 == 0:
+                    percent = int((lines_read / total_lines) * 100)
+                    progress_callback(percent)
+
+                line = line.strip()
+                if not line.startswith('|') or not line.endswith('|'):
+                    continue
+
+                parts = line.split('|')
+                if len(parts) < 3: continue
+
+                reg = parts[1]
+
+                # Captura CNPJ Declarante (apenas informativo se precisar depois)
+                if reg == '0000' and len(parts) > 7:
+                    cnpj_declarante = parts[7]
+
+                # --- TRATAMENTO ESPECÍFICO POR TIPO DE NOTA ---
+
+                # C100: Nota Fiscal (NFe) -> Vai para nfe_keys
+                elif reg == 'C100':
+                    if len(parts) > 9:
+                        ind_oper = parts[2]
+                        chave = parts[9]
+
+                        if ind_oper == '0': # 0 = Entrada
+                            chave_limpa = ''.join(filter(str.isdigit, chave))
+                            if len(chave_limpa) == 44:
+                                nfe_keys.add(chave_limpa)
+
+                # D100: Conhecimento de Transporte (CTe) -> Vai para cte_keys
+                elif reg == 'D100':
+                    if len(parts) > 10:
+                        ind_oper = parts[2]
+                        chave = parts[10] # D100 é coluna 10
+
+                        if ind_oper == '0': # 0 = Entrada (Tomador)
+                            chave_limpa = ''.join(filter(str.isdigit, chave))
+                            if len(chave_limpa) == 44:
+                                cte_keys.add(chave_limpa)
 
             # 3. Salva o resultado de forma sequencial e organizada
             with open(output_p, 'w', encoding='utf-8') as outfile:
@@ -130,4 +134,13 @@ class KeysExtractorLogic:
 
         except Exception as e:
             logger.error(f"Erro fatal: {e}", exc_info=True)
-            return False, f"Erro: {str(e)}"
\ No newline at end of file
+            return False, f"Erro: {str(e)}"
+
+    @staticmethod
+    def _linhas_compactado(input_p: Path, registros: Tuple[str, ...]) -> Iterator[str]:
+        """Linhas dos registros pedidos, lendo o .zip/.gz do início ao fim."""
+        prefixos = tuple(f"|{reg}|" for reg in registros)
+        with abrir_sped_texto(input_p, encoding='latin-1', errors='ignore') as f:
+            for line in f:
+                if line.lstrip().startswith(prefixos):
+                    yield line
\ No newline at end of file
@@ -5,6 +5,9 @@ from datetime import date, datetime
 from collections import Counter
 import sys # Import sys if not already present at the top
 
+from app.fiscal.sped_index import obter_indice_sped
+from app.fiscal.sped_compactado import abrir_sped_texto, sped_compactado
+
 logger = logging.getLogger(__name__)
 if not logger.hasHandlers(): # Evita adicionar múltiplos handlers se o módulo for recarregado
     handler = logging.StreamHandler()
@@ -119,18 +122,17 @@ class SpedFilterLogic:
                 raise FileNotFoundError(f"Arquivo de entrada não encontrado: {input_p}")
 
             total_lines = 0
-            # 1. Contar linhas (para a barra de progresso)
-            if progress_callback:
-                logger.info("Contando linhas para barra de progresso...")
+            # 1. Total de linhas (para a barra de progresso) vem do índice do SPED
+            # (SPED compactado não tem índice: lido em fluxo, sem percentual)
+            if progress_callback and not sped_compactado(input_p):
                 try:
-                    with input_p.open('r', encoding=encoding, errors='ignore') as f_count:
-                        total_lines = sum(1 for _ in f_count)
-                    logger.info(f"Total de linhas estimado: {total_lines}")
+                    total_lines = obter_indice_sped(input_p)['total_linhas']
+                    logger.info(f"Total de linhas (índice): {total_lines}")
                 except Exception as e:
-                    logger.warning(f"Não foi possível contar as linhas: {e}. A barra de progresso pode não ser precisa.")
-                    total_lines = 0 # Define como 0 se a contagem falhar
+                    logger.warning(f"Não foi possível indexar o arquivo: {e}. A barra de progresso pode não ser precisa.")
+                    total_lines = 0 # Define como 0 se a indexação falhar
 
-            with input_p.open('r', encoding=encoding, errors='ignore') as infile, \
+            with abrir_sped_texto(input_p, encoding, errors='ignore') as infile, \
                  output_p.open('w', encoding=encoding) as outfile:
 
                 current_block = None         # Bloco atual (0, C, D, E...)
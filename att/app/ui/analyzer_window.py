@@ -21,6 +21,9 @@ from app.ui.qt_adapter import WorkerSignals, WindowAdapter
 
 # Imports de lógica (compatibilidade)
 from app.fiscal_logic import setup_logging, executar_analise_completa
+from app.fiscal.sped_cache import limpar_cache_sped
+from app.fiscal.xml_cache import limpar_cache_xml
+from app.fiscal.xml_quarentena import limpar_quarentena_xml
 # from app.ui.admin_window import AdminWindow # REMOVIDO: Janela não portada ainda
 
 class AnalyzerWindow(QWidget):
@@ -39,6 +42,7 @@ class AnalyzerWindow(QWidget):
         # Sinais para thread worker
         self.worker_signals = WorkerSignals()
         self.worker_signals.progress_update.connect(self.on_progress_update)
+        self.worker_signals.sped_progress.connect(self.on_sped_progress)
         self.worker_signals.log_update.connect(self.on_log_update)
         self.worker_signals.thread_done.connect(self.on_thread_done)
         self.worker_signals.thread_error.connect(self.on_thread_error)
@@ -79,7 +83,7 @@ class AnalyzerWindow(QWidget):
         self.txt_sped.setReadOnly(True)
         config_layout.addWidget(self.txt_sped, 0, 1)
         btn_sped = QPushButton("📁 Procurar SPED")
-        btn_sped.clicked.connect(lambda: self.browse_file(self.txt_sped, "Arquivo SPED (*.txt)"))
+        btn_sped.clicked.connect(lambda: self.browse_file(self.txt_sped, "Arquivo SPED (*.txt *.zip *.gz)"))
         config_layout.addWidget(btn_sped, 0, 2)
 
         # XML Folder
@@ -136,6 +140,16 @@ class AnalyzerWindow(QWidget):
         self.btn_apuracao.clicked.connect(lambda: self.browse_file(self.txt_apuracao, "Excel (*.xlsx)"))
         config_layout.addWidget(self.btn_apuracao, 5, 2)
 
+        # Cache do SPED e dos XMLs (força nova leitura dos arquivos)
+        self.chk_reprocessar = QCheckBox("Reprocessar SPED e XMLs (ignorar cache)")
+        self.chk_reprocessar.setToolTip("Lê o SPED e os XMLs novamente, mesmo que já estejam no cache.")
+        config_layout.addWidget(self.chk_reprocessar, 6, 0, 1, 2)
+
+        self.btn_limpar_cache = QPushButton("🗑️ Limpar Cache")
+        self.btn_limpar_cache.setToolTip("Apaga o cache do SPED e dos XMLs guardado neste computador.")
+        self.btn_limpar_cache.clicked.connect(self.limpar_cache)
+        config_layout.addWidget(self.btn_limpar_cache, 6, 2)
+
         config_group.setLayout(config_layout)
         main_layout.addWidget(config_group)
 
@@ -213,6 +227,24 @@ class AnalyzerWindow(QWidget):
         self.btn_apuracao.setEnabled(checked)
         if not checked: self.txt_apuracao.clear()
 
+    def limpar_cache(self):
+        pasta_cache = Path(self.config.desempenho['PASTA_CACHE'])
+        resposta = QMessageBox.question(
+            self, "Limpar Cache", f"Apagar o cache do SPED e dos XMLs em:\n{pasta_cache}?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        if resposta != QMessageBox.Yes: return
+        try:
+            entradas_sped = limpar_cache_sped(pasta_cache)
+            arquivos_xml = limpar_cache_xml(pasta_cache)
+            em_quarentena = limpar_quarentena_xml(pasta_cache)
+        except Exception as e:
+            QMessageBox.warning(self, "Limpar Cache", str(e))
+            return
+        QMessageBox.information(self, "Limpar Cache",
+                                f"Cache limpo: {entradas_sped} SPED(s) e {arquivos_xml} XML(s) removidos, "
+                                f"{em_quarentena} XML(s) liberados da quarentena.")
+
     def check_start_enabled(self):
         if 'run_analysis' not in self.permissions: return
 
@@ -250,6 +282,9 @@ class AnalyzerWindow(QWidget):
 
         tipo_setor = self.cmb_setor.currentText()
 
+        opcoes_desempenho = dict(self.config.desempenho)
+        opcoes_desempenho['ATUALIZAR_CACHE'] = self.chk_reprocessar.isChecked()
+
         # Adapter para a lógica
         adapter = WindowAdapter(self.worker_signals)
 
@@ -259,15 +294,15 @@ class AnalyzerWindow(QWidget):
             self.config.cfop_sem_credito_icms, self.config.cfop_sem_credito_ipi,
             self.config.tolerancia_valor,
             regras_det_path, apuracao_path, tipo_setor
-        ))
+        ), kwargs={'opcoes_desempenho': opcoes_desempenho})
         t.daemon = True
         t.start()
 
-    def run_logic_thread(self, *args):
+    def run_logic_thread(self, *args, **kwargs):
         # Wrapper para chamar a função lógica
         # args: sped_path, xml_path, regras_path, window(adapter), username, ...
         try:
-            executar_analise_completa(*args)
+            executar_analise_completa(*args, **kwargs)
         except Exception as e:
             self.worker_signals.thread_error.emit(str(e))
 
@@ -281,6 +316,19 @@ class AnalyzerWindow(QWidget):
             percent = int((current / total) * 100)
             self.lbl_status.setText(f"Status: Processando XMLs... ({percent}%)")
 
+    @Slot(tuple)
+    def on_sped_progress(self, data):
+        lidos, total, linhas_s, mb_s = data
+        vazao = f"{mb_s:.1f} MB/s, {linhas_s:,.0f} linhas/s".replace(',', '.')
+        if total > 0:
+            # Escala em milésimos: o QProgressBar usa int de 32 bits e o SPED pode passar de 2 GB
+            self.progress_bar.setMaximum(1000)
+            self.progress_bar.setValue(min(1000, int(lidos * 1000 / total)))
+            self.lbl_status.setText(f"Status: Lendo SPED... ({int(lidos * 100 / total)}% - {vazao})")
+        else:
+            self.progress_bar.setMaximum(0)  # Total desconhecido (SPED compactado): barra indeterminada
+            self.lbl_status.setText(f"Status: Lendo SPED... ({lidos / (1024 * 1024):.0f} MB - {vazao})")
+
     @Slot(str)
     def on_log_update(self, msg):
         self.txt_log.append(msg)
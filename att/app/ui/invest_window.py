@@ -198,7 +198,9 @@ class InvestWindow:
         try:
             caminho_sete = planilha_sete if planilha_sete else None
             # Passa arquivo_ncm para a função lógica
-            caminho_arquivo = executar_apuracao_invest(pasta_xml, self.window, caminho_sete, arquivo_ncm)
+            # Mesmas opções de leitura da conciliação: o cache dos XMLs é compartilhado entre as duas
+            caminho_arquivo = executar_apuracao_invest(pasta_xml, self.window, caminho_sete, arquivo_ncm,
+                                                       getattr(self.config, 'desempenho', None))
             self.window.write_event_value("-DONE-", caminho_arquivo)
         except Exception as e:
             logging.exception("Erro na thread do InvestWindow")
@@ -37,7 +37,7 @@ class KeysExtractorWindow:
             sg.Input(key='-IN_FILE-', readonly=True, font=self.font_std, size=(50, 1),
                      background_color=self.INPUT_BG, text_color=self.TEXT_COLOR),
             sg.FileBrowse("Procurar", font=self.font_std, target='-IN_FILE-',
-                          file_types=(("Arquivos de Texto", "*.txt"),))
+                          file_types=(("Arquivos SPED", "*.txt *.zip *.gz"),))
         ]
 
         progress_frame = [
@@ -9,6 +9,9 @@ class WorkerSignals(QObject):
     # Para atualizar barras de progresso: (current, total)
     progress_update = Signal(tuple)
 
+    # Progresso da leitura do SPED: (bytes_lidos, bytes_total, linhas_por_s, mb_por_s)
+    sped_progress = Signal(tuple)
+
     # Para atualizar logs de texto: (mensagem)
     log_update = Signal(str)
 
@@ -41,6 +44,9 @@ class WindowAdapter:
             # value deve ser uma tupla (current, total)
             self.signals.progress_update.emit(value)
 
+        elif key == '-SPED_PROGRESS-':
+            self.signals.sped_progress.emit(value)
+
         elif key == '-THREAD_DONE-':
             self.signals.thread_done.emit(value)
 
@@ -6,6 +6,7 @@ import json
 import traceback
 import shutil 
 import logging
+import multiprocessing
 from typing import Optional 
 
 
@@ -128,6 +129,8 @@ except ImportError as e:
 
 
 if __name__ == "__main__":
+    # Necessário no executável (PyInstaller/Windows) para os processos do modo paralelo
+    multiprocessing.freeze_support()
     try:
         logging.info("Aplicação 'MeuAppFiscal' iniciada.")
         
@@ -0,0 +1,47 @@
+"""
+Conciliação completa (executar_conciliacao) com SPED, XMLs e regras montados no tmp_path.
+
+Uso (na pasta att/):
+    python -m pytest -q tests
+"""
+from pathlib import Path
+
+import pandas as pd
+
+from app.fiscal_logic import executar_conciliacao
+from test_xml_parser import CHAVE_CFE, gravar, xml_cfe
+
+CHAVE_CFE_SEM_XML = CHAVE_CFE[:-1] + '7'
+
+# Varejo com dois CF-e SAT (C800/C850): só o primeiro tem XML na pasta
+SPED_VAREJO = f"""|0000|017|0|01012024|31012024|EMPRESA|11222333000181||SP|123||3550308|||A|1|
+|0001|0|
+|0990|2|
+|C001|0|
+|C800|59|00|1001|01012024|50,00|0,83|3,80||SAT001|{CHAVE_CFE}|0|50,00|0|9,00|0|0|
+|C850|000|5102|18,00|50,00|50,00|9,00||
+|C800|59|00|1002|01012024|20,00|0|0||SAT001|{CHAVE_CFE_SEM_XML}|0|20,00|0|0|0|0|
+|C850|060|5405|0,00|20,00|0|0||
+|C990|6|
+|D001|1|
+|D990|2|
+|9999|13|
+"""
+
+
+def _conciliar(tmp_path: Path):
+    sped = gravar(tmp_path, 'sped.txt', SPED_VAREJO)
+    gravar(tmp_path / 'xml', 'cfe.xml', xml_cfe())
+    regras = tmp_path / 'regras.csv'
+    pd.DataFrame({'CNPJ_CPF': ['11222333000181'], 'CFOP': ['5102'], 'ACUMULADOR': ['1']}).to_csv(regras, index=False)
+    return executar_conciliacao(sped, tmp_path / 'xml', regras, ['1556'], ['1556'], 0.03, gerar_relatorio=False)
+
+
+def test_c800_concilia_com_xml_do_cfe(tmp_path):
+    resultado = _conciliar(tmp_path)
+    notas = resultado.conciliacao.astype({'CHV_NFE': str}).set_index('CHV_NFE')
+
+    assert notas.loc[CHAVE_CFE, 'SITUACAO_NOTA'] == 'OK'
+    assert (notas.loc[CHAVE_CFE, 'STATUS_VALOR'], notas.loc[CHAVE_CFE, 'STATUS_ICMS']) == ('OK', 'OK')
+    # Sem o XML, o cupom continua apontado
+    assert notas.loc[CHAVE_CFE_SEM_XML, 'SITUACAO_NOTA'] == 'FALTA XML'
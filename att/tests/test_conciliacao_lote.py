@@ -0,0 +1,46 @@
+"""
+Conciliação em lote (conciliacao_lote) com as empresas montadas no tmp_path.
+
+Uso (na pasta att/):
+    python -m pytest -q tests
+"""
+from pathlib import Path
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from app.conciliacao_lote import SITUACAO_CONCLUIDA, executar_lote
+from test_conciliacao import SPED_VAREJO
+from test_xml_parser import gravar, xml_cfe
+
+CNPJS = ['11222333000181', '22333444000155', '33444555000122']
+COLUNAS_COMPARADAS = ['CNPJ', 'SITUACAO', 'NOTAS', 'NOTAS_COM_PROBLEMA', 'ITENS', 'ERRO']
+
+
+def _montar_lote(pasta_lote: Path) -> None:
+    # As duas primeiras com o mesmo SPED disputam a mesma entrada do cache; a terceira tem a sua
+    for cnpj in CNPJS:
+        pasta = pasta_lote / cnpj
+        gravar(pasta, 'sped.txt', SPED_VAREJO.replace(f'|EMPRESA|{CNPJS[0]}|', f'|EMPRESA|{CNPJS[2]}|') if cnpj == CNPJS[2] else SPED_VAREJO)
+        gravar(pasta / 'XML', 'cfe.xml', xml_cfe())
+        pd.DataFrame({'CNPJ_CPF': [cnpj], 'CFOP': ['5102'], 'ACUMULADOR': ['1']}).to_csv(pasta / 'regras.csv', index=False)
+
+
+def _config(tmp_path: Path, **desempenho) -> SimpleNamespace:
+    return SimpleNamespace(db_empresas_path=tmp_path / 'sem_cadastro.db', desempenho=desempenho,
+                           cfop_sem_credito_icms=['1556'], cfop_sem_credito_ipi=['1556'], tolerancia_valor=0.03)
+
+
+@pytest.mark.parametrize('incremental', [False, True], ids=['sped_por_conteudo', 'sped_incremental'])
+def test_cache_compartilhado_entre_as_empresas(tmp_path, incremental):
+    _montar_lote(tmp_path / 'lote')
+    sem_cache = executar_lote(tmp_path / 'lote', tmp_path / 'saida_sem_cache', _config(tmp_path), processos=3)
+
+    # Limite mínimo: cada empresa que grava no cache remove as entradas das outras (LRU)
+    config = _config(tmp_path, PASTA_CACHE=str(tmp_path / 'cache'), SPED_CACHE=True, SPED_INCREMENTAL=incremental,
+                     SPED_CACHE_MAX_MB=0.001, XML_CACHE=True)
+    for rodada in range(2):  # A segunda rodada lê o que sobrou no cache
+        com_cache = executar_lote(tmp_path / 'lote', tmp_path / f'saida_{rodada}', config, processos=3)
+        assert (com_cache['SITUACAO'] == SITUACAO_CONCLUIDA).all(), com_cache['ERRO'].tolist()
+        pd.testing.assert_frame_equal(com_cache[COLUNAS_COMPARADAS], sem_cache[COLUNAS_COMPARADAS])
@@ -0,0 +1,161 @@
+"""
+Paridade das versões vetorizadas de core_logic com as funções linha a linha
+(DataFrame.apply(axis=1)), em DataFrames aleatórios com os casos de borda da conciliação.
+
+Uso (na pasta att/):
+    python -m pytest -q tests
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.fiscal.core_logic import (
+    get_acumulador, check_cfop_status, calcular_status_geral, check_item_cfop,
+    get_acumulador_vetorizado, check_cfop_status_vetorizado, calcular_status_geral_vetorizado,
+    check_item_cfop_vetorizado
+)
+
+SEMENTES = range(8)
+LINHAS = 400
+
+CNPJS = ['12.345.678/0001-99', '12345678000199', '98765432000110', '11222333000181',
+         'SEM DIGITOS', '', None, np.nan]
+CFOPS_NOTA = ['5102', '6102', '1102', '2102', '5405', '7101', '3101', '1556', '9999',
+              '5102/6102', '/5102/', '5102/5102', '6102/5102/6102', '1102/2102', '5102/1556',
+              '5405/', '/', '', None, np.nan]
+CFOPS_ITEM = ['5102', '6102', '7101', '1102', '2102', '3101', '1556', '5405', '1405',
+              'N/A no SPED', '', None, np.nan]
+SITUACOES = ['OK', 'FALTA XML', 'FALTA NO SPED', 'CANCELADA', 'SEM CNPJ NO XML']
+STATUS = ['OK', 'DIVERGENTE', 'REVISAR', 'REVISAR (Múltiplos)', 'OK (Múltiplos)', 'N/A', '', None, np.nan]
+
+# Acumuladores por (CNPJ limpo, CFOP): um CNPJ com vários acumuladores (a nota com mais de um
+# CFOP fica REVISAR), regras REVISAR e acumulador vazio (ignorado)
+REGRAS_MAP = {
+    ('12345678000199', '1102'): '101',
+    ('12345678000199', '2102'): '102',
+    ('12345678000199', '5102'): '101',
+    ('12345678000199', '6102'): '101',
+    ('12345678000199', '1556'): 'REVISAR',
+    ('98765432000110', '5102'): '201',
+    ('98765432000110', '6102'): '202',
+    ('98765432000110', '5405'): '',
+    ('11222333000181', '7101'): 'REVISAR',
+    ('11222333000181', '3101'): '301',
+}
+
+
+def _escolher(rng: np.random.Generator, valores: list, total: int) -> list:
+    # rng.choice converteria None/NaN para texto: sorteia as posições
+    return [valores[i] for i in rng.integers(0, len(valores), total)]
+
+
+def _indice_embaralhado(rng: np.random.Generator, total: int) -> pd.Index:
+    # Índice fora de ordem, como depois de merges e filtros: o resultado deve seguir o índice do df
+    return pd.Index(rng.permutation(total) * 3 + 7)
+
+
+def _df_notas(semente: int) -> pd.DataFrame:
+    rng = np.random.default_rng(semente)
+    df = pd.DataFrame({
+        'CHV_NFE': [f'NF{i:04d}' for i in range(LINHAS)],
+        'CNPJ_EMITENTE': _escolher(rng, CNPJS, LINHAS),
+        'CFOP_XML': _escolher(rng, CFOPS_NOTA, LINHAS),
+        'CFOP_SPED': _escolher(rng, CFOPS_NOTA, LINHAS),
+        'SITUACAO_NOTA': _escolher(rng, SITUACOES, LINHAS),
+        'STATUS_CFOP': _escolher(rng, STATUS, LINHAS),
+        'STATUS_ICMS': _escolher(rng, STATUS, LINHAS),
+        'STATUS_VALOR': _escolher(rng, ['OK', 'DIVERGENTE', 'N/A'], LINHAS),
+    })
+    df.index = _indice_embaralhado(rng, LINHAS)
+    return df
+
+
+def _df_itens(semente: int) -> pd.DataFrame:
+    rng = np.random.default_rng(semente)
+    df = pd.DataFrame({
+        'CHV_NFE': [f'NF{i:04d}' for i in range(LINHAS)],
+        'CFOP': _escolher(rng, CFOPS_ITEM, LINHAS),
+        'CFOP_SPED_ITEM': _escolher(rng, CFOPS_ITEM, LINHAS),
+    })
+    df.index = _indice_embaralhado(rng, LINHAS)
+    return df
+
+
+def _como_categoria(df: pd.DataFrame, colunas: list) -> pd.DataFrame:
+    # As colunas de CFOP, situação e status chegam como category no fluxo principal
+    df = df.copy()
+    for col in colunas:
+        df[col] = df[col].astype('category')
+    return df
+
+
+@pytest.mark.parametrize('semente', SEMENTES)
+def test_get_acumulador(semente):
+    df = _df_notas(semente)
+    esperado = df.apply(get_acumulador, axis=1, regras_map=REGRAS_MAP)
+    pd.testing.assert_series_equal(get_acumulador_vetorizado(df, REGRAS_MAP), esperado)
+
+
+@pytest.mark.parametrize('semente', SEMENTES)
+def test_check_cfop_status(semente):
+    df = _df_notas(semente)
+    esperado = df.apply(check_cfop_status, axis=1)
+    pd.testing.assert_series_equal(check_cfop_status_vetorizado(df), esperado)
+
+
+@pytest.mark.parametrize('semente', SEMENTES)
+def test_calcular_status_geral(semente):
+    df = _df_notas(semente)
+    esperado = df.apply(calcular_status_geral, axis=1)
+    pd.testing.assert_series_equal(calcular_status_geral_vetorizado(df), esperado)
+
+
+@pytest.mark.parametrize('semente', SEMENTES)
+def test_check_item_cfop(semente):
+    df = _df_itens(semente)
+    esperado = df.apply(check_item_cfop, axis=1)
+    pd.testing.assert_series_equal(check_item_cfop_vetorizado(df), esperado)
+
+
+@pytest.mark.parametrize('semente', SEMENTES)
+def test_colunas_category(semente):
+    # category guarda None como NaN: a referência é o apply no mesmo DataFrame
+    notas = _como_categoria(_df_notas(semente), ['CFOP_XML', 'CFOP_SPED', 'SITUACAO_NOTA', 'STATUS_CFOP', 'STATUS_ICMS'])
+    pd.testing.assert_series_equal(get_acumulador_vetorizado(notas, REGRAS_MAP),
+                                   notas.apply(get_acumulador, axis=1, regras_map=REGRAS_MAP))
+    pd.testing.assert_series_equal(check_cfop_status_vetorizado(notas), notas.apply(check_cfop_status, axis=1))
+    pd.testing.assert_series_equal(calcular_status_geral_vetorizado(notas), notas.apply(calcular_status_geral, axis=1))
+
+    itens = _como_categoria(_df_itens(semente), ['CFOP', 'CFOP_SPED_ITEM'])
+    pd.testing.assert_series_equal(check_item_cfop_vetorizado(itens), itens.apply(check_item_cfop, axis=1))
+
+
+def test_casos_de_borda():
+    # Um caso de cada, fixo: não depende do sorteio cobrir a combinação
+    notas = pd.DataFrame({
+        'CHV_NFE': ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H'],
+        'CNPJ_EMITENTE': [None, np.nan, '', '12.345.678/0001-99', '12345678000199', '98765432000110',
+                          '11222333000181', '12345678000199'],
+        'CFOP_XML': ['5102', '5102', '5102', '5102/6102', '/5102/', '5102/5102', '7101', ''],
+        'CFOP_SPED': ['', None, np.nan, '1102/2102', '1102', '', '3101', '1556'],
+        'SITUACAO_NOTA': ['OK', 'CANCELADA', 'SEM CNPJ NO XML', 'OK', 'FALTA XML', 'OK', 'OK', 'FALTA NO SPED'],
+        'STATUS_CFOP': ['OK', 'DIVERGENTE', 'OK', 'REVISAR (Múltiplos)', 'OK', None, 'REVISAR', 'OK'],
+    })
+    pd.testing.assert_series_equal(get_acumulador_vetorizado(notas, REGRAS_MAP),
+                                   notas.apply(get_acumulador, axis=1, regras_map=REGRAS_MAP))
+    pd.testing.assert_series_equal(check_cfop_status_vetorizado(notas), notas.apply(check_cfop_status, axis=1))
+    pd.testing.assert_series_equal(calcular_status_geral_vetorizado(notas), notas.apply(calcular_status_geral, axis=1))
+
+    itens = pd.DataFrame({
+        'CFOP': ['5102', '6102', '7101', '', None, '5102', '1556', '5102'],
+        'CFOP_SPED_ITEM': ['1102', '2102', '3101', '1102', '1102', 'N/A no SPED', '1556', np.nan],
+    })
+    pd.testing.assert_series_equal(check_item_cfop_vetorizado(itens), itens.apply(check_item_cfop, axis=1))
+
+
+def test_dataframe_vazio():
+    notas = _df_notas(0).iloc[:0]
+    assert get_acumulador_vetorizado(notas, REGRAS_MAP).empty
+    assert check_cfop_status_vetorizado(notas).empty
+    assert calcular_status_geral_vetorizado(notas).empty
+    assert check_item_cfop_vetorizado(_df_itens(0).iloc[:0]).empty
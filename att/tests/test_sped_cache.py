@@ -0,0 +1,51 @@
+"""
+Cache do SPED (sped_cache) compartilhado entre processos: entradas removidas por outro
+processo no meio da leitura ou da varredura do limite LRU não derrubam a análise.
+
+Uso (na pasta att/):
+    python -m pytest -q tests
+"""
+import shutil
+
+import pandas as pd
+import pytest
+
+import app.fiscal.sped_cache as sped_cache
+from app.fiscal.sped_cache import carregar_tabelas_cache, salvar_tabelas_cache
+
+TABELAS = {'sped': pd.DataFrame({'CHV_NFE': ['A', 'B'], 'VL_DOC_SPED': [1.0, 2.0]})}
+
+
+def test_carregar_com_entrada_removida_depois_da_leitura(tmp_path, monkeypatch):
+    salvar_tabelas_cache(tmp_path, 'entrada', TABELAS)
+
+    def utime_de_entrada_removida(caminho, *args, **kwargs):
+        shutil.rmtree(caminho)
+        raise FileNotFoundError(caminho)
+    monkeypatch.setattr(sped_cache.os, 'utime', utime_de_entrada_removida)
+
+    tabelas = carregar_tabelas_cache(tmp_path, 'entrada', ['sped'])
+    pd.testing.assert_frame_equal(tabelas['sped'], TABELAS['sped'])
+
+
+def test_tamanho_de_pasta_removida(tmp_path):
+    assert sped_cache._tamanho_pasta(tmp_path / 'removida') == 0
+
+
+@pytest.mark.parametrize('removida', ['a', 'b', 'c'])
+def test_limite_lru_com_entradas_removidas_na_varredura(tmp_path, monkeypatch, removida):
+    for chave in ('a', 'b', 'c'):
+        salvar_tabelas_cache(tmp_path, chave, TABELAS)
+
+    # Outro processo apaga uma entrada enquanto esta conta os bytes dela
+    tamanho_pasta = sped_cache._tamanho_pasta
+
+    def tamanho_com_remocao(pasta):
+        if pasta.name == removida:
+            shutil.rmtree(pasta)
+        return tamanho_pasta(pasta)
+    monkeypatch.setattr(sped_cache, '_tamanho_pasta', tamanho_com_remocao)
+
+    sped_cache._aplicar_limite_lru(tmp_path, 0, preservar='c')
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ([] if removida == 'c' else ['c'])
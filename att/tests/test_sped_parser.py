@@ -0,0 +1,160 @@
+"""
+Leitura do SPED (sped_parser) em arquivos montados no tmp_path: modo colunar x antigo,
+paralelo x serial e incremental x leitura completa.
+
+Uso (na pasta att/):
+    python -m pytest -q tests
+"""
+from pathlib import Path
+from typing import Dict, List
+
+import pandas as pd
+import pytest
+
+import app.fiscal.sped_parser as sped_parser
+from app.fiscal.sped_parser import extrair_dados_sped, extrair_dados_sped_incremental
+
+
+def chave(numero: int, modelo: str = '55') -> str:
+    return f'352401112223330001815{modelo[:2]}001{numero:09d}1{numero:08d}'[:44]
+
+
+def registro(reg: str, tamanho: int, campos: Dict[int, str]) -> str:
+    """Linha '|REG|...|' com `tamanho` posições no split('|') (como o parser confere)."""
+    valores = [''] * tamanho
+    valores[1] = reg
+    for posicao, valor in campos.items():
+        valores[posicao] = valor
+    return '|'.join(valores[:-1]) + '|\n'
+
+
+def nfe(numero: int, valor: str, cfops=('1102',), difal: bool = False, ipi: bool = True) -> List[str]:
+    """C100 com C101 opcional, um C170 e um C190 por CFOP."""
+    linhas = [registro('C100', 29, {9: chave(numero), 12: valor, 22: '18,00', 23: '0', 25: '1,50',
+                                    26: '1,65', 27: '7,60'})]
+    if difal:
+        linhas.append(registro('C101', 6, {2: '1,00', 3: '2,00', 4: '3,00'}))
+    for n, cfop in enumerate(cfops, start=1):
+        linhas.append(registro('C170', 39 if ipi else 20, {2: str(n), 3: f'P{n}', 7: valor, 10: '000', 11: cfop,
+                                                           13: valor, 15: '18,00', 16: '0', 18: '0',
+                                                           **({24: '1,50'} if ipi else {})}))
+    for cfop in cfops:
+        linhas.append(registro('C190', 14, {2: '000', 3: cfop, 4: '18,00', 5: valor, 6: valor, 7: '18,00',
+                                            8: '0', 9: '0', 11: '0'}))
+    return linhas
+
+
+def energia(numero: int, com_chave: bool = True) -> List[str]:
+    return [registro('C500', 29, {6: '1', 8: '1253', 9: str(numero), 10: chave(numero, '66') if com_chave else '',
+                                  12: '230,00', 18: '41,40', 22: '3,80', 23: '17,48'}),
+            registro('C590', 13, {2: '000', 3: '1253', 4: '18,00', 5: '230,00', 6: '230,00', 7: '41,40',
+                                  8: '0', 9: '0'})]
+
+
+def cte(numero: int) -> List[str]:
+    return [registro('D100', 33, {9: chave(numero, '57')}),
+            registro('D190', 12, {2: '000', 3: '1353', 4: '12,00', 5: '80,00', 6: '80,00', 7: '9,60',
+                                  8: '0', 9: ''})]
+
+
+def comunicacao(numero: int) -> List[str]:
+    return [registro('D500', 25, {6: '1', 8: '1303', 9: str(numero), 11: '99,90', 17: '25,00',
+                                  19: '0,65', 21: '3,00'}),
+            registro('D590', 13, {2: '000', 3: '1303', 4: '25,00', 5: '99,90', 6: '99,90', 7: '25,00',
+                                  8: '0', 9: '0'})]
+
+
+def cfe(numero: int, valor: str) -> List[str]:
+    """CF-e SAT (C800) com um C850."""
+    return [registro('C800', 19, {2: '59', 3: '00', 4: str(numero), 5: '01012024', 6: valor, 7: '0,83', 8: '3,80',
+                                  10: 'SAT001', 11: chave(numero, '59'), 12: '0', 13: valor, 14: '0', 15: '9,00',
+                                  16: '0', 17: '0'}),
+            registro('C850', 10, {2: '000', 3: '5102', 4: '18,00', 5: valor, 6: valor, 7: '9,00'})]
+
+
+def montar_sped(bloco_c: List[str], bloco_d: List[str]) -> str:
+    linhas = ['|0000|017|0|01012024|31012024|EMPRESA|11222333000181||SP|123||3550308|||A|1|\n',
+              '|0001|0|\n', '|0990|2|\n',
+              '|C001|0|\n', *bloco_c, f'|C990|{len(bloco_c) + 2}|\n',
+              '|D001|0|\n', *bloco_d, f'|D990|{len(bloco_d) + 2}|\n',
+              '|E001|1|\n', '|E990|2|\n']
+    return ''.join(linhas) + f'|9999|{len(linhas) + 1}|\n'
+
+
+def gravar_sped(pasta: Path, conteudo: str, nome: str = 'sped.txt') -> Path:
+    arquivo = pasta / nome
+    arquivo.write_text(conteudo, encoding='latin-1')
+    return arquivo
+
+
+def assert_sped_igual(obtido, esperado, **opcoes) -> None:
+    """Compara os 5 DataFrames; as chaves com DIFAL vêm de um set (sem ordem)."""
+    for n, (a, b) in enumerate(zip(obtido, esperado)):
+        if n == 4:
+            a, b = a.sort_values('CHV_NFE'), b.sort_values('CHV_NFE')
+        pd.testing.assert_frame_equal(a.reset_index(drop=True), b.reset_index(drop=True), **opcoes)
+
+
+# Um documento de cada registro pai lido pelos dois modos, com os casos de borda do parser
+SPED_NAO_VAREJO = montar_sped(
+    nfe(1, '100,00', cfops=('1102', '2102'), difal=True)
+    + nfe(2, '50,00', ipi=False)
+    + nfe(1, '999,00', cfops=('5102',))          # Chave repetida: vale a primeira
+    + nfe(3, '0', cfops=('1556',), difal=True)
+    + energia(4) + energia(5, com_chave=False),  # Sem chave: Energia_<série>_<número>
+    cte(6) + cte(7) + comunicacao(8)
+)
+# C500 antes da primeira NF-e: CFOP_SPED vem antes de TIPO_NOTA_SPED no modo antigo
+SPED_ENERGIA_PRIMEIRO = montar_sped(energia(4) + nfe(1, '100,00'), comunicacao(8))
+
+
+@pytest.mark.parametrize('usar_indice', [True, False])
+@pytest.mark.parametrize('conteudo', [SPED_NAO_VAREJO, SPED_ENERGIA_PRIMEIRO], ids=['nfe_primeiro', 'energia_primeiro'])
+def test_modo_colunar_igual_ao_antigo(tmp_path, conteudo, usar_indice):
+    sped = gravar_sped(tmp_path, conteudo)
+    colunar = extrair_dados_sped(sped, modo_colunar=True, usar_indice=usar_indice)
+    antigo = extrair_dados_sped(sped, modo_colunar=False, usar_indice=usar_indice)
+
+    assert all(not df.empty for df in colunar[:3])
+    assert_sped_igual(colunar, antigo)
+
+
+def test_paralelo_igual_ao_serial(tmp_path, monkeypatch, caplog):
+    # A chave 1 reaparece no fim do arquivo (outro pedaço): fica a primeira, como no serial
+    bloco_c = [linha for n in range(1, 41) for linha in nfe(n, f'{n},00', cfops=('1102', '2102'), difal=n % 3 == 0)]
+    bloco_c += nfe(1, '999,00', cfops=('5102',), difal=True) + energia(41)
+    sped = gravar_sped(tmp_path, montar_sped(bloco_c, cte(42) + comunicacao(43)))
+    monkeypatch.setattr(sped_parser, 'TAMANHO_MINIMO_PARALELO', 0)
+
+    serial = extrair_dados_sped(sped, num_workers=1)
+    with caplog.at_level('INFO'):
+        paralelo = extrair_dados_sped(sped, num_workers=4)
+
+    assert 'em paralelo' in caplog.text
+    assert paralelo[0].set_index('CHV_NFE').loc[chave(1), 'VL_DOC_SPED'] == 1.0
+    assert_sped_igual(paralelo, serial)
+
+
+def test_incremental_igual_a_leitura_completa(tmp_path):
+    # Retificadora: NF-e 1 alterada, 2 excluída, 6 incluída e o CF-e 10 alterado
+    def nfes(numeros):
+        return [linha for n in numeros for linha in nfe(n, f'{n}0,00', difal=n == 4)]
+
+    versao_a = montar_sped(nfes([1, 2, 3, 4, 5]) + cfe(10, '50,00') + cfe(11, '20,00'), cte(20))
+    versao_b = montar_sped(nfe(1, '11,00') + nfes([3, 4, 5, 6]) + cfe(10, '55,00') + cfe(11, '20,00'), cte(20))
+    cache = tmp_path / 'cache'
+
+    _, alteracoes_a = extrair_dados_sped_incremental(gravar_sped(tmp_path, versao_a, 'a.txt'), cache)
+    sped_b = gravar_sped(tmp_path, versao_b, 'b.txt')
+    incremental, alteracoes = extrair_dados_sped_incremental(sped_b, cache)
+
+    assert alteracoes_a.empty  # Primeira versão do CNPJ/período: não há com o que comparar
+    # O incremental pode trazer float64 onde a leitura completa tem int64 (linhas vindas da base)
+    assert_sped_igual(incremental, extrair_dados_sped(sped_b), check_dtype=False)
+    assert set(alteracoes.itertuples(index=False, name=None)) == {
+        (chave(1), 'C100', 'ALTERADA'),
+        (chave(2), 'C100', 'EXCLUÍDA'),
+        (chave(6), 'C100', 'INCLUÍDA'),
+        (chave(10, '59'), 'C800', 'ALTERADA'),
+    }
+    assert len(alteracoes) == 4
@@ -0,0 +1,113 @@
+"""
+Leitura dos XMLs (xml_parser/xml_descoberta) em pastas montadas no tmp_path.
+
+Uso (na pasta att/):
+    python -m pytest -q tests
+"""
+import multiprocessing
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import app.fiscal.xml_parser as xml_parser
+from app.fiscal.xml_descoberta import DOC_CFE, chave_no_cabecalho, identificar_documento
+from app.fiscal.xml_parser import processar_pasta_xml
+
+CHAVE_CFE = '35240111222333000181590000100100000100123456'
+
+
+def xml_cfe(chave: str = CHAVE_CFE, v_cfe: str = '50.00', cfop: str = '5102') -> str:
+    """CF-e SAT (modelo 59) com um item tributado a 18% e PIS/COFINS por alíquota."""
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<CFe><infCFe Id="CFe{chave}" versao="0.08" versaoDadosEnt="0.08">
+<ide><cUF>35</cUF><mod>59</mod><nserieSAT>000010010</nserieSAT><nCFe>001001</nCFe><dEmi>20240101</dEmi></ide>
+<emit><CNPJ>11222333000181</CNPJ><enderEmit><CEP>01001000</CEP></enderEmit></emit>
+<dest><CPF>12345678909</CPF></dest>
+<det nItem="1"><prod><cProd>A1</cProd><xProd>ITEM A</xProd><NCM>22030000</NCM><CFOP>{cfop}</CFOP><uCom>UN</uCom>
+<qCom>2.0000</qCom><vUnCom>25.00</vUnCom><vProd>{v_cfe}</vProd><vItem>{v_cfe}</vItem></prod>
+<imposto><ICMS><ICMS00><Orig>0</Orig><CST>00</CST><pICMS>18.00</pICMS><vICMS>9.00</vICMS></ICMS00></ICMS>
+<PIS><PISAliq><CST>01</CST><vBC>{v_cfe}</vBC><pPIS>0.0165</pPIS><vPIS>0.83</vPIS></PISAliq></PIS>
+<COFINS><COFINSAliq><CST>01</CST><vBC>{v_cfe}</vBC><pCOFINS>0.0760</pCOFINS><vCOFINS>3.80</vCOFINS></COFINSAliq></COFINS>
+</imposto></det>
+<total><ICMSTot><vICMS>9.00</vICMS><vProd>{v_cfe}</vProd><vPIS>0.83</vPIS><vCOFINS>3.80</vCOFINS></ICMSTot><vCFe>{v_cfe}</vCFe></total>
+</infCFe></CFe>
+"""
+
+
+def gravar(pasta: Path, nome: str, conteudo: str) -> Path:
+    pasta.mkdir(parents=True, exist_ok=True)
+    arquivo = pasta / nome
+    arquivo.write_text(conteudo, encoding='utf-8')
+    return arquivo
+
+
+def test_cfe_identificado_pelo_inicio_do_arquivo():
+    inicio = xml_cfe().encode('utf-8')[:4096]
+    assert identificar_documento(inicio) == DOC_CFE
+    assert chave_no_cabecalho(inicio) == CHAVE_CFE
+
+
+def test_cfe_entra_nas_tabelas_da_nfe(tmp_path):
+    gravar(tmp_path, 'cfe.xml', xml_cfe())
+    gravar(tmp_path, 'cfe_repetido.xml', xml_cfe(v_cfe='99.00'))  # Mesma chave: a primeira vence
+
+    totais, itens, cte, eventos = processar_pasta_xml(tmp_path, None)
+
+    assert totais[['CHV_NFE', 'NUM_NF', 'CNPJ_EMITENTE', 'CFOP_XML', 'MODELO_XML']].astype(str).values.tolist() == [
+        [CHAVE_CFE, '001001', '11222333000181', '5102', '59']]
+    assert totais['VL_DOC_XML'].tolist() == [50.0]
+    assert totais['ICMS_XML'].tolist() == [9.0]
+    assert len(itens) == 1
+    item = itens.iloc[0]
+    assert (item['CFOP'], item['VLR_PROD'], item['VLR_ICMS'], item['BC_PIS_COFINS_CALC']) == ('5102', 50.0, 9.0, 41.0)
+    assert (item['DATA_EMISSAO'], item['ALIQ_PIS'], item['ALIQ_COFINS']) == ('2024-01-01', 1.65, 7.6)
+    assert cte.empty and eventos.empty
+
+
+def test_cfe_sem_chave_valida(tmp_path):
+    gravar(tmp_path, 'cfe.xml', xml_cfe(chave='123'))
+    totais, itens, _, _ = processar_pasta_xml(tmp_path, None)
+    assert totais.empty and itens.empty
+
+
+def _ler_com_log(pasta: Path, caplog, num_workers: int):
+    caplog.clear()
+    with caplog.at_level('INFO'):
+        tabelas = processar_pasta_xml(pasta, None, num_workers=num_workers)
+    # Contadores do resumo no log (arquivos, documentos por tipo, repetidos, erros)
+    return tabelas, [r.getMessage() for r in caplog.records if 'em paralelo' not in r.getMessage()]
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                    reason='o conjunto de chaves do processo filho é herdado do principal via fork')
+def test_paralelo_igual_ao_serial(tmp_path, monkeypatch, caplog):
+    # Lotes de 2 arquivos: a chave repetida cai nos lotes 1, 3 e 5; a primeira ocorrência é malformada
+    gravar(tmp_path, '01_repetida_malformada.xml', xml_cfe(v_cfe='10.00').replace('</infCFe></CFe>', ''))
+    for n in range(2, 10):
+        if n != 6:
+            gravar(tmp_path, f'{n:02d}.xml', xml_cfe(chave=CHAVE_CFE[:-2] + f'{n:02d}', v_cfe=f'{n}.00'))
+    gravar(tmp_path, '06_repetida.xml', xml_cfe(v_cfe='60.00'))
+    gravar(tmp_path, '10_repetida.xml', xml_cfe(v_cfe='99.00'))
+    monkeypatch.setattr(xml_parser, 'MINIMO_ARQUIVOS_PARALELO', 0)
+    monkeypatch.setattr(xml_parser, 'TAMANHO_LOTE', 2)
+
+    serial, log_serial = _ler_com_log(tmp_path, caplog, num_workers=1)
+
+    # Filhos que já "viram" a chave devolvem 'duplicada' em todas as ocorrências: o principal
+    # relê as que ainda não valem para ele (a malformada e a 06)
+    monkeypatch.setattr(xml_parser, '_chaves_vistas_processo', {CHAVE_CFE})
+    relidos = []
+    extrair = xml_parser._extrair_arquivo_xml
+
+    def extrair_no_principal(arquivo, *args, **kwargs):
+        relidos.append(Path(arquivo).name)
+        return extrair(arquivo, *args, **kwargs)
+    monkeypatch.setattr(xml_parser, '_extrair_arquivo_xml', extrair_no_principal)
+    paralelo, log_paralelo = _ler_com_log(tmp_path, caplog, num_workers=4)
+
+    assert relidos == ['01_repetida_malformada.xml', '06_repetida.xml']
+    assert serial[0].set_index('CHV_NFE').loc[CHAVE_CFE, 'VL_DOC_XML'] == 60.0
+    for a, b in zip(paralelo, serial):
+        pd.testing.assert_frame_equal(a, b)
+    assert log_paralelo == log_serial